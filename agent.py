@@ -1,18 +1,29 @@
 import os
 import sys
-import google.generativeai as genai
+import json
 from dotenv import load_dotenv
 
 # Handle both relative and absolute imports
 try:
-    from .vector_store import VectorStore
+    from .lazy_imports import lazy_import
+    from .vector_store import VectorStore, source_name
+    from .sharded_store import ShardedVectorStore, SHARDED_INDEX
     from .hybrid_processor import OCRProcessor
+    from .extraction_cache import file_hash
 except ImportError:
-    from vector_store import VectorStore
+    from lazy_imports import lazy_import
+    from vector_store import VectorStore, source_name
+    from sharded_store import ShardedVectorStore, SHARDED_INDEX
     from hybrid_processor import OCRProcessor
+    from extraction_cache import file_hash
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+# Gemini is imported (and configured) the first time the model is used
+genai = lazy_import(
+    "google.generativeai",
+    on_load=lambda module: module.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+)
 
 # ============================================================
 #                  PATH CONFIGURATION
@@ -26,6 +37,10 @@ INDEX_DIR = os.path.join(SCRIPT_DIR, "index")
 # Prompts separated into Text files
 PROMPTS_DIR = os.path.join(SCRIPT_DIR, "prompts")
 
+# Content hash of every indexed book, so incremental builds notice a book
+# replaced under the same name
+SOURCE_HASHES_FILE = "source_hashes.json"
+
 
 # ============================================================
 #                   PROMPT LOADER UTILITY
@@ -40,15 +55,47 @@ def load_prompt(filename):
         print(f"⚠️  Warning: Prompt file not found: {prompt_path}")
         return None
 
+# ============================================================
+#                   SOURCE HASH UTILITIES
+# ============================================================
+def load_source_hashes(index_dir):
+    """{book file name: content hash} recorded at the last build"""
+    path = os.path.join(index_dir, SOURCE_HASHES_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def book_hashes(books_folder):
+    """{file name: content hash} of every file in a books folder"""
+    return {name: file_hash(os.path.join(books_folder, name))
+            for name in os.listdir(books_folder)
+            if not name.startswith('.') and os.path.isfile(os.path.join(books_folder, name))}
+
+
+def save_source_hashes(index_dir, hashes):
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, SOURCE_HASHES_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(hashes, f, indent=2)
+    os.replace(path + ".tmp", path)
+
 # ============================================================
 #                     TUTOR AGENT
 # ============================================================
 
 class Tutor:
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.ocr_processor = OCRProcessor()
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+    def __init__(self, vector_store=None):
+        # Streamlit sessions pass in the process-wide store (see resources.py)
+        if vector_store is None:
+            vector_store = ShardedVectorStore() if SHARDED_INDEX else VectorStore()
+        self.vector_store = vector_store
+        
+        # Created on first use: the processors only matter when a build starts
+        self._ocr_processor = None
+        self._model = None
 
         # Load prompt templates
         self.system_prompt_template = load_prompt("system_prompt.txt")
@@ -57,28 +104,68 @@ class Tutor:
         self.explain_prompt_template = load_prompt("explain_prompt.txt")
 
         # Load existing index
-        if not self.vector_store.load_index():
+        if self.vector_store.index is None and not self.vector_store.load_index():
             print("\n⚠️  No index found. You need to process your books first!")
             print("Run: python agent.py --build\n")
 
+    @property
+    def ocr_processor(self):
+        """Book processor, created when the first build starts"""
+        if self._ocr_processor is None:
+            self._ocr_processor = OCRProcessor()
+        return self._ocr_processor
+
+    @property
+    def model(self):
+        """Gemini model, created on the first request"""
+        if self._model is None:
+            self._model = genai.GenerativeModel("gemini-2.5-flash")
+        return self._model
+
     # ------------------------------------------------------------
     #                   BUILD KNOWLEDGE BASE
     # ------------------------------------------------------------
-    def build_knowledge_base(self, books_folder=None):
-        """Process PDFs or images and build searchable index"""
+    def build_knowledge_base(self, books_folder=None, incremental=False):
+        """Process PDFs or images and build searchable index.
+        With incremental=True only books that are new, or whose content
+        changed since they were indexed, are embedded."""
         # Use configured BOOKS_DIR if no folder specified
         if books_folder is None:
             books_folder = BOOKS_DIR
             
         print(f"\n📚 Building Knowledge Base from: {books_folder}")
 
-        extracted_texts = self.ocr_processor.process_book_folder(books_folder)
-
-        if not extracted_texts:
-            print("❌ No texts extracted! Check your books folder.")
+        # Stream pages straight into the index when the processor can
+        iter_pages = getattr(self.ocr_processor, 'iter_pages', None)
+        if iter_pages is not None:
+            pages = iter_pages(books_folder)
+        else:
+            pages = self.ocr_processor.process_book_folder(books_folder)
+
+        index_dir = self.vector_store.index_dir
+        hashes = book_hashes(books_folder)
+        known = load_source_hashes(index_dir)
+        if incremental and self.vector_store.index is not None:
+            # Books indexed before hashes were recorded are taken as they are
+            indexed = self.vector_store.indexed_sources()
+            unchanged = {name for name in indexed & hashes.keys()
+                         if known.get(name, hashes[name]) == hashes[name]}
+            new_pages = (t for t in pages if source_name(t['filename']) not in unchanged)
+            added = self.vector_store.add_documents(new_pages)
+            nothing_added = "✅ All books are already indexed!"
+        else:
+            known = {}
+            added = self.vector_store.build_index(pages)
+            nothing_added = "❌ No texts extracted! Check your books folder."
+        
+        # Books dropped from the index (e.g. failed extractions) lose theirs
+        indexed = self.vector_store.indexed_sources()
+        hashes = {**known, **hashes}
+        save_source_hashes(index_dir, {name: hashes[name] for name in sorted(indexed)
+                                       if name in hashes})
+        if not added:
+            print(nothing_added)
             return
-
-        self.vector_store.build_index(extracted_texts)
         print("\n✅ Knowledge base ready!")
 
     # ------------------------------------------------------------
@@ -134,7 +221,7 @@ class Tutor:
     # ------------------------------------------------------------
     def answer_question(self, question):
         """Answer using Retrieval-Augmented Generation"""
-        results = self.vector_store.search(question, top_k=3)
+        results = self.vector_store.search(question, top_k=3, mode='hybrid')
 
         context = "\n\n---\n\n".join([
             f"[Page {r['metadata']['page_number']}]: {r['chunk']}" for r in results
@@ -163,7 +250,7 @@ class Tutor:
     # ------------------------------------------------------------
     def generate_quiz(self, topic, num_questions=5):
         """Generate practice quiz on a topic"""
-        results = self.vector_store.search(topic, top_k=5)
+        results = self.vector_store.search(topic, top_k=5, mode='hybrid')
         context = "\n\n".join([r["chunk"] for r in results])
 
         # Use external prompt template
@@ -185,7 +272,7 @@ class Tutor:
     # ------------------------------------------------------------
     def summarize_topic(self, topic):
         """Generate topic summary from textbook"""
-        results = self.vector_store.search(topic, top_k=5)
+        results = self.vector_store.search(topic, top_k=5, mode='hybrid')
         context = "\n\n".join([r["chunk"] for r in results])
 
         # Use external prompt template
@@ -206,7 +293,7 @@ class Tutor:
     # ------------------------------------------------------------
     def explain_concept(self, concept):
         """Explain concept in simple terms"""
-        results = self.vector_store.search(concept, top_k=3)
+        results = self.vector_store.search(concept, top_k=3, mode='hybrid')
         context = "\n\n".join([r["chunk"] for r in results])
 
         # Use external prompt template
@@ -3,6 +3,7 @@ import streamlit as st
 from datetime import datetime
 import json
 from agent import Tutor
+from resources import get_vector_store
 from quick_actbtns import render_sticky_buttons, process_quick_action
 from record_manager import render_record_manager 
 
@@ -237,8 +238,11 @@ st.markdown("""
 # ============================================================
 #                   SESSION STATE INIT
 # ============================================================
+# Sessions share one embedder + index; only chat state is per session.
+# get_vector_store() also hot-reloads the index if it was rebuilt elsewhere.
+shared_store = get_vector_store()
 if 'tutor' not in st.session_state:
-    st.session_state.tutor = Tutor()
+    st.session_state.tutor = Tutor(vector_store=shared_store)
 
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
@@ -333,7 +337,7 @@ with st.sidebar:
                     st.info("📖 Extracting text from books...")
 
                     # Build knowledge base
-                    st.session_state.tutor.build_knowledge_base(UPLOAD_DIR)
+                    st.session_state.tutor.build_knowledge_base(UPLOAD_DIR, incremental=True)
                     st.success("✅ Books processed successfully!")
                     
                     # Show sample of extracted text for verification
@@ -0,0 +1,213 @@
+"""
+Large PDF Memory Check for 3Ts Tutor
+Extracts synthetic textbooks of growing page counts in large-document mode
+(page windows, per-page cache release) and checks that peak memory stays
+flat as the page count grows. Every run is a fresh interpreter, so each
+peak RSS is its own. Exits with status 1 if memory grows with the book.
+
+Usage:
+    python benchmarks/bench_large_pdf.py
+    python benchmarks/bench_large_pdf.py --sizes 250,1500,3000 --methods pdfplumber
+    python benchmarks/bench_large_pdf.py --compare-unbounded --json large_pdf.json
+
+--compare-unbounded also runs every book without large-document mode, to
+show what the windows save. Needs PyMuPDF (to write the PDFs) and the
+extraction engines being measured.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import textwrap
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = "250,750,1500"
+DEFAULT_METHODS = "pdfplumber,pymupdf"
+WORDS_PER_PAGE = 350
+DEFAULT_TOLERANCE_MB = 40    # allowed peak growth from the smallest to the largest book
+
+WORDS = ("force mass acceleration velocity energy momentum friction gravity "
+         "wave frequency amplitude current voltage resistance circuit charge "
+         "atom molecule electron proton reaction bond acid base cell membrane "
+         "protein enzyme gene photosynthesis respiration ecosystem the of and "
+         "a to in is that for it as with was on be by this are from").split()
+
+
+def make_pdf(path, num_pages, seed=0):
+    """Write a text-only textbook of num_pages pages with PyMuPDF"""
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(num_pages):
+        body = textwrap.fill(" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_PAGE)), 95)
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 560, 800),
+                            f"Chapter {i // 25 + 1}\n\n{body}\n\nPage {i + 1}", fontsize=9)
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process. On Linux, ru_maxrss keeps the peak the parent
+    had when it forked us; VmHWM starts again at exec."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+# ============================================================
+#                  ONE RUN
+# ============================================================
+
+def run_one(config):
+    """Extract one PDF (alone in its folder) through iter_pages, the way a
+    build reads it, keeping no records; report memory and time"""
+    sys.path.insert(0, REPO_DIR)
+    import pdf_processor
+    from pdf_processor import PDFProcessor, current_rss_mb
+
+    # Bounded: every book is windowed; unbounded: none is
+    large_doc_pages = 1 if config['bounded'] else 10**9
+    processor = PDFProcessor(workers=0, method=config['method'], cache=False, ocr_scanned=False,
+                             large_doc_pages=large_doc_pages, max_rss_mb=config['max_rss_mb'])
+    pdf_processor._page_count(config['pdf'], config['method'])   # load the parser before the baseline
+    baseline = current_rss_mb()
+
+    pages, chars = 0, 0
+    start = time.perf_counter()
+    quiet = lambda message: None
+    for record in processor.iter_pages(os.path.dirname(config['pdf']), progress=quiet):
+        pages += 1
+        chars += len(record['text'])
+    seconds = time.perf_counter() - start
+
+    peak = _peak_rss_mb()
+    return {
+        'pages': pages,
+        'chars': chars,
+        'seconds': round(seconds, 2),
+        'ms_per_page': round(1000 * seconds / max(pages, 1), 2),
+        'baseline_rss_mb': round(baseline, 1) if baseline is not None else None,
+        'peak_rss_mb': round(peak, 1),
+        'growth_mb': round(max(peak - baseline, 0), 1) if baseline is not None else None
+    }
+
+
+def run_in_subprocess(config):
+    """run_one in a fresh interpreter (clean peak RSS); returns its result"""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one",
+                           json.dumps(config)], cwd=REPO_DIR, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("__RESULT__"):
+            return dict(config, **json.loads(line[len("__RESULT__"):]))
+    error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return dict(config, error=error)
+
+
+# ============================================================
+#                  MAIN
+# ============================================================
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that large-PDF extraction memory stays flat")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated page counts")
+    parser.add_argument("--methods", default=DEFAULT_METHODS, help="e.g. pdfplumber,pymupdf,pypdf2")
+    parser.add_argument("--max-rss-mb", type=int, default=0,
+                        help="RSS ceiling passed to the processor (0: none)")
+    parser.add_argument("--tolerance-mb", type=float, default=DEFAULT_TOLERANCE_MB,
+                        help="allowed peak growth from the smallest to the largest book")
+    parser.add_argument("--compare-unbounded", action="store_true",
+                        help="also run without large-document mode")
+    parser.add_argument("--work-dir", help="where to write the PDFs (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated PDFs")
+    parser.add_argument("--json", default="bench_large_pdf.json", help="results file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print("__RESULT__" + json.dumps(run_one(json.loads(args.run_one))))
+        return
+
+    sizes = sorted(_csv(args.sizes, int))
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_large_pdf_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    print(f"\n📄 Writing synthetic books ({', '.join(map(str, sizes))} pages)...")
+    pdfs = {}
+    for size in sizes:
+        # One folder per book: runs read a whole folder, as builds do
+        os.makedirs(os.path.join(work_dir, str(size)), exist_ok=True)
+        pdfs[size] = os.path.join(work_dir, str(size), f"book_{size}.pdf")
+        if not os.path.exists(pdfs[size]):
+            make_pdf(pdfs[size], size)
+
+    modes = [True, False] if args.compare_unbounded else [True]
+    print(f"\n🧠 Large PDF memory check (tolerance {args.tolerance_mb:.0f} MB)")
+    print("-" * 78)
+    print(f"  {'method':<11} {'mode':<10} {'pages':>6} {'s':>7} {'ms/page':>8} "
+          f"{'peak MB':>8} {'growth MB':>10}")
+
+    results, verdicts = [], {}
+    try:
+        for method in _csv(args.methods):
+            for bounded in modes:
+                runs = []
+                for size in sizes:
+                    result = run_in_subprocess({'pdf': pdfs[size], 'size': size, 'method': method,
+                                                'bounded': bounded, 'max_rss_mb': args.max_rss_mb})
+                    results.append(result)
+                    runs.append(result)
+                    label = f"  {method:<11} {'windowed' if bounded else 'unbounded':<10} {size:>6}"
+                    if result.get('error'):
+                        print(f"{label} ❌ {result['error'][:50]}")
+                        continue
+                    growth = result['growth_mb']
+                    print(f"{label} {result['seconds']:7.1f} {result['ms_per_page']:8.2f} "
+                          f"{result['peak_rss_mb']:8.0f} {'-' if growth is None else f'{growth:.0f}':>10}")
+
+                if bounded:
+                    peaks = [run['peak_rss_mb'] for run in runs if not run.get('error')]
+                    flat = len(peaks) == len(runs) and peaks[-1] - peaks[0] <= args.tolerance_mb
+                    verdicts[method] = flat
+                    spread = f"{peaks[-1] - peaks[0]:+.0f} MB" if peaks else "no runs"
+                    print(f"  {'':<11} {'':<10} {'':>6} {'✅ flat' if flat else '❌ grows'} ({spread})")
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.json, 'w') as f:
+        json.dump({
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'tolerance_mb': args.tolerance_mb,
+            'flat': verdicts,
+            'results': results
+        }, f, indent=2)
+    print(f"\n💾 Results written to {args.json}")
+
+    if not all(verdicts.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
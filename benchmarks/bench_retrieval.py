@@ -0,0 +1,378 @@
+"""
+Retrieval Benchmark for 3Ts Tutor
+Builds a VectorStore over a synthetic (or given) corpus at several scales
+and measures build time, index size, memory, search latency (and that of
+the BM25 index on its own), throughput, recall@k against exact search and hit@k (the question's source page was
+retrieved). Every configuration runs in a fresh interpreter, so peak RSS is
+per configuration, and results are written to JSON so runs can be compared.
+
+Synthetic pages are about one chunk each (~120 words drawn from topic
+vocabularies); each question is a shuffled, partly dropped sentence of a
+known page.
+
+Usage:
+    python benchmarks/bench_retrieval.py
+    python benchmarks/bench_retrieval.py --sizes 1000,100000,1000000 --embedder hashing
+    python benchmarks/bench_retrieval.py --index-types flat,ivf,hnsw --storage float32,sq8
+    python benchmarks/bench_retrieval.py --corpus pages.jsonl --questions questions.jsonl
+
+--embedder hashing swaps the sentence-transformer for a fast word-hashing
+embedder, so the large scales measure the index rather than the model.
+A corpus file has one {"filename", "text", "page_number"} page per line;
+a questions file one {"question", "filename"} per line.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = "1000,10000"
+WORDS_PER_PAGE = 120
+PAGES_PER_BOOK = 500
+VOCAB_SIZE = 20_000
+NUM_TOPICS = 50
+TOPIC_WORDS = 400          # words that make a topic recognisable
+WARMUP_QUERIES = 10
+QUERY_BATCH = 64
+
+
+# ============================================================
+#                  SYNTHETIC CORPUS
+# ============================================================
+
+def _vocabulary(seed):
+    """Pronounceable pseudo-words, shared by every page"""
+    rng = np.random.default_rng(seed)
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < VOCAB_SIZE:
+        words.add("".join(rng.choice(syllables, rng.integers(2, 5))))
+    return sorted(words)
+
+
+class SyntheticCorpus:
+    """
+    Deterministic pages: page i is generated from (seed, i) alone, so
+    questions can be drawn without keeping the corpus in memory.
+    """
+
+    def __init__(self, num_pages, seed=0):
+        self.num_pages = num_pages
+        self.seed = seed
+        self.vocab = _vocabulary(seed)
+        rng = np.random.default_rng(seed)
+        self.topics = [rng.choice(VOCAB_SIZE, TOPIC_WORDS, replace=False)
+                       for _ in range(NUM_TOPICS)]
+        zipf = 1.0 / np.arange(1, VOCAB_SIZE + 1)
+        self.background_cdf = np.cumsum(zipf / zipf.sum())
+
+    def page(self, i):
+        rng = np.random.default_rng((self.seed, i))
+        book, page_number = divmod(i, PAGES_PER_BOOK)
+        topic = self.topics[(book * 7 + page_number // 25) % NUM_TOPICS]
+
+        # 12-word sentences: half topic words, half common (Zipf) words
+        num_sentences = WORDS_PER_PAGE // 12
+        on_topic = rng.choice(topic, (num_sentences, 6))
+        common = np.searchsorted(self.background_cdf, rng.random((num_sentences, 6)))
+        ids = rng.permuted(np.hstack([on_topic, np.minimum(common, VOCAB_SIZE - 1)]), axis=1)
+        sentences = [" ".join(self.vocab[j] for j in row).capitalize() + "." for row in ids]
+
+        return {
+            'filename': f"book{book:04d}.pdf_page_{page_number + 1}",
+            'text': " ".join(sentences),
+            'page_number': page_number + 1
+        }
+
+    def __iter__(self):
+        for i in range(self.num_pages):
+            yield self.page(i)
+
+    def questions(self, count, seed=1):
+        """(question, filename of its source page) pairs"""
+        rng = np.random.default_rng(seed)
+        out = []
+        for i in rng.choice(self.num_pages, min(count, self.num_pages), replace=False):
+            page = self.page(int(i))
+            sentence = rng.choice(page['text'].split(". ")).rstrip(".").lower().split()
+            kept = [w for w in sentence if rng.random() > 0.3] or sentence
+            out.append((" ".join(rng.permutation(kept)) + "?", page['filename']))
+        return out
+
+
+def _read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ============================================================
+#                  HASHING EMBEDDER
+# ============================================================
+
+class _WordTokenizer:
+    """Word-piece counts approximated as one token per 4 characters"""
+
+    def __call__(self, words, add_special_tokens=False, **kwargs):
+        if isinstance(words, str):
+            words = [words]
+        return {'input_ids': [[0] * max(1, (len(w) + 3) // 4) for w in words]}
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words: no model, same interface as a SentenceTransformer"""
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+        self.max_seq_length = 256
+        self.tokenizer = _WordTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=64, **kwargs):
+        out = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.strip(".,?!").encode('utf-8'))
+                out[row, h % self.dimension] += 1.0 if h & 1 << 31 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+# ============================================================
+#                  ONE CONFIGURATION
+# ============================================================
+
+def _rss_mb():
+    """Current resident set size (Linux), else None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _folder_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files)
+
+
+def _percentiles(seconds):
+    ms = np.array(seconds) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in (50, 95, 99)}
+
+
+def _exact_neighbours(store, query_embeddings, top_k):
+    """Chunk IDs of the true top_k by exact L2 over the original vectors"""
+    import faiss
+    ids = store.store.column('vector_ids').astype('int64')
+    exact = faiss.IndexFlatL2(store.dimension)
+    for start in range(0, len(ids), 65_536):
+        rows = np.arange(start, min(start + 65_536, len(ids)))
+        if store.store.has_vectors:
+            exact.add(store.store.vectors(rows))
+        elif store.active_storage == 'float32':
+            exact.add(store._reconstruct(ids[rows]))
+        else:
+            return None   # compressed codes only: nothing exact to compare with
+    _, rows = exact.search(query_embeddings, top_k)
+    return [set(ids[r[r >= 0]].tolist()) for r in rows]
+
+
+def run_config(config):
+    """Build, reload and query one configuration; returns its measurements"""
+    sys.path.insert(0, REPO_DIR)
+    from vector_store import VectorStore
+
+    work_dir = tempfile.mkdtemp(prefix="bench_retrieval_", dir=config['work_dir'])
+    embedder = HashingEmbedder() if config['embedder'] == 'hashing' else None
+    top_k = config['top_k']
+    result = dict(config)
+    try:
+        if config['corpus']:
+            pages = _read_jsonl(config['corpus'])[:config['size']]
+            questions = [(q['question'], q['filename'])
+                         for q in _read_jsonl(config['questions'])][:config['queries']]
+        else:
+            corpus = SyntheticCorpus(config['size'], config['seed'])
+            pages = iter(corpus)
+            questions = corpus.questions(config['queries'], config['seed'] + 1)
+
+        store = VectorStore(work_dir, index_type=config['index_type'],
+                            storage=config['storage'], embedder=embedder)
+        store.embedder   # model load isn't build time
+
+        start = time.perf_counter()
+        result['chunks'] = store.build_index(pages)
+        result['build_seconds'] = round(time.perf_counter() - start, 3)
+        result['index_type_used'] = store.active_index_type
+        result['storage_used'] = store.active_storage
+        result['index_bytes'] = os.path.getsize(os.path.join(store._state.path, "faiss.index"))
+        result['snapshot_bytes'] = _folder_bytes(store._state.path)
+        result['rss_after_build_mb'] = _rss_mb()
+
+        # Serve from a fresh memory-mapped load, as the app does
+        del store
+        store = VectorStore(work_dir, index_type=config['index_type'],
+                            storage=config['storage'], embedder=embedder)
+        start = time.perf_counter()
+        store.load_index()
+        result['load_seconds'] = round(time.perf_counter() - start, 3)
+        store.embedder
+
+        texts = [q for q, _ in questions]
+        for text in texts[:WARMUP_QUERIES]:
+            store.search(text + " warmup", top_k=top_k, mode=config['mode'])
+
+        latencies, hits = [], 0
+        for text, filename in questions:
+            start = time.perf_counter()
+            results = store.search(text, top_k=top_k, mode=config['mode'])
+            latencies.append(time.perf_counter() - start)
+            found = {r['metadata']['filename'] for r in results}
+            found |= {ref['filename'] for r in results for ref in r.get('also_in', [])}
+            hits += filename in found
+        result.update(_percentiles(latencies))
+        result['qps_single'] = round(len(latencies) / sum(latencies), 1)
+        result[f'hit_at_{top_k}'] = round(hits / len(questions), 4)
+
+        # BM25 on its own, whatever the mode (hybrid latency hides it)
+        lexical_latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            store.lexical.search(text, top_k)
+            lexical_latencies.append(time.perf_counter() - start)
+        result.update({f"lexical_{name}": value
+                       for name, value in _percentiles(lexical_latencies).items()})
+
+        # Batched throughput and ANN recall (dense retrieval only)
+        store.query_cache.clear()
+        start = time.perf_counter()
+        for i in range(0, len(texts), QUERY_BATCH):
+            store.search_many(texts[i:i + QUERY_BATCH], top_k=top_k)
+        result['qps_batched'] = round(len(texts) / (time.perf_counter() - start), 1)
+
+        query_embeddings = store._encode_queries(texts)
+        exact = _exact_neighbours(store, query_embeddings, top_k)
+        if exact is None:
+            result[f'recall_at_{top_k}'] = None
+        else:
+            found = store._dense_hits(query_embeddings, top_k)
+            recall = [len({i for i, _ in hit} & truth) / len(truth)
+                      for hit, truth in zip(found, exact) if truth]
+            result[f'recall_at_{top_k}'] = round(float(np.mean(recall)), 4)
+
+        result['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+        result['error'] = None
+    finally:
+        if not config['keep']:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def run_in_subprocess(config):
+    """run_config in a fresh interpreter (clean peak RSS); returns its result"""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one",
+                           json.dumps(config)], cwd=REPO_DIR, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("__RESULT__"):
+            return json.loads(line[len("__RESULT__"):])
+    error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return dict(config, error=error)
+
+
+# ============================================================
+#                  MAIN
+# ============================================================
+
+def _csv(value, cast=str):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VectorStore build, search and recall")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated corpus sizes in pages (~1 chunk each)")
+    parser.add_argument("--index-types", default="auto", help="e.g. flat,ivf,hnsw")
+    parser.add_argument("--storage", default="float32", help="e.g. float32,fp16,sq8,pq")
+    parser.add_argument("--mode", default="dense", choices=["dense", "lexical", "hybrid"])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embedder", default="model", choices=["model", "hashing"])
+    parser.add_argument("--corpus", help="JSONL pages to use instead of the synthetic corpus")
+    parser.add_argument("--questions", help="JSONL questions for --corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="where indexes are built (default: tmp)")
+    parser.add_argument("--keep", action="store_true", help="keep the built indexes")
+    parser.add_argument("--json", default="bench_retrieval.json", help="results file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        result = run_config(json.loads(args.run_one))
+        print("__RESULT__" + json.dumps(result))
+        return
+    if args.corpus and not args.questions:
+        parser.error("--corpus needs --questions")
+
+    configs = [
+        {'size': size, 'index_type': index_type, 'storage': storage, 'mode': args.mode,
+         'top_k': args.top_k, 'queries': args.queries, 'embedder': args.embedder,
+         'corpus': args.corpus, 'questions': args.questions, 'seed': args.seed,
+         'work_dir': args.work_dir, 'keep': args.keep}
+        for size in _csv(args.sizes, int)
+        for index_type in _csv(args.index_types)
+        for storage in _csv(args.storage)
+    ]
+
+    k = args.top_k
+    print(f"\n⏱️  Retrieval benchmark ({len(configs)} configurations, top_k={k}, {args.mode})")
+    print("-" * 114)
+    print(f"  {'size':>8} {'index':<10} {'storage':<8} {'build s':>8} {'MB':>8} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'QPS':>7} {'recall':>7} {'hit':>6} {'RSS MB':>7} "
+          f"{'BM25 p50':>8} {'p99':>7}")
+    results = []
+    for config in configs:
+        result = run_in_subprocess(config)
+        results.append(result)
+        label = f"  {config['size']:>8} {config['index_type']:<10} {config['storage']:<8}"
+        if result.get('error'):
+            print(f"{label} ❌ {result['error'][:60]}")
+            continue
+        recall = result[f'recall_at_{k}']
+        print(f"{label} {result['build_seconds']:8.1f} {result['index_bytes'] / 2**20:8.1f} "
+              f"{result['p50_ms']:7.2f} {result['p99_ms']:7.2f} {result['qps_batched']:7.0f} "
+              f"{'-' if recall is None else f'{recall:.3f}':>7} {result[f'hit_at_{k}']:6.3f} "
+              f"{result['peak_rss_mb']:7.0f} {result['lexical_p50_ms']:8.2f} "
+              f"{result['lexical_p99_ms']:7.2f}")
+
+    with open(args.json, 'w') as f:
+        json.dump({
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results
+        }, f, indent=2)
+    print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Startup Benchmark for 3Ts Tutor
+Times the import and construction of each component, every step in a fresh
+interpreter so nothing is already loaded by an earlier step.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --index-dir ./index --json startup.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (label, setup code - not timed, timed code)
+IMPORT_STEPS = [
+    ("import numpy", "", "import numpy"),
+    ("import faiss", "", "import faiss"),
+    ("import sentence_transformers", "", "import sentence_transformers"),
+    ("import pdfplumber", "", "import pdfplumber"),
+    ("import PyPDF2", "", "import PyPDF2"),
+    ("import pytesseract", "", "import pytesseract"),
+    ("import google.generativeai", "", "import google.generativeai"),
+    ("import vector_store", "", "import vector_store"),
+    ("import hybrid_processor", "", "import hybrid_processor"),
+    ("import agent", "", "import agent"),
+]
+
+CONSTRUCT_STEPS = [
+    ("VectorStore()",
+     "from vector_store import VectorStore",
+     "store = VectorStore(INDEX_DIR)"),
+    ("VectorStore.load_index()",
+     "from vector_store import VectorStore\nstore = VectorStore(INDEX_DIR)",
+     "store.load_index()"),
+    ("embedding model load",
+     "from vector_store import VectorStore\nstore = VectorStore(INDEX_DIR)",
+     "store.embedder"),
+    ("first query (incl. model load)",
+     "from vector_store import VectorStore\nstore = VectorStore(INDEX_DIR)\nstore.load_index()",
+     "store.search('What is Newton\\'s first law?')"),
+    ("Tutor()",
+     "from agent import Tutor",
+     "tutor = Tutor()"),
+    ("HybridProcessor()",
+     "from hybrid_processor import HybridProcessor",
+     "processor = HybridProcessor()"),
+]
+
+TEMPLATE = """
+import sys, time
+sys.path.insert(0, {repo!r})
+INDEX_DIR = {index_dir!r}
+{setup}
+_start = time.perf_counter()
+{stmt}
+print("__ELAPSED__", time.perf_counter() - _start)
+"""
+
+
+def time_step(setup, stmt, index_dir):
+    """Seconds taken by stmt in a fresh interpreter, or the error it raised"""
+    code = TEMPLATE.format(repo=REPO_DIR, index_dir=index_dir, setup=setup, stmt=stmt)
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR,
+                          capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("__ELAPSED__"):
+            return float(line.split()[1]), None
+    error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return None, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time imports and startup of 3Ts Tutor components")
+    parser.add_argument("--index-dir", default=os.path.join(REPO_DIR, "index"))
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for section, steps in (("imports", IMPORT_STEPS), ("construction", CONSTRUCT_STEPS)):
+        print(f"\n⏱️  {section.title()}")
+        print("-" * 60)
+        for label, setup, stmt in steps:
+            seconds, error = time_step(setup, stmt, args.index_dir)
+            results.append({'section': section, 'step': label,
+                            'seconds': seconds, 'error': error})
+            if error:
+                print(f"  {label:<36} ❌ {error[:60]}")
+            else:
+                print(f"  {label:<36} {seconds * 1000:9.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,532 @@
+"""
+Chunk Store for 3Ts Tutor
+Columnar, memory-mapped storage for chunk text and metadata
+
+Layout of a chunk store folder:
+    text.bin          - every chunk's UTF-8 text back to back (optionally zlib'd per chunk)
+    offsets.npy       - int64 [n + 1] byte offsets into text.bin
+    filename_ids.npy  - int32 [n] index into header['filenames']
+    page_numbers.npy  - int32 [n] page number (-1 = see header['page_labels'])
+    chunk_ids.npy     - int32 [n] chunk position within its page
+    vector_ids.npy    - int64 [n] FAISS ID, ascending
+    vectors.f32       - optional float32 [n, dimension] original embeddings, kept
+                        when the FAISS index stores compressed codes (for re-ranking)
+    header.json       - row count, compression flag, filename table, page labels,
+                        vector dimension
+    segments/NNNNNN/  - rows added by later saves, each laid out as above
+                        (its own filename table and page labels)
+    columns/          - with segments: the four columns above for every row, and a
+                        header with the store-wide filename table and page labels,
+                        so the whole store's columns open memory-mapped too
+"""
+
+import os
+import copy
+import json
+import mmap
+import shutil
+import zlib
+import bisect
+from array import array
+
+import numpy as np
+
+try:
+    from .snapshots import segment_dirs, segments_to_merge, link_segments
+except ImportError:
+    from snapshots import segment_dirs, segments_to_merge, link_segments
+
+HEADER_FILE = "header.json"
+TEXT_FILE = "text.bin"
+VECTORS_FILE = "vectors.f32"
+COLUMNS_DIR = "columns"
+WRITE_BLOCK = 4096   # rows whose vectors are gathered at a time when a store is written
+
+# Column name -> (numpy dtype, array typecode)
+COLUMNS = {
+    'filename_ids': ('int32', 'i'),
+    'page_numbers': ('int32', 'i'),
+    'chunk_ids': ('int32', 'i'),
+    'vector_ids': ('int64', 'q'),
+}
+
+NO_PAGE = -1  # page label isn't a number; look it up in page_labels
+
+
+def _page_int(page):
+    """Numeric page number, or None for labels like 'xii'"""
+    try:
+        return int(page)
+    except (TypeError, ValueError):
+        return None
+
+
+def replace_store(new_path, path):
+    """Move a freshly written store folder into place.
+    Readers holding maps of the old files keep working until they let go."""
+    old_path = path.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+# ============================================================
+#                     STREAMING WRITER
+# ============================================================
+
+class ChunkStoreWriter:
+    """Writes chunks to a new chunk store folder without keeping their text in memory"""
+
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.compress = compress
+        os.makedirs(path, exist_ok=True)
+
+        self._text_file = open(os.path.join(path, TEXT_FILE), 'wb')
+        self._offsets = array('q', [0])
+        self._columns = {name: array(code) for name, (_, code) in COLUMNS.items()}
+        self._filenames = []
+        self._filename_index = {}
+        self._page_labels = {}
+
+        # Original vectors are streamed to disk too, if the caller supplies them
+        self._vectors_file = None
+        self._dimension = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def add(self, text, meta, vector=None):
+        """Append one chunk"""
+        data = text.encode('utf-8')
+        if self.compress:
+            data = zlib.compress(data)
+        self.add_encoded(data, meta, vector)
+
+    def add_encoded(self, data, meta, vector=None):
+        """Append one chunk whose text is already encoded for this store"""
+        row = len(self)
+        if (vector is None) != (self._vectors_file is None) and row > 0:
+            raise ValueError("Either every chunk in a store has a vector or none does")
+        if vector is not None:
+            vector = np.asarray(vector, dtype='float32')
+            if self._vectors_file is None:
+                self._vectors_file = open(os.path.join(self.path, VECTORS_FILE), 'wb')
+                self._dimension = len(vector)
+            self._vectors_file.write(vector.tobytes())
+
+        self._text_file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        filename = meta['filename']
+        filename_id = self._filename_index.get(filename)
+        if filename_id is None:
+            filename_id = self._filename_index[filename] = len(self._filenames)
+            self._filenames.append(filename)
+
+        page = _page_int(meta['page_number'])
+        if page is None:
+            self._page_labels[str(row)] = meta['page_number']
+            page = NO_PAGE
+
+        self._columns['filename_ids'].append(filename_id)
+        self._columns['page_numbers'].append(page)
+        self._columns['chunk_ids'].append(meta['chunk_id'])
+        self._columns['vector_ids'].append(meta['vector_id'])
+
+    def close(self):
+        """Flush the text blob and write the column arrays + header"""
+        self._text_file.close()
+        if self._vectors_file is not None:
+            self._vectors_file.close()
+
+        np.save(os.path.join(self.path, "offsets.npy"),
+                np.array(self._offsets, dtype='int64'))
+        for name, (dtype, _) in COLUMNS.items():
+            np.save(os.path.join(self.path, f"{name}.npy"),
+                    np.array(self._columns[name], dtype=dtype))
+
+        with open(os.path.join(self.path, HEADER_FILE), 'w') as f:
+            json.dump({
+                'count': len(self),
+                'compressed': self.compress,
+                'filenames': self._filenames,
+                'page_labels': self._page_labels,
+                'dimension': self._dimension
+            }, f)
+
+
+# ============================================================
+#                       CHUNK STORE
+# ============================================================
+
+class _Segment:
+    """Rows of one saved folder (a store's base or a delta segment), memory-mapped"""
+
+    def __init__(self, path, start):
+        with open(os.path.join(path, HEADER_FILE), 'r') as f:
+            header = json.load(f)
+
+        self.start = start                 # store row of this segment's first row
+        self.count = header['count']
+        self.compressed = header['compressed']
+        self.filenames = header['filenames']
+        self.page_labels = header['page_labels']
+
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                        for name in COLUMNS}
+
+        self.vectors = None
+        dimension = header.get('dimension')
+        if dimension and self.count:
+            self.vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype='float32',
+                                     mode='r', shape=(self.count, dimension))
+
+        self.text = None
+        text_path = os.path.join(path, TEXT_FILE)
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, 'rb') as f:
+                self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def raw(self, row):
+        """Stored bytes of one of this segment's rows"""
+        if self.text is None:
+            return b''
+        return self.text[int(self.offsets[row]):int(self.offsets[row + 1])]
+
+
+def _combined_columns(segments):
+    """(filenames, page labels, columns) of a store saved before columns were
+    folded (or with no delta segments): each delta segment's filename table
+    is mapped onto the store's, and its columns copied into memory"""
+    base = segments[0]
+    filenames = list(base.filenames)
+    index = {name: i for i, name in enumerate(filenames)}
+    page_labels = dict(base.page_labels)
+    for segment in segments[1:]:
+        for name in segment.filenames:
+            if name not in index:
+                index[name] = len(filenames)
+                filenames.append(name)
+        page_labels.update({str(segment.start + int(row)): label
+                            for row, label in segment.page_labels.items()})
+    if len(segments) == 1:
+        return filenames, page_labels, base.columns
+
+    parts = {name: [base.columns[name]] for name in COLUMNS}
+    for segment in segments[1:]:
+        for name in COLUMNS:
+            column = segment.columns[name]
+            if name == 'filename_ids' and len(column):
+                ids = np.array([index[f] for f in segment.filenames], dtype='int32')
+                column = ids[column]
+            parts[name].append(column)
+    columns = {name: np.concatenate(parts[name]).astype(dtype)
+               for name, (dtype, _) in COLUMNS.items()}
+    return filenames, page_labels, columns
+
+
+def _read_columns(path, count):
+    """(columns, filenames, page labels) folded by a save at path, memory-mapped,
+    or None if there are none for count rows"""
+    if not os.path.exists(os.path.join(path, HEADER_FILE)):
+        return None
+    with open(os.path.join(path, HEADER_FILE), 'r') as f:
+        header = json.load(f)
+    if header['count'] != count:
+        return None
+    columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+               for name in COLUMNS}
+    return columns, header['filenames'], header['page_labels']
+
+
+class ChunkStore:
+    """
+    Chunk text + metadata. Saved rows are read through memory maps, so
+    opening is near-constant time and pages are shared between processes.
+    Rows appended since opening live in memory until save(), which writes
+    only them, as a delta segment next to the rows already on disk.
+    """
+
+    def __init__(self, compress=False):
+        self.path = None
+        self.compressed = compress
+
+        self._segments = []       # saved rows: the base folder, then delta segments
+        self._starts = []         # first row of each segment
+        self._base_count = 0
+        self._base = {name: np.zeros(0, dtype=dtype) for name, (dtype, _) in COLUMNS.items()}
+        self._page_labels = {}
+
+        self.filenames = []
+        self._filename_index = {}
+
+        self._new_vectors = []
+
+        self._new_texts = []
+        self._new_columns = {name: array(code) for name, (_, code) in COLUMNS.items()}
+        self._new_page_labels = {}
+        self._column_cache = {}
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, HEADER_FILE))
+
+    @classmethod
+    def open(cls, path):
+        """Open a saved chunk store with its columns memory-mapped"""
+        segments = []
+        start = 0
+        for folder in [path] + segment_dirs(path):
+            segments.append(_Segment(folder, start))
+            start += segments[-1].count
+
+        base = segments[0]
+        store = cls(compress=base.compressed)
+        store.path = path
+        store._segments = segments
+        store._starts = [segment.start for segment in segments]
+        store._base_count = start
+
+        folded = _read_columns(os.path.join(path, COLUMNS_DIR), start) if len(segments) > 1 else None
+        if folded is not None:
+            store._base, filenames, store._page_labels = folded
+            store.filenames = list(filenames)
+        else:
+            store.filenames, store._page_labels, store._base = _combined_columns(segments)
+        store._filename_index = {name: i for i, name in enumerate(store.filenames)}
+        return store
+
+    # --------------------------- size ---------------------------
+    @property
+    def base_count(self):
+        """Rows that are on disk"""
+        return self._base_count
+
+    def __len__(self):
+        return self._base_count + len(self._new_texts)
+
+    @property
+    def dirty(self):
+        """True if there are rows that haven't been saved yet"""
+        return bool(self._new_texts)
+
+    def copy(self):
+        """Store with the same rows whose appends don't show up in this one
+        (saved rows stay shared through the same memory maps)"""
+        store = copy.copy(self)
+        store.filenames = list(self.filenames)
+        store._filename_index = dict(self._filename_index)
+        store._new_vectors = list(self._new_vectors)
+        store._new_texts = list(self._new_texts)
+        store._new_columns = {name: array(column.typecode, column)
+                              for name, column in self._new_columns.items()}
+        store._new_page_labels = dict(self._new_page_labels)
+        store._column_cache = {}
+        return store
+
+    # --------------------------- write --------------------------
+    def append(self, text, meta, vector=None):
+        """Add a chunk (and optionally its original vector) in memory; returns its row"""
+        row = len(self)
+        if vector is not None:
+            self._new_vectors.append(np.asarray(vector, dtype='float32'))
+
+        filename = meta['filename']
+        filename_id = self._filename_index.get(filename)
+        if filename_id is None:
+            filename_id = self._filename_index[filename] = len(self.filenames)
+            self.filenames.append(filename)
+
+        page = _page_int(meta['page_number'])
+        if page is None:
+            self._new_page_labels[row] = meta['page_number']
+            page = NO_PAGE
+
+        self._new_texts.append(text)
+        self._new_columns['filename_ids'].append(filename_id)
+        self._new_columns['page_numbers'].append(page)
+        self._new_columns['chunk_ids'].append(meta['chunk_id'])
+        self._new_columns['vector_ids'].append(meta['vector_id'])
+        self._column_cache.clear()
+        return row
+
+    def save(self, path, keep=None, compress=None):
+        """Write the store to path and return it re-opened from there.
+        Saved rows are hard-linked from the store's own folder and only the new
+        ones are written, as a delta segment (merging the newest segments now
+        and then, see segments_to_merge). With keep (rows where keep[row] is
+        True) or a new compress setting, every row is rewritten."""
+        compress = self.compressed if compress is None else compress
+        tmp_path = path.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+        merge = self._segments_to_merge(keep, compress)
+        if merge is None:
+            rows = np.arange(len(self)) if keep is None else np.flatnonzero(keep)
+            self._write(tmp_path, rows, compress)
+        else:
+            segment_path = link_segments(self.path, tmp_path, merge)
+            first = self._starts[len(self._segments) - merge] if merge else self.base_count
+            self._write(segment_path, np.arange(first, len(self)), compress)
+            self._write_columns(os.path.join(tmp_path, COLUMNS_DIR))
+
+        replace_store(tmp_path, path)
+        return ChunkStore.open(path)
+
+    def _segments_to_merge(self, keep, compress):
+        """How many saved segments save() rewrites along with the new rows,
+        or None to rewrite the whole store"""
+        if keep is not None or compress != self.compressed or not self.base_count:
+            return None
+        if self.path is None or not ChunkStore.exists(self.path):
+            return None
+        sizes = [segment.count for segment in self._segments]
+        merge = segments_to_merge(sizes, len(self._new_texts))
+        return None if merge == len(sizes) else merge
+
+    def _write(self, path, rows, compress):
+        writer = ChunkStoreWriter(path, compress)
+        has_vectors = self.has_vectors
+        for start in range(0, len(rows), WRITE_BLOCK):
+            block = rows[start:start + WRITE_BLOCK]
+            vectors = self.vectors(block) if has_vectors else [None] * len(block)
+            for row, vector in zip(block.tolist(), vectors):
+                if row < self.base_count and compress == self.compressed:
+                    writer.add_encoded(self._raw(row), self.meta(row), vector)
+                else:
+                    writer.add(self.text(row), self.meta(row), vector)
+        writer.close()
+
+    def _write_columns(self, path):
+        """Write every row's columns (store-wide filename IDs) in one piece,
+        as open() maps them. 20 bytes a row, unlike text, so cheap to rewrite."""
+        os.makedirs(path)
+        for name in COLUMNS:
+            np.save(os.path.join(path, f"{name}.npy"), self.column(name))
+        page_labels = dict(self._page_labels)
+        page_labels.update({str(row): label for row, label in self._new_page_labels.items()})
+        with open(os.path.join(path, HEADER_FILE), 'w') as f:
+            json.dump({
+                'count': len(self),
+                'filenames': self.filenames,
+                'page_labels': page_labels
+            }, f)
+
+    # --------------------------- read ---------------------------
+    def _segment(self, row):
+        """(segment holding a saved row, the row's position in it)"""
+        segment = self._segments[bisect.bisect_right(self._starts, row) - 1]
+        return segment, row - segment.start
+
+    def _raw(self, row):
+        """Stored bytes of a saved row"""
+        segment, offset = self._segment(row)
+        return segment.raw(offset)
+
+    def text(self, row):
+        """Chunk text of one row (only this row is decoded)"""
+        if row >= self.base_count:
+            return self._new_texts[row - self.base_count]
+        data = self._raw(row)
+        if self.compressed:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def meta(self, row):
+        """Metadata dict of one row"""
+        columns = self._base
+        offset = row
+        if row >= self.base_count:
+            columns = self._new_columns
+            offset = row - self.base_count
+
+        page = int(columns['page_numbers'][offset])
+        if page == NO_PAGE:
+            page = (self._new_page_labels.get(row, page) if row >= self.base_count
+                    else self._page_labels.get(str(row), page))
+
+        return {
+            'filename': self.filenames[int(columns['filename_ids'][offset])],
+            'page_number': page,
+            'chunk_id': int(columns['chunk_ids'][offset]),
+            'vector_id': int(columns['vector_ids'][offset])
+        }
+
+    def column(self, name):
+        """A whole metadata column as a numpy array"""
+        if not self._new_texts:
+            return self._base[name]
+        if name not in self._column_cache:
+            dtype = COLUMNS[name][0]
+            self._column_cache[name] = np.concatenate([
+                self._base[name], np.array(self._new_columns[name], dtype=dtype)
+            ])
+        return self._column_cache[name]
+
+    @property
+    def has_vectors(self):
+        """True if every row carries its original vector"""
+        base_ok = all(segment.vectors is not None or segment.count == 0
+                      for segment in self._segments)
+        return base_ok and len(self._new_vectors) == len(self._new_texts) and len(self) > 0
+
+    def vectors(self, rows):
+        """Original vectors of the given rows (only those pages are read)"""
+        rows = np.asarray(rows, dtype='int64')
+        if len(self._segments) == 1 and self.base_count and not self._new_vectors:
+            return np.asarray(self._segments[0].vectors[rows], dtype='float32')
+        if not len(rows):
+            return np.zeros((0, 0), dtype='float32')
+        dimension = (self._segments[0].vectors.shape[1] if self.base_count
+                     else len(self._new_vectors[0]))
+        out = np.empty((len(rows), dimension), dtype='float32')
+        
+        # One gather per segment the rows fall in
+        where = np.searchsorted(self._starts + [self.base_count], rows, side='right') - 1
+        for i in np.unique(where):
+            picked = where == i
+            if i < len(self._segments):
+                segment = self._segments[i]
+                out[picked] = segment.vectors[rows[picked] - segment.start]
+            else:
+                new = rows[picked] - self.base_count
+                out[picked] = np.stack([self._new_vectors[row] for row in new])
+        return out
+
+    @property
+    def texts(self):
+        """List-like view of chunk texts"""
+        return _RowView(self, self.text)
+
+    @property
+    def metadata(self):
+        """List-like view of chunk metadata dicts"""
+        return _RowView(self, self.meta)
+
+
+class _RowView:
+    """Read-only sequence over a ChunkStore that materializes rows on access"""
+
+    def __init__(self, store, getter):
+        self._store = store
+        self._getter = getter
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._getter(r) for r in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("chunk row out of range")
+        return self._getter(row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self._getter(row)
@@ -0,0 +1,388 @@
+"""
+Deduplication for 3Ts Tutor
+Strips running headers/footers from book pages and collapses near-duplicate
+chunks (MinHash + LSH), so repeated text is embedded and stored only once.
+Collapsed chunks are kept as references to the chunk they duplicate.
+"""
+
+import os
+import re
+import copy
+import json
+import zlib
+from collections import Counter
+
+import numpy as np
+
+try:
+    from .snapshots import segment_dirs, segments_to_merge, link_segments
+except ImportError:
+    from snapshots import segment_dirs, segments_to_merge, link_segments
+
+# ============================================================
+#                  BOILERPLATE
+# ============================================================
+EDGE_LINES = 3              # lines at the top and bottom of a page that may be boilerplate
+WARMUP_PAGES = 12           # pages of a book seen before its boilerplate is stripped
+BOILERPLATE_MIN_PAGES = 3   # a line must repeat on at least this many pages...
+BOILERPLATE_FRACTION = 0.4  # ...and on this share of the book's pages so far
+BOILERPLATE_MAX_WORDS = 12  # running heads are short; longer lines are always content
+
+# ============================================================
+#                  NEAR-DUPLICATES
+# ============================================================
+SHINGLE_WORDS = 5           # chunks are compared as sets of 5-word shingles
+NUM_BANDS = 16              # LSH bands x rows = MinHash permutations
+ROWS_PER_BAND = 8
+MIN_BAND_MATCHES = 2        # bands that must collide (~0.8 Jaccard similarity)
+MERSENNE_PRIME = (1 << 31) - 1
+
+_rng = np.random.default_rng(3)  # fixed, so signatures are stable across runs
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, NUM_BANDS * ROWS_PER_BAND, dtype='uint64')
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, NUM_BANDS * ROWS_PER_BAND, dtype='uint64')
+_BAND_MIX = _rng.integers(1, 1 << 62, ROWS_PER_BAND, dtype='uint64') | np.uint64(1)
+_BAND_SALT = _rng.integers(1, 1 << 62, NUM_BANDS, dtype='uint64')
+
+DIGITS_RE = re.compile(r"\d+")
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_line(line):
+    """Compare header/footer lines without case, spacing or page numbers"""
+    return DIGITS_RE.sub("#", " ".join(line.lower().split()))
+
+
+def band_keys(text):
+    """LSH band keys (uint64 [NUM_BANDS]) of a chunk's MinHash signature, or None if empty"""
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS])
+                for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype='uint64')
+    hashes %= np.uint64(MERSENNE_PRIME)
+
+    # MinHash: the smallest value of each random permutation (a*x + b mod p)
+    signature = ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None])
+                 % np.uint64(MERSENNE_PRIME)).min(axis=1)
+
+    # One 64-bit key per band of ROWS_PER_BAND signature values
+    bands = signature.reshape(NUM_BANDS, ROWS_PER_BAND)
+    return (bands * _BAND_MIX).sum(axis=1) ^ _BAND_SALT
+
+
+class BoilerplateFilter:
+    """
+    Learns the header/footer lines a book repeats on its pages and strips them.
+    The first WARMUP_PAGES pages of each book are held back until there are
+    enough pages to tell boilerplate apart; after that pages pass straight through.
+    """
+
+    def __init__(self, book_of):
+        self.book_of = book_of   # filename -> book it belongs to
+        self.stripped_lines = 0
+
+    @staticmethod
+    def _edge_lines(text):
+        """(index, normalized line) of the short lines near the top and bottom"""
+        lines = [(i, line) for i, line in enumerate(text.splitlines()) if line.strip()]
+        if len(lines) > 2 * EDGE_LINES:
+            lines = lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+        return [(i, normalize_line(line)) for i, line in lines
+                if len(line.split()) <= BOILERPLATE_MAX_WORDS]
+
+    def _strip(self, item, boilerplate):
+        """Page with its boilerplate lines removed"""
+        doomed = {i for i, line in self._edge_lines(item['text']) if line in boilerplate}
+        if not doomed:
+            return item
+        self.stripped_lines += len(doomed)
+        lines = [line for i, line in enumerate(item['text'].splitlines()) if i not in doomed]
+        return dict(item, text="\n".join(lines))
+
+    def filter(self, pages):
+        """Yield pages (in order) without their book's repeated header/footer lines"""
+        book = None
+        held = []
+        counts = Counter()
+        seen = 0
+        boilerplate = set()
+
+        for item in pages:
+            if item.get('failed'):
+                # A book that failed partway: pass the mark on after its pages
+                for page in held:
+                    yield self._strip(page, boilerplate)
+                held = []
+                yield item
+                continue
+            if self.book_of(item['filename']) != book:
+                for page in held:
+                    yield self._strip(page, boilerplate)
+                book = self.book_of(item['filename'])
+                held, counts, seen, boilerplate = [], Counter(), 0, set()
+
+            counts.update({line for _, line in self._edge_lines(item['text'])})
+            seen += 1
+            threshold = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_FRACTION * seen)
+            boilerplate |= {line for line, n in counts.items() if n >= threshold}
+
+            if seen < WARMUP_PAGES:
+                held.append(item)
+                continue
+            for page in held:
+                yield self._strip(page, boilerplate)
+            held = []
+            yield self._strip(item, boilerplate)
+
+        for page in held:
+            yield self._strip(page, boilerplate)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH over chunk text. Band keys of saved chunks are kept as one
+    sorted uint64 array (NUM_BANDS keys per chunk); newer ones in a dict.
+    """
+
+    def __init__(self):
+        self._keys = np.zeros(0, dtype='uint64')   # sorted band keys
+        self._ids = np.zeros(0, dtype='int64')     # chunk ID of each key
+        self._new = {}                             # band key -> chunk IDs (since last merge)
+        self._removed = set()
+        self._unsaved = []                         # (keys, ids) merged since the last save
+        self._unsaved_removed = set()
+
+    def find(self, keys):
+        """ID of an indexed chunk these band keys nearly duplicate, or None"""
+        matches = Counter()
+        lows = np.searchsorted(self._keys, keys, side='left')
+        highs = np.searchsorted(self._keys, keys, side='right')
+        for key, lo, hi in zip(keys.tolist(), lows, highs):
+            matches.update(set(self._ids[lo:hi].tolist()) | set(self._new.get(key, ())))
+        for chunk_id, n in matches.most_common():
+            if n < MIN_BAND_MATCHES:
+                break
+            if chunk_id not in self._removed:
+                return chunk_id
+        return None
+
+    def copy(self):
+        """Index whose changes don't show up in this one (the sorted arrays are
+        shared: merge() replaces them rather than editing them)"""
+        index = copy.copy(self)
+        index._new = {key: list(ids) for key, ids in self._new.items()}
+        index._removed = set(self._removed)
+        index._unsaved = list(self._unsaved)
+        index._unsaved_removed = set(self._unsaved_removed)
+        return index
+
+    def add(self, chunk_id, keys):
+        for key in keys.tolist():
+            self._new.setdefault(key, []).append(chunk_id)
+
+    def remove(self, chunk_ids):
+        """Stop matching these chunks (their keys are dropped on the next merge)"""
+        self._removed.update(chunk_ids)
+
+    def merge(self):
+        """Fold new keys into the sorted arrays and drop removed chunks"""
+        keys = [np.full(len(ids), key, dtype='uint64') for key, ids in self._new.items()]
+        ids = [np.array(ids, dtype='int64') for ids in self._new.values()]
+        new_keys = np.concatenate(keys) if keys else np.zeros(0, dtype='uint64')
+        new_ids = np.concatenate(ids) if ids else np.zeros(0, dtype='int64')
+        order = np.argsort(new_keys, kind='stable')
+        new_keys, new_ids = new_keys[order], new_ids[order]
+        self._unsaved.append((new_keys, new_ids))
+        self._unsaved_removed |= self._removed
+
+        # Only the new keys are sorted; they go in after equal saved ones
+        at = np.searchsorted(self._keys, new_keys, side='right')
+        keys, ids = np.insert(self._keys, at, new_keys), np.insert(self._ids, at, new_ids)
+        if self._removed:
+            alive = ~np.isin(ids, np.fromiter(self._removed, dtype='int64'))
+            keys, ids = keys[alive], ids[alive]
+        self._keys, self._ids = keys, ids
+        self._new = {}
+        self._removed = set()
+
+
+class Deduplicator:
+    """
+    Index-time dedup: strips boilerplate from pages and collapses near-duplicate
+    chunks into references ('also_in') to the chunk they duplicate.
+    """
+
+    def __init__(self, book_of):
+        self.book_of = book_of
+        self.path = None   # folder holding the saved band keys these extend
+        self.near_duplicates = NearDuplicateIndex()
+        self.refs = {}   # canonical chunk ID -> metadata of the chunks collapsed into it
+        self.collapsed = 0
+        self._boilerplate = BoilerplateFilter(book_of)
+
+    def copy(self):
+        """Deduplicator whose changes don't show up in this one"""
+        dedup = copy.copy(self)
+        dedup.near_duplicates = self.near_duplicates.copy()
+        dedup.refs = {canonical: list(metas) for canonical, metas in self.refs.items()}
+        dedup._boilerplate = copy.copy(self._boilerplate)
+        return dedup
+
+    # --------------------------- build --------------------------
+    def strip_boilerplate(self, pages):
+        return self._boilerplate.filter(pages)
+
+    def collapse(self, text, meta, chunk_id):
+        """True if the chunk nearly duplicates an indexed one (it is then kept only
+        as a reference); otherwise it is registered under chunk_id"""
+        keys = band_keys(text)
+        if keys is None:
+            return False
+        canonical = self.near_duplicates.find(keys)
+        if canonical is None:
+            self.near_duplicates.add(chunk_id, keys)
+            return False
+        self.refs.setdefault(canonical, []).append(
+            {k: meta[k] for k in ('filename', 'page_number', 'chunk_id')}
+        )
+        self.collapsed += 1
+        return True
+
+    def register(self, chunk_id, text):
+        """Make an indexed chunk findable as a duplicate target"""
+        keys = band_keys(text)
+        if keys is not None:
+            self.near_duplicates.add(chunk_id, keys)
+
+    def reset_stats(self):
+        self.collapsed = 0
+        self._boilerplate.stripped_lines = 0
+
+    def print_report(self):
+        print(f"🧬 Dedup: stripped {self._boilerplate.stripped_lines} boilerplate lines, "
+              f"collapsed {self.collapsed} duplicate chunks into references")
+
+    # --------------------------- remove -------------------------
+    def drop_refs(self, matches):
+        """Forget references whose location matches(meta) (e.g. a removed book);
+        returns how many were dropped"""
+        dropped = 0
+        for canonical in list(self.refs):
+            kept = [meta for meta in self.refs[canonical] if not matches(meta)]
+            dropped += len(self.refs[canonical]) - len(kept)
+            if kept:
+                self.refs[canonical] = kept
+            else:
+                del self.refs[canonical]
+        return dropped
+
+    def remove(self, chunk_ids):
+        """Remove canonical chunks; returns {chunk ID: references} still pointing
+        at them, which the caller must re-index under one of the references"""
+        self.near_duplicates.remove(chunk_ids)
+        return {i: self.refs.pop(i) for i in chunk_ids if i in self.refs}
+
+    def adopt(self, chunk_id, text, refs):
+        """Re-home references on a chunk indexed again under a new ID"""
+        self.register(chunk_id, text)
+        if refs:
+            self.refs[chunk_id] = list(refs)
+
+    # --------------------------- query --------------------------
+    def also_in(self, chunk_id):
+        """Other locations of a chunk's text"""
+        return self.refs.get(chunk_id, [])
+
+    def ids_referenced_by(self, matches):
+        """Canonical chunk IDs with a reference whose location matches(meta)"""
+        return [canonical for canonical, metas in list(self.refs.items())
+                if any(matches(meta) for meta in metas)]
+
+    # ------------------------ persistence -----------------------
+    def save(self, path):
+        """Write band keys and references to a folder. Keys added (and chunks
+        removed) since they were loaded from `path` go in a delta segment next
+        to hard links of the saved ones; without a saved copy, all are written."""
+        os.makedirs(path, exist_ok=True)
+        near = self.near_duplicates
+        near.merge()
+        merge = self._segments_to_merge()
+        if merge is None:
+            _save_arrays(path, keys=near._keys, ids=near._ids)
+        else:
+            segment_path = link_segments(self.path, path, merge)
+            merged = segment_dirs(self.path)
+            parts = [_load_arrays(folder) for folder in merged[len(merged) - merge:]]
+            parts += [{'keys': keys, 'ids': ids, 'removed': np.zeros(0, dtype='int64')}
+                      for keys, ids in near._unsaved]
+            parts.append({'keys': np.zeros(0, dtype='uint64'), 'ids': np.zeros(0, dtype='int64'),
+                          'removed': np.fromiter(near._unsaved_removed, dtype='int64')})
+            os.makedirs(segment_path)
+            _save_arrays(segment_path, **{name: np.concatenate([part[name] for part in parts])
+                                          for name in ('keys', 'ids', 'removed')})
+        with open(os.path.join(path, "refs.json.tmp"), 'w') as f:
+            json.dump({str(k): v for k, v in self.refs.items()}, f)
+        os.replace(os.path.join(path, "refs.json.tmp"), os.path.join(path, "refs.json"))
+
+    def _segments_to_merge(self):
+        """How many saved delta segments save() rewrites along with the new
+        keys, or None to write them all"""
+        if self.path is None or not Deduplicator.exists(self.path):
+            return None
+        sizes = [len(np.load(os.path.join(folder, "keys.npy"), mmap_mode='r'))
+                 for folder in [self.path] + segment_dirs(self.path)]
+        near = self.near_duplicates
+        new = sum(len(keys) for keys, _ in near._unsaved) + len(near._unsaved_removed)
+        merge = segments_to_merge(sizes, new)
+        return None if merge == len(sizes) else merge
+
+    def mark_saved(self, path):
+        """Record that every key is now saved in path"""
+        self.path = path
+        self.near_duplicates._unsaved = []
+        self.near_duplicates._unsaved_removed = set()
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, "refs.json"))
+
+    @classmethod
+    def load(cls, path, book_of):
+        dedup = cls(book_of)
+        dedup.path = path
+        parts = [_load_arrays(folder) for folder in [path] + segment_dirs(path)]
+        keys = np.concatenate([part['keys'] for part in parts])
+        ids = np.concatenate([part['ids'] for part in parts])
+        removed = np.concatenate([part['removed'] for part in parts])
+        if len(removed):
+            alive = ~np.isin(ids, removed)
+            keys, ids = keys[alive], ids[alive]
+        if len(parts) > 1:
+            order = np.argsort(keys, kind='stable')
+            keys, ids = keys[order], ids[order]
+        dedup.near_duplicates._keys = keys
+        dedup.near_duplicates._ids = ids
+        with open(os.path.join(path, "refs.json"), 'r') as f:
+            dedup.refs = {int(k): v for k, v in json.load(f).items()}
+        return dedup
+
+
+def _save_arrays(path, **arrays):
+    """np.save each array to <name>.npy via a temp file"""
+    for name, array in arrays.items():
+        tmp_path = os.path.join(path, f"{name}.npy.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+
+def _load_arrays(path):
+    """Band keys, their chunk IDs and removed chunk IDs saved in a folder
+    (only delta segments record removals)"""
+    arrays = {'keys': np.load(os.path.join(path, "keys.npy")),
+              'ids': np.load(os.path.join(path, "ids.npy"))}
+    removed_path = os.path.join(path, "removed.npy")
+    arrays['removed'] = (np.load(removed_path) if os.path.exists(removed_path)
+                         else np.zeros(0, dtype='int64'))
+    return arrays
@@ -0,0 +1,237 @@
+"""
+Embedding Backends for 3Ts Tutor
+The same sentence-transformer model run by different CPU runtimes:
+
+    torch       - SentenceTransformer on PyTorch (the reference)
+    torch-int8  - the same model with its Linear layers dynamically quantized to int8
+    onnx        - the transformer exported to an ONNX Runtime graph
+    onnx-int8   - that graph with int8 dynamically quantized weights
+
+Pick one with EMBEDDING_BACKEND (environment / .env) or VectorStore(backend=...).
+ONNX graphs are exported once into models/<model>/onnx/ (this needs torch);
+afterwards they load with onnxruntime + tokenizers only. Before a non-reference
+backend is used, its embeddings are compared with the reference on sample
+sentences and it is refused if their cosine agreement is too low.
+"""
+
+import os
+import re
+import json
+
+import numpy as np
+
+try:
+    from .lazy_imports import lazy_import
+except ImportError:
+    from lazy_imports import lazy_import
+
+sentence_transformers = lazy_import("sentence_transformers")
+onnxruntime = lazy_import("onnxruntime")
+transformers = lazy_import("transformers")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("EMBEDDING_MODELS_DIR", os.path.join(SCRIPT_DIR, "models"))
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# ALLOW_BACKEND_MISMATCH=1 lets queries on one backend search an index embedded on another
+ALLOW_BACKEND_MISMATCH = os.getenv("ALLOW_BACKEND_MISMATCH", "0") == "1"
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedder.json"
+AGREEMENT_FILE = "agreement.json"
+
+# Lowest cosine similarity to the reference allowed on any sample sentence
+MIN_AGREEMENT = {'torch-int8': 0.97, 'onnx': 0.999, 'onnx-int8': 0.97}
+
+AGREEMENT_TEXTS = [
+    "What is Newton's first law of motion?",
+    "An object at rest stays at rest unless acted upon by an unbalanced force.",
+    "The kinetic energy of a body is half its mass times the square of its velocity.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The mitochondria is the powerhouse of the cell.",
+    "Ohm's law states that current is proportional to voltage across a conductor.",
+    "Explain the difference between speed and velocity.",
+    "Water boils at 100 degrees Celsius at sea level.",
+    "The derivative of sin(x) is cos(x).",
+    "Summarize chapter 3: chemical bonding, ionic and covalent compounds.",
+    "Entropy of an isolated system never decreases.",
+    "A covalent bond forms when two atoms share a pair of electrons.",
+]
+
+
+def embedder_id(model_name, backend):
+    """Identifies the embeddings an index holds, e.g. 'all-MiniLM-L6-v2' or
+    'all-MiniLM-L6-v2#onnx-int8' (the reference backend keeps the bare name)"""
+    return model_name if backend == 'torch' else f"{model_name}#{backend}"
+
+
+def _model_dir(model_name, backend, models_dir):
+    folder = 'onnx' if backend.startswith('onnx') else backend
+    return os.path.join(models_dir, re.sub(r"[^\w.-]+", "_", model_name), folder)
+
+
+# ============================================================
+#                  ONNX RUNTIME BACKEND
+# ============================================================
+
+class OnnxEmbedder:
+    """
+    A sentence-transformer exported to ONNX: the transformer runs in ONNX
+    Runtime; mean pooling and normalization are done here in numpy.
+    Offers the parts of the SentenceTransformer API VectorStore uses.
+    """
+
+    def __init__(self, model_dir, onnx_file=ONNX_FILE, threads=None):
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r') as f:
+            config = json.load(f)
+        self.max_seq_length = config['max_seq_length']
+        self.dimension = config['dimension']
+        self.normalize = config['normalize']
+
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, onnx_file), options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=64, **kwargs):
+        """Embed texts as a float32 matrix (a vector for a single string)"""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.dimension), dtype='float32')
+
+        # Similar lengths share a batch, so little time goes into padding
+        order = np.argsort([-len(t) for t in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encoded = self.tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: encoded[name].astype('int64') for name in self._input_names}
+            token_embeddings = self.session.run(None, feed)[0]
+
+            mask = encoded['attention_mask'][..., None].astype('float32')
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            out[rows] = pooled
+
+        return out[0] if single else out
+
+
+def export_onnx(model_name, model_dir):
+    """Export a mean-pooled sentence-transformer to model_dir (ONNX graph,
+    its int8 quantized copy, tokenizer and pooling config)"""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"📦 Exporting {model_name} to ONNX (one-off)...")
+    model = sentence_transformers.SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = model[0], model[1]
+    if not getattr(pooling, 'pooling_mode_mean_tokens', False):
+        raise ValueError(f"{model_name} isn't mean-pooled; only those can be exported to ONNX")
+
+    os.makedirs(model_dir, exist_ok=True)
+    dummy = transformer.tokenizer(["An example sentence."], return_tensors='pt')
+    input_names = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in dummy]
+    dynamic_axes = {name: {0: 'batch', 1: 'tokens'} for name in input_names + ['token_embeddings']}
+
+    onnx_path = os.path.join(model_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(transformer.auto_model, tuple(dummy[n] for n in input_names),
+                          onnx_path, input_names=input_names,
+                          output_names=['token_embeddings'], dynamic_axes=dynamic_axes,
+                          opset_version=14)
+    quantize_dynamic(onnx_path, os.path.join(model_dir, ONNX_INT8_FILE),
+                     weight_type=QuantType.QInt8)
+
+    transformer.tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, CONFIG_FILE), 'w') as f:
+        json.dump({
+            'model_name': model_name,
+            'max_seq_length': model.max_seq_length,
+            'dimension': model.get_sentence_embedding_dimension(),
+            'normalize': any(type(m).__name__ == 'Normalize' for m in model)
+        }, f, indent=2)
+    return model
+
+
+# ============================================================
+#                  LOADING + AGREEMENT CHECK
+# ============================================================
+
+def _quantized_torch(model_name):
+    """SentenceTransformer with int8 dynamically quantized Linear layers"""
+    import torch
+    model = sentence_transformers.SentenceTransformer(model_name, device='cpu')
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def check_agreement(embedder, reference, texts=AGREEMENT_TEXTS):
+    """Cosine similarity of embedder's vectors to the reference's, per text:
+    {'mean': ..., 'min': ...}"""
+    a = np.asarray(embedder.encode(list(texts)), dtype='float32')
+    b = np.asarray(reference.encode(list(texts)), dtype='float32')
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {'mean': float(cosine.mean()), 'min': float(cosine.min())}
+
+
+def _ensure_agreement(embedder, model_name, backend, model_dir, reference=None):
+    """Refuse a backend whose embeddings drift from the reference.
+    The result is remembered in model_dir, so the reference is loaded only once."""
+    path = os.path.join(model_dir, AGREEMENT_FILE)
+    agreement = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            agreement = json.load(f)
+
+    if backend not in agreement:
+        if reference is None:
+            reference = sentence_transformers.SentenceTransformer(model_name, device='cpu')
+        agreement[backend] = check_agreement(embedder, reference)
+        os.makedirs(model_dir, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(agreement, f, indent=2)
+        print(f"🔬 {backend} vs reference: cosine mean {agreement[backend]['mean']:.4f}, "
+              f"min {agreement[backend]['min']:.4f}")
+
+    if agreement[backend]['min'] < MIN_AGREEMENT[backend]:
+        raise RuntimeError(
+            f"The {backend} backend disagrees with the reference embeddings "
+            f"(min cosine {agreement[backend]['min']:.4f} < {MIN_AGREEMENT[backend]}); "
+            f"use EMBEDDING_BACKEND=torch"
+        )
+
+
+def load_embedder(model_name=EMBEDDING_MODEL, backend=None, threads=None, device=None,
+                  models_dir=MODELS_DIR, check=True):
+    """The model_name embedder on the given backend (default: EMBEDDING_BACKEND).
+    threads limits ONNX Runtime's intra-op threads (torch: set by the caller)."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (choose from {BACKENDS})")
+
+    if backend == 'torch':
+        return sentence_transformers.SentenceTransformer(model_name, device=device)
+
+    model_dir = _model_dir(model_name, backend, models_dir)
+    reference = None
+    if backend == 'torch-int8':
+        embedder = _quantized_torch(model_name)
+    else:
+        if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+            reference = export_onnx(model_name, model_dir)
+        onnx_file = ONNX_INT8_FILE if backend == 'onnx-int8' else ONNX_FILE
+        embedder = OnnxEmbedder(model_dir, onnx_file, threads=threads)
+
+    if check:
+        _ensure_agreement(embedder, model_name, backend, model_dir, reference)
+    return embedder
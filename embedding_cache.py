@@ -0,0 +1,119 @@
+"""
+Embedding Cache for 3Ts Tutor
+Remembers chunk embeddings by content hash so re-indexing skips unchanged text
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+FLUSH_ENTRIES = 4096   # new or re-used entries written to disk at a time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY, vector BLOB, last_used REAL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+class EmbeddingCache:
+    """
+    Persistent map of (model name, chunk text hash) -> embedding, in sqlite.
+    Lookups read single rows and saves write only new entries, so neither
+    depends on the size of the cache. Least recently used entries are
+    evicted once max_entries is reached.
+    """
+
+    def __init__(self, cache_path, model_name, max_entries=200_000):
+        self.cache_path = cache_path
+        self.model_name = model_name
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = None          # opened on first use, not at startup
+        self._new = {}           # key -> vector, not yet written
+        self._used = set()       # keys hit since the last write
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def _key(self, text):
+        """Cache key for a chunk under the current model"""
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def __len__(self):
+        """Number of cached embeddings (saved or not)"""
+        with self._lock:
+            self._flush()
+            return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get(self, text):
+        """Cached embedding for text, or None"""
+        key = self._key(text)
+        with self._lock:
+            vector = self._new.get(key)
+            if vector is None:
+                row = self._connect().execute(
+                    "SELECT vector FROM embeddings WHERE key=?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype='float32')
+                    self._used.add(key)
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(self._used) >= FLUSH_ENTRIES:
+                self._flush()
+            return vector
+
+    def put(self, text, vector):
+        """Store an embedding (written out in batches, see save)"""
+        with self._lock:
+            self._new[self._key(text)] = np.asarray(vector, dtype='float32')
+            if len(self._new) >= FLUSH_ENTRIES:
+                self._flush()
+
+    def save(self):
+        """Write new entries and access times, then evict the least recently
+        used entries while over max_entries"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._new and not self._used:
+            return
+        now = time.time()
+        db = self._connect()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                           [(key, vector.tobytes(), now) for key, vector in self._new.items()])
+            db.executemany("UPDATE embeddings SET last_used=? WHERE key=?",
+                           [(now, key) for key in self._used])
+            count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+        self._new = {}
+        self._used = set()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,121 @@
+"""
+Embedding Pool for 3Ts Tutor
+Encodes large batches of chunks on several worker processes. Workers write
+their embeddings straight into one shared-memory matrix, so no vectors are
+pickled on the way back.
+"""
+
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from .embedders import load_embedder
+except ImportError:
+    from embedders import load_embedder
+
+DEFAULT_SHARD_SIZE = 512   # chunks per task; also fixes how texts are batched
+
+# Set in each worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name, backend, threads):
+    """Load the embedding model once per worker process (the parent has
+    already checked the backend's agreement with the reference)"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = load_embedder(model_name, backend, threads=threads, device='cpu', check=False)
+
+
+def _encode_shard(task):
+    """Encode one shard of texts into its rows of the shared output matrix"""
+    shm_name, shape, start, texts, batch_size = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype='float32', buffer=shm.buf)
+        out[start:start + len(texts)] = _worker_model.encode(texts, batch_size=batch_size)
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool:
+    """
+    Process pool that embeds texts in fixed-size shards.
+    Shard boundaries don't depend on the number of workers, so the output is
+    the same (and in input order) whatever the worker count.
+    """
+
+    def __init__(self, model_name, dimension, workers=None, batch_size=64,
+                 shard_size=DEFAULT_SHARD_SIZE, backend='torch'):
+        self.model_name = model_name
+        self.backend = backend
+        self.dimension = dimension
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.shard_size = shard_size
+        self._pool = None
+
+    def _get_pool(self):
+        """Start the workers on first use ('spawn' is safe with torch threads)"""
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"🧵 Starting {self.workers} embedding workers "
+                  f"({threads} thread{'s' if threads > 1 else ''} each)...")
+            self._pool = mp.get_context('spawn').Pool(
+                self.workers, initializer=_init_worker, initargs=(self.model_name, self.backend, threads)
+            )
+        return self._pool
+
+    def encode(self, texts):
+        """Embed texts as a float32 matrix, rows in input order"""
+        return self.encode_batches([texts])[0]
+
+    def encode_batches(self, batches):
+        """Embed several lists of texts in one round of tasks, so that small
+        batches still keep every worker busy. Each list is sharded on its own,
+        so its embeddings don't depend on what it was submitted with.
+        Returns one float32 matrix per list."""
+        batches = [list(texts) for texts in batches]
+        offsets = np.cumsum([0] + [len(texts) for texts in batches])
+        shape = (int(offsets[-1]), self.dimension)
+        if not shape[0]:
+            return [np.zeros((0, self.dimension), dtype='float32') for _ in batches]
+
+        shm = shared_memory.SharedMemory(create=True, size=shape[0] * self.dimension * 4)
+        try:
+            tasks = [(shm.name, shape, int(offset) + start, texts[start:start + self.shard_size],
+                      self.batch_size)
+                     for texts, offset in zip(batches, offsets)
+                     for start in range(0, len(texts), self.shard_size)]
+            done = 0
+            for count in self._get_pool().imap_unordered(_encode_shard, tasks):
+                done += count
+                print(f"   Embedded {done}/{shape[0]} chunks")
+            view = np.ndarray(shape, dtype='float32', buffer=shm.buf)
+            embeddings = view.copy()
+            del view   # the buffer can't be released while a view exists
+            return [embeddings[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,173 @@
+"""
+Extraction Cache for 3Ts Tutor
+Remembers the text extracted from every PDF page and OCR'd image, keyed by
+file content, so rebuilding after one new upload doesn't re-parse or re-OCR
+the files that were already there
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(SCRIPT_DIR, "cache", "extraction_cache.sqlite3")
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024   # extracted text kept, across all files
+DEFAULT_MAX_DOCUMENTS = 20_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    file_hash TEXT, engine TEXT, config TEXT,
+    pages INTEGER, bytes INTEGER, last_used REAL,
+    PRIMARY KEY (file_hash, engine, config)
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents (last_used);
+CREATE TABLE IF NOT EXISTS pages (
+    file_hash TEXT, engine TEXT, config TEXT, page INTEGER, text TEXT,
+    PRIMARY KEY (file_hash, engine, config, page)
+);
+"""
+
+_hashes = {}             # (path, size, mtime) -> content hash, shared by every caller
+_hashes_lock = threading.Lock()
+
+
+def file_hash(path):
+    """SHA-256 of a file's content (re-hashed only if its size or mtime changed).
+    Needs no cache database, so callers with caching turned off can use it too."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hashes_lock:
+        cached = _hashes.get(key)
+    if cached is not None:
+        return cached
+    
+    # Hashed outside the lock: other threads keep hashing meanwhile
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    with _hashes_lock:
+        return _hashes.setdefault(key, digest.hexdigest())
+
+
+class ExtractionCache:
+    """
+    Persistent map of (file content hash, page, engine, engine config) -> text.
+    A file's pages are stored and evicted together (least recently used
+    first) once max_bytes of text or max_documents files are exceeded.
+    One cache can be shared by several processors and threads.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 max_documents=DEFAULT_MAX_DOCUMENTS):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_documents = max_documents
+
+        self._lock = threading.Lock()
+        self._db = None          # opened on first use, not at startup
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def file_hash(self, path):
+        """SHA-256 of a file's content (see the module-level file_hash)"""
+        return file_hash(path)
+
+    def get_document(self, file_hash, engine, config=''):
+        """Text of every page of a file (list in page order, '' for empty
+        pages), or None unless all of them are cached"""
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT pages FROM documents WHERE file_hash=? AND engine=? AND config=?",
+                (file_hash, engine, config)
+            ).fetchone()
+            texts = None
+            if row is not None:
+                texts = [text for (text,) in db.execute(
+                    "SELECT text FROM pages WHERE file_hash=? AND engine=? AND config=? "
+                    "ORDER BY page", (file_hash, engine, config)
+                )]
+                if len(texts) == row[0]:
+                    db.execute(
+                        "UPDATE documents SET last_used=? WHERE file_hash=? AND engine=? AND config=?",
+                        (time.time(), file_hash, engine, config)
+                    )
+                    db.commit()
+                else:
+                    texts = None
+            if texts is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return texts
+
+    def put_document(self, file_hash, engine, config, texts):
+        """Store the text of every page of a file (page 1 first), then evict
+        the least recently used files while over the limits"""
+        texts = [text or '' for text in texts]
+        size = sum(len(text.encode('utf-8')) for text in texts)
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute("DELETE FROM pages WHERE file_hash=? AND engine=? AND config=?",
+                           (file_hash, engine, config))
+                db.executemany(
+                    "INSERT INTO pages VALUES (?, ?, ?, ?, ?)",
+                    [(file_hash, engine, config, page, text) for page, text in enumerate(texts, 1)]
+                )
+                db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                           (file_hash, engine, config, len(texts), size, time.time()))
+                self._evict(db)
+
+    def _evict(self, db):
+        documents, total = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM documents"
+        ).fetchone()
+        if documents <= self.max_documents and total <= self.max_bytes:
+            return
+        victims = []
+        for key in db.execute(
+            "SELECT file_hash, engine, config, bytes FROM documents ORDER BY last_used"
+        ):
+            # Never evict the last document, even if it alone exceeds max_bytes
+            if documents <= 1 or (documents <= self.max_documents and total <= self.max_bytes):
+                break
+            victims.append(key[:3])
+            documents -= 1
+            total -= key[3]
+        db.executemany("DELETE FROM pages WHERE file_hash=? AND engine=? AND config=?", victims)
+        db.executemany("DELETE FROM documents WHERE file_hash=? AND engine=? AND config=?", victims)
+
+    def clear(self):
+        """Forget every cached file. Rows are deleted rather than the file, so
+        other caches with the database open see it emptied too."""
+        with self._lock:
+            if self._db is None and not os.path.exists(self.cache_path):
+                return
+            db = self._connect()
+            with db:
+                db.execute("DELETE FROM pages")
+                db.execute("DELETE FROM documents")
+            db.execute("VACUUM")   # give the disk space back
+
+    def __len__(self):
+        """Number of cached files"""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
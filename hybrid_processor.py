@@ -1,12 +1,15 @@
 import os
 try:
-    from .pdf_processor import PDFProcessor
+    from .pdf_processor import PDFProcessor, complete_records
     from .local_ocr_processor import LocalOCRProcessor
+    from .extraction_cache import ExtractionCache
 except ImportError:
+    from extraction_cache import ExtractionCache
     try:
-        from pdf_processor import PDFProcessor
+        from pdf_processor import PDFProcessor, complete_records
     except:
         PDFProcessor = None
+        complete_records = list
     try:
         from local_ocr_processor import LocalOCRProcessor
     except:
@@ -20,12 +23,17 @@ class HybridProcessor:
     Priority: PDF first (better quality), then images
     """
     
-    def __init__(self):
-        self.pdf_processor = PDFProcessor() if PDFProcessor else None
-        self.ocr_processor = LocalOCRProcessor() if LocalOCRProcessor else None
+    def __init__(self, pdf_workers=None, cache=None):
+        # One extraction cache for both, so unchanged files are never re-read
+        self.cache = ExtractionCache() if cache is None else cache
+        self.pdf_processor = PDFProcessor(workers=pdf_workers, cache=self.cache) if PDFProcessor else None
+        self.ocr_processor = LocalOCRProcessor(cache=self.cache) if LocalOCRProcessor else None
     
-    def process_book_folder(self, folder_path, delay=0, resume=True):
-        """Automatically detect and process PDFs or images"""
+    def iter_pages(self, folder_path, delay=0, resume=True, progress=None):
+        """Automatically detect PDFs or images and yield their page records
+        as they are extracted. progress(message) receives the progress
+        messages (default: print)"""
+        say = progress or print
         
         # Check what files we have
         files = os.listdir(folder_path)
@@ -36,21 +44,24 @@ class HybridProcessor:
         
         # Decide what to process
         if pdf_files and self.pdf_processor:
-            print(f"📚 Found {len(pdf_files)} PDF file(s) - Using PDF processor")
-            print("✨ Direct text extraction (fast & accurate)\n")
-            return self.pdf_processor.process_book_folder(folder_path)
+            say(f"📚 Found {len(pdf_files)} PDF file(s) - Using PDF processor")
+            say("✨ Direct text extraction (fast & accurate)\n")
+            yield from self.pdf_processor.iter_pages(folder_path, progress)
         
         elif image_files and self.ocr_processor:
-            print(f"🖼️  Found {len(image_files)} image file(s) - Using OCR processor")
-            print("⚡ Local OCR processing\n")
-            return self.ocr_processor.process_book_folder(folder_path, delay, resume)
+            say(f"🖼️  Found {len(image_files)} image file(s) - Using OCR processor")
+            say("⚡ Local OCR processing\n")
+            yield from self.ocr_processor.iter_pages(folder_path, progress)
         
         else:
-            print("❌ No PDF or image files found in books/ folder!")
-            print("   Please add either:")
-            print("   - PDF files (recommended)")
-            print("   - Image files (JPG, PNG, etc.)")
-            return []
+            say("❌ No PDF or image files found in books/ folder!")
+            say("   Please add either:")
+            say("   - PDF files (recommended)")
+            say("   - Image files (JPG, PNG, etc.)")
+    
+    def process_book_folder(self, folder_path, delay=0, resume=True, progress=None):
+        """Automatically detect and process PDFs or images"""
+        return complete_records(self.iter_pages(folder_path, delay, resume, progress))
 
 # Alias for drop-in replacement
 OCRProcessor = HybridProcessor
@@ -0,0 +1,42 @@
+"""
+Lazy Imports for 3Ts Tutor
+Heavy libraries (torch via sentence-transformers, faiss, PDF parsers,
+Tesseract, Gemini) are only imported the first time they are used
+"""
+
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access"""
+
+    def __init__(self, name, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load:
+                        self._on_load(module)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for attributes not set in __init__, i.e. module contents
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name, on_load=None):
+    """Module proxy for name; on_load(module) runs once after the real import"""
+    return LazyModule(name, on_load)
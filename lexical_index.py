@@ -0,0 +1,340 @@
+"""
+Lexical Index for 3Ts Tutor
+Compact BM25 inverted index kept next to FAISS, so exact terms such as
+equation names and chapter numbers are found even when embeddings miss them
+"""
+
+import os
+import re
+import json
+import math
+from collections import Counter
+
+import numpy as np
+
+try:
+    from .snapshots import segment_dirs, segments_to_merge, link_segments
+except ImportError:
+    from snapshots import segment_dirs, segments_to_merge, link_segments
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-=^/'][a-z0-9]+)*")
+SPLIT_RE = re.compile(r"[.\-=^/']")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def _save_array(path, array):
+    """np.save via a temp file, so memory-mapped readers of the old file are unaffected"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _write_postings(path, postings):
+    """Write {term: (docs, tfs)} as flat arrays (CSR layout) to a folder"""
+    os.makedirs(path, exist_ok=True)
+    terms = list(postings)
+    lengths = [len(postings[t][0]) for t in terms]
+    offsets = np.zeros(len(terms) + 1, dtype='int64')
+    offsets[1:] = np.cumsum(lengths)
+
+    empty_docs = np.zeros(0, dtype='int32')
+    empty_tfs = np.zeros(0, dtype='float32')
+    docs = np.concatenate([postings[t][0] for t in terms]) if terms else empty_docs
+    tfs = np.concatenate([postings[t][1] for t in terms]) if terms else empty_tfs
+
+    _save_array(os.path.join(path, "offsets.npy"), offsets)
+    _save_array(os.path.join(path, "docs.npy"), docs.astype('int32'))
+    _save_array(os.path.join(path, "tfs.npy"), tfs.astype('float32'))
+    with open(os.path.join(path, "terms.json.tmp"), 'w') as f:
+        json.dump(terms, f)
+    os.replace(os.path.join(path, "terms.json.tmp"), os.path.join(path, "terms.json"))
+
+
+def _read_postings(path):
+    """(term, docs, tfs) of a folder written by _write_postings; arrays are memory-mapped"""
+    with open(os.path.join(path, "terms.json"), 'r') as f:
+        terms = json.load(f)
+    offsets = np.load(os.path.join(path, "offsets.npy"))
+    docs = np.load(os.path.join(path, "docs.npy"), mmap_mode='r')
+    tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode='r')
+    for i, term in enumerate(terms):
+        yield term, docs[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]
+
+
+def _extend(postings, term, docs, tfs):
+    """Append to a term's postings (arrays are replaced, never edited)"""
+    if term in postings:
+        old_docs, old_tfs = postings[term]
+        docs = np.concatenate([old_docs, docs])
+        tfs = np.concatenate([old_tfs, tfs])
+    postings[term] = (docs, tfs)
+
+
+def _idf(num_docs, doc_freq):
+    return math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def tokenize(text):
+    """Lowercase terms. Compound tokens like 'f=ma' or '3.2' are kept whole
+    and also contribute their parts."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 over chunk IDs (the same IDs FAISS uses).
+    Postings are int32 doc IDs + float32 term frequencies per term.
+    Document frequencies are kept up to date as docs are added (removals
+    have them recounted by the next finalize()), and each doc's length
+    normalisation is precomputed by finalize() after each batch of changes,
+    so a query only sums posting weights.
+    save() writes only the postings added since the index was loaded from
+    (or last saved to) `path`, as a delta segment next to the saved ones.
+    """
+
+    def __init__(self):
+        self._postings = {}        # term -> (doc ids int32, term freqs float32)
+        self._df = {}              # term -> number of live docs it's in
+        self._df_stale = False     # docs were removed since _df was counted
+        self._doc_len = np.zeros(0, dtype='int32')   # by doc ID: 0 = absent, -1 = removed
+        self._norm = np.zeros(0, dtype='float32')    # by doc ID: BM25 length norm, inf = absent
+        self._corpus_norm = None   # (average length, norms) last scored with (see search)
+        self.num_docs = 0
+        self.total_len = 0
+
+        self.path = None           # folder holding the saved postings this index extends
+        self._saved = {}           # term changed since -> its postings saved at path
+
+    def __len__(self):
+        return self.num_docs
+
+    def copy(self):
+        """Index whose changes don't show up in searches on this one (posting
+        arrays are shared: changes replace them rather than editing them)"""
+        index = LexicalIndex()
+        index._postings = dict(self._postings)
+        index._df = dict(self._df)
+        index._df_stale = self._df_stale
+        index._doc_len = self._doc_len.copy()
+        index._norm = self._norm.copy()
+        index.num_docs = self.num_docs
+        index.total_len = self.total_len
+        index.path = self.path
+        index._saved = dict(self._saved)
+        return index
+
+    # --------------------------- write --------------------------
+    def add(self, doc_ids, texts):
+        """Index a batch of chunks"""
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+
+        needed = max(doc_ids) + 1
+        if needed > len(self._doc_len):
+            grown = np.zeros(max(needed, 2 * len(self._doc_len)), dtype='int32')
+            grown[:len(self._doc_len)] = self._doc_len
+            self._doc_len = grown
+        if len(self._doc_len) > len(self._norm):
+            # New docs aren't scored until finalize() gives them a norm
+            grown = np.full(len(self._doc_len), np.inf, dtype='float32')
+            grown[:len(self._norm)] = self._norm
+            self._norm = grown
+
+        new_postings = {}
+        for doc_id, text in zip(doc_ids, texts):
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._doc_len[doc_id] = max(length, 1)
+            self.num_docs += 1
+            self.total_len += max(length, 1)
+            for term, tf in counts.items():
+                docs, tfs = new_postings.setdefault(term, ([], []))
+                docs.append(doc_id)
+                tfs.append(tf)
+
+        for term, (docs, tfs) in new_postings.items():
+            self._df[term] = self._df.get(term, 0) + len(docs)
+            if term not in self._saved:
+                self._saved[term] = len(self._postings[term][0]) if term in self._postings else 0
+            _extend(self._postings, term, np.array(docs, dtype='int32'),
+                    np.array(tfs, dtype='float32'))
+
+    def remove(self, doc_ids):
+        """Stop scoring these chunks (postings are dropped on compact())"""
+        for doc_id in doc_ids:
+            if doc_id < len(self._doc_len) and self._doc_len[doc_id] > 0:
+                self.total_len -= int(self._doc_len[doc_id])
+                self._doc_len[doc_id] = -1
+                self._norm[doc_id] = np.inf
+                self.num_docs -= 1
+                self._df_stale = True
+
+    def compact(self):
+        """Drop postings of removed chunks (the next save rewrites them all)"""
+        for term in list(self._postings):
+            docs, tfs = self._postings[term]
+            alive = self._doc_len[docs] > 0
+            if alive.all():
+                continue
+            self.path = None
+            if alive.any():
+                self._postings[term] = (docs[alive], tfs[alive])
+            else:
+                del self._postings[term]
+                self._df.pop(term, None)
+        self._doc_len[self._doc_len < 0] = 0
+        self.finalize()
+
+    def finalize(self):
+        """Precompute the length norm of every doc, after recounting document
+        frequencies if docs were removed (adds keep them up to date)"""
+        if self._df_stale:
+            self._df = self._doc_freqs(self._postings)
+            self._df_stale = False
+        self._norm = self._norms(self.total_len / max(self.num_docs, 1))
+
+    def _doc_freqs(self, terms):
+        """{term: number of docs it's in}, not counting removed docs whose
+        postings are still waiting for compact()"""
+        if not (self._doc_len < 0).any():
+            return {term: len(self._postings[term][0]) for term in terms}
+        return {term: int(np.count_nonzero(self._doc_len[self._postings[term][0]] > 0))
+                for term in terms}
+
+    def _norms(self, avg_len):
+        """K1 * (1 - B + B * length / avg_len) by doc ID; inf for removed docs,
+        whose weights then come out as 0"""
+        norm = np.full(len(self._doc_len), np.inf, dtype='float32')
+        live = self._doc_len > 0
+        norm[live] = K1 * (1 - B + B * self._doc_len[live] / max(avg_len, 1e-9))
+        return norm
+
+    def term_stats(self, query):
+        """(doc count, total length, {term: doc frequency}) of the query's terms.
+        Summed over several indexes, it lets each score as if they were one
+        (see search's corpus)."""
+        terms = [term for term in set(tokenize(query)) if term in self._postings]
+        if self._df_stale:
+            doc_freqs = self._doc_freqs(terms)
+        else:
+            doc_freqs = {term: self._df[term] for term in terms}
+        return self.num_docs, self.total_len, doc_freqs
+
+    # --------------------------- query --------------------------
+    def search(self, query, top_k=5, allowed=None, corpus=None):
+        """BM25 top_k as (doc IDs, scores), best first.
+        allowed: optional sorted array of the only doc IDs that may match.
+        corpus: term_stats summed over every index of a collection, to score
+        with the collection's IDF and average length instead of this index's."""
+        terms = [t for t in set(tokenize(query)) if t in self._postings]
+        if not terms or not self.num_docs:
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32')
+
+        if corpus is None:
+            num_docs, doc_freqs, norm = self.num_docs, self._df, self._norm
+        else:
+            num_docs, total_len, doc_freqs = corpus
+            norm = self._corpus_norms(total_len / max(num_docs, 1))
+        idf = {term: _idf(max(num_docs, 1), doc_freqs[term]) for term in terms}
+
+        # Each term adds its weight to the score of every doc it's in
+        scores = np.zeros(len(norm), dtype='float32')
+        for term in terms:
+            docs, tfs = self._postings[term]
+            weights = np.take(norm, docs)
+            weights += tfs
+            np.divide(tfs, weights, out=weights)
+            weights *= idf[term] * (K1 + 1)
+            scores[docs] += weights   # a term's postings list each doc once
+
+        if allowed is not None:
+            allowed = np.asarray(allowed)
+            allowed = allowed[allowed < len(scores)]
+            scores = scores[allowed]
+        # Common terms match most docs: cut to the top_k scores before sorting
+        keep = scores > 0
+        if len(scores) > top_k:
+            keep &= scores >= np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        docs = np.flatnonzero(keep)
+        scores = scores[docs]
+        if allowed is not None:
+            docs = allowed[docs]
+        order = np.lexsort((docs, -scores))[:top_k]
+        return docs[order].astype('int64'), scores[order]
+
+    def _corpus_norms(self, avg_len):
+        """Length norms for a collection's average length (kept for the next query)"""
+        cached = self._corpus_norm
+        if cached is not None and cached[0] == avg_len and len(cached[1]) == len(self._norm):
+            return cached[1]
+        norm = self._norms(avg_len)
+        self._corpus_norm = (avg_len, norm)
+        return norm
+
+    # ------------------------ persistence -----------------------
+    def save(self, path):
+        """Write the index to a folder: postings added since it was loaded from
+        `path` go in a delta segment (see segments_to_merge) next to hard links
+        of the saved ones; without a saved copy, every posting is written."""
+        os.makedirs(path, exist_ok=True)
+        merge = self._segments_to_merge()
+        if merge is None:
+            _write_postings(path, self._postings)
+        else:
+            segment_path = link_segments(self.path, path, merge)
+            postings = {}
+            merged = segment_dirs(self.path)
+            for folder in merged[len(merged) - merge:]:
+                for term, docs, tfs in _read_postings(folder):
+                    _extend(postings, term, docs, tfs)
+            for term, start in self._saved.items():
+                docs, tfs = self._postings[term]
+                _extend(postings, term, docs[start:], tfs[start:])
+            _write_postings(segment_path, postings)
+        _save_array(os.path.join(path, "doc_len.npy"), self._doc_len)
+
+    def _segments_to_merge(self):
+        """How many saved delta segments save() rewrites along with the new
+        postings, or None to write the whole index"""
+        if self.path is None or not LexicalIndex.exists(self.path):
+            return None
+        sizes = [len(np.load(os.path.join(folder, "docs.npy"), mmap_mode='r'))
+                 for folder in [self.path] + segment_dirs(self.path)]
+        new = sum(len(self._postings[term][0]) - start for term, start in self._saved.items())
+        merge = segments_to_merge(sizes, new)
+        return None if merge == len(sizes) else merge
+
+    def mark_saved(self, path):
+        """Record that everything in the index is now saved in path"""
+        self.path = path
+        self._saved = {}
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, "terms.json"))
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index; postings are memory-mapped (a term's postings
+        spread over delta segments are joined in memory)"""
+        index = cls()
+        for folder in [path] + segment_dirs(path):
+            for term, docs, tfs in _read_postings(folder):
+                _extend(index._postings, term, docs, tfs)
+        index._doc_len = np.array(np.load(os.path.join(path, "doc_len.npy")), dtype='int32')
+        index.num_docs = int((index._doc_len > 0).sum())
+        index.total_len = int(index._doc_len[index._doc_len > 0].sum())
+        index.path = path
+        index._df_stale = True   # counted by finalize(), skipping removed docs
+        index.finalize()
+        return index
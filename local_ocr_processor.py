@@ -1,29 +1,65 @@
+import io
 import os
-import pytesseract
-from PIL import Image
+
+try:
+    from .lazy_imports import lazy_import
+    from .extraction_cache import ExtractionCache
+except ImportError:
+    from lazy_imports import lazy_import
+    from extraction_cache import ExtractionCache
+
+# Tesseract bindings and Pillow are imported when the first image is OCR'd
+pytesseract = lazy_import("pytesseract")
+Image = lazy_import("PIL.Image")
+
+# Use config for better accuracy with textbooks
+OCR_LANG = 'eng'
+OCR_CONFIG = r'--oem 3 --psm 6'
 
 class LocalOCRProcessor:
     """CPU-based OCR using Tesseract - No API limits!"""
     
+    def __init__(self, cache=None):
+        # Images OCR'd before are served from the cache
+        # (shared with the other processors; cache=False turns it off)
+        if cache is None:
+            cache = ExtractionCache()
+        self.cache = cache if cache is not False else None
+    
     def extract_text_from_image(self, image_path):
         """Extract text using local Tesseract OCR"""
         try:
-            img = Image.open(image_path)
+            config = f"lang={OCR_LANG};{OCR_CONFIG}"
+            file_hash = self.cache.file_hash(image_path) if self.cache is not None else None
+            if file_hash:
+                cached = self.cache.get_document(file_hash, 'tesseract', config)
+                if cached is not None:
+                    return cached[0] or None
             
-            # Use config for better accuracy with textbooks
-            custom_config = r'--oem 3 --psm 6'
-            text = pytesseract.image_to_string(img, lang='eng', config=custom_config)
+            text = self.ocr_image(Image.open(image_path))
             
-            return text.strip() if text else None
+            if file_hash:
+                self.cache.put_document(file_hash, 'tesseract', config, [text])
+            return text or None
         
         except Exception as e:
             print(f"Error processing {image_path}: {e}")
             return None
     
-    def process_book_folder(self, folder_path, delay=0, resume=True):
-        """Process all images - NO RATE LIMITS! 
-        Parameters match OCRProcessor for drop-in replacement"""
-        extracted_texts = []
+    def ocr_image(self, img):
+        """Tesseract text of a PIL image ('' if it has none)"""
+        text = pytesseract.image_to_string(img, lang=OCR_LANG, config=OCR_CONFIG)
+        return text.strip() if text else ''
+    
+    def extract_text_from_png(self, data):
+        """OCR an image held in memory, e.g. a rasterized PDF page"""
+        return self.ocr_image(Image.open(io.BytesIO(data)))
+    
+    def iter_pages(self, folder_path, progress=None):
+        """Yield a record per image as soon as it's OCR'd.
+        progress(message) receives the progress messages (default: print)"""
+        say = progress or print
+        count = 0
         
         image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
         image_files = [f for f in os.listdir(folder_path) 
@@ -31,26 +67,28 @@ class LocalOCRProcessor:
         
         image_files.sort()
         
-        print(f"🚀 Processing {len(image_files)} images with local OCR...")
-        print("⚡ No rate limits! Processing at full speed!\n")
+        say(f"🚀 Processing {len(image_files)} images with local OCR...")
+        say("⚡ No rate limits! Processing at full speed!\n")
         
         for idx, filename in enumerate(image_files, 1):
             image_path = os.path.join(folder_path, filename)
-            print(f"[{idx}/{len(image_files)}] {filename}...", end=" ", flush=True)
             
             text = self.extract_text_from_image(image_path)
+            say(f"[{idx}/{len(image_files)}] {filename}... {'✅' if text else '⚠️'}")
             if text:
-                extracted_texts.append({
+                count += 1
+                yield {
                     'filename': filename,
                     'text': text,
                     'page_number': idx
-                })
-                print("✅")
-            else:
-                print("⚠️")
+                }
         
-        print(f"\n✅ Processed {len(extracted_texts)} images!")
-        return extracted_texts
+        say(f"\n✅ Processed {count} images!")
+    
+    def process_book_folder(self, folder_path, delay=0, resume=True, progress=None):
+        """Process all images - NO RATE LIMITS! 
+        Parameters match OCRProcessor for drop-in replacement"""
+        return list(self.iter_pages(folder_path, progress))
 
 # Alias for drop-in replacement
 OCRProcessor = LocalOCRProcessor
@@ -1,12 +1,21 @@
 import os
 import time
 import json
-import google.generativeai as genai
-from PIL import Image
 from dotenv import load_dotenv
 
+try:
+    from .lazy_imports import lazy_import
+except ImportError:
+    from lazy_imports import lazy_import
+
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+# Gemini is imported (and configured) the first time a model is created
+genai = lazy_import(
+    "google.generativeai",
+    on_load=lambda module: module.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+)
+Image = lazy_import("PIL.Image")
 
 class OCRProcessor:
     def __init__(self):
@@ -30,8 +39,11 @@ class OCRProcessor:
             print(f"Error processing {image_path}: {e}")
             return None
     
-    def process_book_folder(self, folder_path, delay=5, resume=True):
-        """Process all images in the books folder with rate limiting and resume capability"""
+    def iter_pages(self, folder_path, delay=5, resume=True, progress=None):
+        """Yield a record per image as soon as it's extracted, with rate limiting
+        and resume capability (pages from an interrupted run come first).
+        progress(message) receives the progress messages (default: print)"""
+        say = progress or print
         
         # Progress file to resume if interrupted
         progress_file = os.path.join(folder_path, ".ocr_progress.json")
@@ -45,9 +57,10 @@ class OCRProcessor:
                     data = json.load(f)
                     extracted_texts = data['extracted_texts']
                     processed_files = set(data['processed_files'])
-                    print(f"📂 Resuming from previous session ({len(processed_files)} already done)")
+                    say(f"📂 Resuming from previous session ({len(processed_files)} already done)")
             except:
-                print("⚠️  Could not load progress, starting fresh")
+                say("⚠️  Could not load progress, starting fresh")
+        yield from extracted_texts
         
         # Get all image files
         image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
@@ -60,17 +73,17 @@ class OCRProcessor:
         remaining_files = [f for f in image_files if f not in processed_files]
         
         if not remaining_files:
-            print("✅ All files already processed!")
-            return extracted_texts
+            say("✅ All files already processed!")
+            return
         
-        print(f"Found {len(remaining_files)} images to process (out of {len(image_files)} total)")
-        print(f"⏱️  Rate limit protection: {delay}s delay between requests\n")
+        say(f"Found {len(remaining_files)} images to process (out of {len(image_files)} total)")
+        say(f"⏱️  Rate limit protection: {delay}s delay between requests\n")
         
         for idx, filename in enumerate(remaining_files, 1):
             image_path = os.path.join(folder_path, filename)
             page_num = image_files.index(filename) + 1
             
-            print(f"Processing [{idx}/{len(remaining_files)}] Page {page_num}: {filename}", end=" ")
+            status = f"Processing [{idx}/{len(remaining_files)}] Page {page_num}: {filename}"
             
             # Retry logic for rate limits
             max_retries = 3
@@ -78,11 +91,12 @@ class OCRProcessor:
                 try:
                     text = self.extract_text_from_image(image_path)
                     if text:
-                        extracted_texts.append({
+                        record = {
                             'filename': filename,
                             'text': text,
                             'page_number': page_num
-                        })
+                        }
+                        extracted_texts.append(record)
                         processed_files.add(filename)
                         
                         # Save progress after each successful extraction
@@ -92,35 +106,39 @@ class OCRProcessor:
                                 'processed_files': list(processed_files)
                             }, f)
                         
-                        print("✅")
+                        say(f"{status} ✅")
+                        yield record
                     else:
-                        print("⚠️ No text extracted")
+                        say(f"{status} ⚠️ No text extracted")
                     break  # Success, exit retry loop
                     
                 except Exception as e:
                     if "429" in str(e) or "quota" in str(e).lower():
                         wait_time = delay * (attempt + 1) * 2  # Exponential backoff
-                        print(f"\n⏳ Rate limit hit! Waiting {wait_time}s...")
+                        say(f"{status}\n⏳ Rate limit hit! Waiting {wait_time}s...")
                         time.sleep(wait_time)
                         if attempt == max_retries - 1:
-                            print(f"❌ Failed after {max_retries} attempts")
-                            print(f"💾 Progress saved! Run again to resume from here.")
-                            return extracted_texts
+                            say(f"❌ Failed after {max_retries} attempts")
+                            say(f"💾 Progress saved! Run again to resume from here.")
+                            return
                     else:
-                        print(f"❌ Error: {e}")
+                        say(f"{status} ❌ Error: {e}")
                         break
             
             # Add delay between requests (except after last image)
             if idx < len(remaining_files):
-                print(f"⏱️  Waiting {delay}s...", end="\r")
+                say(f"⏱️  Waiting {delay}s...")
                 time.sleep(delay)
         
         # Clean up progress file on completion
         if os.path.exists(progress_file):
             os.remove(progress_file)
         
-        print(f"\n✅ Successfully processed {len(extracted_texts)}/{len(image_files)} images!")
-        return extracted_texts
+        say(f"\n✅ Successfully processed {len(extracted_texts)}/{len(image_files)} images!")
+    
+    def process_book_folder(self, folder_path, delay=5, resume=True, progress=None):
+        """Process all images in the books folder with rate limiting and resume capability"""
+        return list(self.iter_pages(folder_path, delay, resume, progress))
 
 if __name__ == "__main__":
     # Test the OCR
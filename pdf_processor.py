@@ -1,17 +1,409 @@
+import gc
 import os
+import sys
 import json
-import PyPDF2
-import pdfplumber
-from PIL import Image
-import io
+import time
+import contextlib
+import collections
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .lazy_imports import lazy_import
+    from .extraction_cache import ExtractionCache
+    from .local_ocr_processor import LocalOCRProcessor, OCR_LANG, OCR_CONFIG
+except ImportError:
+    from lazy_imports import lazy_import
+    from extraction_cache import ExtractionCache
+    from local_ocr_processor import LocalOCRProcessor, OCR_LANG, OCR_CONFIG
+
+# PDF parsers are imported when the first PDF is opened
+fitz = lazy_import("fitz")          # PyMuPDF
+PyPDF2 = lazy_import("PyPDF2")
+pdfplumber = lazy_import("pdfplumber")
+
+# ============================================================
+#                  EXTRACTION ENGINES
+# ============================================================
+# 'pymupdf': fast; pages that look like tables/equations, or whose glyphs
+#            don't map to text, are re-extracted with pdfplumber (default)
+# 'pdfplumber': layout analysis on every page (slow)
+# 'pypdf2': plain text, pure Python
+METHODS = ('pymupdf', 'pdfplumber', 'pypdf2')
+DEFAULT_METHOD = 'pymupdf'
+
+# A page goes to pdfplumber when any of these is exceeded
+MAX_UNMAPPED_GLYPHS = 0.02   # share of characters PyMuPDF couldn't map (U+FFFD)
+MAX_MATH_CHARS = 0.04        # share of characters that are math symbols
+MAX_NUMERIC_LINES = 0.4      # share of lines that look like table rows of numbers
+MATH_CHARS = set("=+−×÷±∓∑∏∫∮√∞≈≠≤≥∝∂∆∇αβγδεθλμπρστφχψωΩ^_⁄·′″")
+
+# With 2+ workers, page ranges are extracted by a process pool
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+PAGES_PER_TASK = 16       # pages a worker extracts per task
+MIN_PARALLEL_PAGES = 32   # smaller PDFs aren't worth starting workers for
+
+# Scanned pages (images but no text layer) are rasterized with PyMuPDF and
+# OCR'd with Tesseract on a thread pool while the other pages are extracted
+OCR_SCANNED = os.getenv("PDF_OCR_SCANNED", "1") == "1"
+OCR_DPI = 300
+OCR_THREADS = max(1, min(4, os.cpu_count() or 1))
+MAX_QUEUED_SCANS = 2 * OCR_THREADS   # extraction waits once this many pages await OCR
+
+# Large-document mode: PDFs of LARGE_DOC_PAGES+ pages are read in windows of
+# PAGE_WINDOW pages, reopening the file per window so parser state is freed,
+# and extraction stops if the process grows past MAX_RSS_MB (0: no ceiling)
+LARGE_DOC_PAGES = int(os.getenv("PDF_LARGE_DOC_PAGES", "300"))
+PAGE_WINDOW = 50
+MAX_RSS_MB = int(os.getenv("PDF_MAX_RSS_MB", "0"))
+
+
+def _page_record(pdf_path, page_num, text, page_mapping):
+    """Record for one extracted page (None if it has no text)"""
+    if not text or not text.strip():
+        return None
+    return {
+        'filename': f"{os.path.basename(pdf_path)}_page_{page_num}",
+        'text': text.strip(),
+        # Custom page number from the mapping, or the sequential one
+        'page_number': page_mapping.get(f"page_{page_num}", page_num),
+        'pdf_page': page_num
+    }
+
+
+def _failed_record(pdf_path, error):
+    """Marks a PDF that failed after some of its pages were handed on: whoever
+    took them (e.g. the index) drops the PDF's pages again"""
+    return {
+        'filename': os.path.basename(pdf_path),
+        'text': '',
+        'page_number': None,
+        'failed': str(error)
+    }
+
+
+def complete_records(records):
+    """Page records without failure marks, or any page of a PDF that failed
+    partway (for callers that collect the records in a list)"""
+    records = list(records)
+    failed = {record['filename'] for record in records if record.get('failed')}
+    return [record for record in records if not record.get('failed')
+            and record['filename'].rsplit('_page_', 1)[0] not in failed]
+
+
+def engine_config(method, ocr=False):
+    """Settings that change an engine's output (part of the extraction cache key)"""
+    config = ''
+    if method == 'pymupdf':
+        config = f"glyphs={MAX_UNMAPPED_GLYPHS};math={MAX_MATH_CHARS};tables={MAX_NUMERIC_LINES}"
+    if ocr:
+        config += f";ocr={OCR_DPI}dpi,{OCR_LANG},{OCR_CONFIG}"
+    return config
+
+
+def _page_count(pdf_path, method):
+    if method == 'pymupdf':
+        with fitz.open(pdf_path) as doc:
+            return len(doc)
+    if method == 'pdfplumber':
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def needs_layout(text):
+    """Why PyMuPDF's text of a page should be replaced by pdfplumber's
+    ('glyphs', 'equations' or 'tables'), or None if it will do"""
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return None
+    if text.count('\ufffd') / len(chars) > MAX_UNMAPPED_GLYPHS:
+        return 'glyphs'
+    if sum(c in MATH_CHARS for c in chars) / len(chars) > MAX_MATH_CHARS:
+        return 'equations'
+    lines = [line.split() for line in text.splitlines() if line.strip()]
+    numeric = sum(
+        len(words) >= 3 and sum(any(ch.isdigit() for ch in w) for w in words) * 2 >= len(words)
+        for words in lines
+    )
+    if lines and numeric / len(lines) > MAX_NUMERIC_LINES:
+        return 'tables'
+    return None
+
+
+def new_stats():
+    """Per-engine page timings: {'engines': {engine: {'pages', 'seconds'}},
+    'routed': {reason: pages sent from PyMuPDF to pdfplumber}}"""
+    return {'engines': {}, 'routed': {}}
+
+
+def merge_stats(into, stats):
+    for engine, timing in stats['engines'].items():
+        total = into['engines'].setdefault(engine, {'pages': 0, 'seconds': 0.0})
+        total['pages'] += timing['pages']
+        total['seconds'] += timing['seconds']
+    for reason, count in stats['routed'].items():
+        into['routed'][reason] = into['routed'].get(reason, 0) + count
+
+
+def _timed(stats, engine, started):
+    timing = stats['engines'].setdefault(engine, {'pages': 0, 'seconds': 0.0})
+    timing['pages'] += 1
+    timing['seconds'] += time.perf_counter() - started
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux), else None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _release_page(page):
+    """Drop the parsed objects and layout cache pdfplumber keeps per page"""
+    release = getattr(page, 'close', None) or getattr(page, 'flush_cache', None)
+    if release:
+        release()
+
+
+def _release_memory():
+    """Collect freed parser objects and empty MuPDF's object store"""
+    gc.collect()
+    if 'fitz' in sys.modules:
+        fitz.TOOLS.store_shrink(100)
+
+
+def _check_rss(max_rss_mb, pdf_path):
+    """Raise MemoryError if the process is above the RSS ceiling even after
+    releasing what it can (better than being killed by the container)"""
+    if not max_rss_mb:
+        return
+    rss = current_rss_mb()
+    if rss is None or rss <= max_rss_mb:
+        return
+    _release_memory()
+    rss = current_rss_mb()
+    if rss > max_rss_mb:
+        raise MemoryError(f"{rss:.0f} MB in use, over the {max_rss_mb} MB ceiling, "
+                          f"while extracting {os.path.basename(pdf_path)}")
+
+
+def _iter_pages(pdf_path, method, start, end, stats, window=None, max_rss_mb=0):
+    """Yield (page_num, text) for pages [start, end) of a PDF (page_num is
+    1-based), timing each engine into stats. With a window, the pages are
+    read window pages at a time, each window through freshly opened files,
+    with memory released in between. RSS is checked against max_rss_mb
+    after every window."""
+    window = window or max(1, end - start)
+    for low in range(start, end, window):
+        high = min(low + window, end)
+        yield from _iter_window(pdf_path, method, low, high, stats)
+        if high < end:
+            _release_memory()
+        _check_rss(max_rss_mb, pdf_path)
+
+
+def _iter_window(pdf_path, method, start, end, stats):
+    if method == 'pymupdf':
+        yield from _iter_pymupdf(pdf_path, start, end, stats)
+    elif method == 'pdfplumber':
+        # Only the window's pages are loaded; each is released once read
+        with pdfplumber.open(pdf_path, pages=list(range(start + 1, end + 1))) as pdf:
+            for page_num, page in enumerate(pdf.pages, start + 1):
+                started = time.perf_counter()
+                text = page.extract_text()
+                _release_page(page)
+                _timed(stats, 'pdfplumber', started)
+                yield page_num, text
+    else:
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page_num in range(start + 1, end + 1):
+                started = time.perf_counter()
+                text = pdf_reader.pages[page_num - 1].extract_text()
+                _timed(stats, 'pypdf2', started)
+                yield page_num, text
+
+
+def _iter_pymupdf(pdf_path, start, end, stats):
+    """PyMuPDF text, with complex pages re-extracted by pdfplumber
+    (opened only once a page needs it)"""
+    plumber = None
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page_num in range(start + 1, end + 1):
+                started = time.perf_counter()
+                text = doc[page_num - 1].get_text("text")
+                reason = needs_layout(text)
+                _timed(stats, 'pymupdf', started)
+
+                if reason and plumber is not False:
+                    started = time.perf_counter()
+                    if plumber is None:
+                        try:
+                            plumber = pdfplumber.open(pdf_path, pages=list(range(start + 1, end + 1)))
+                        except ImportError:
+                            print("⚠️  pdfplumber isn't installed: complex pages keep PyMuPDF's text")
+                            plumber = False
+                            yield page_num, text
+                            continue
+                    page = plumber.pages[page_num - start - 1]
+                    text = page.extract_text()
+                    _release_page(page)
+                    _timed(stats, 'pdfplumber', started)
+                    stats['routed'][reason] = stats['routed'].get(reason, 0) + 1
+                yield page_num, text
+    finally:
+        if plumber:
+            plumber.close()
+
+
+class _ScanRenderer:
+    """Rasterizes the scanned pages of one PDF. The file is opened on first
+    use and, with a window, reopened for every window of pages from start,
+    like the text extraction (see _iter_pages)."""
+
+    def __init__(self, pdf_path, start=0, window=None):
+        self.pdf_path = pdf_path
+        self.start = start
+        self.window = window
+        self._doc = None
+        self._doc_window = None   # window the open file was opened for
+
+    def render(self, page_num):
+        """PNG of a page without text if it holds images (a scan), else None"""
+        window = (page_num - 1 - self.start) // self.window if self.window else 0
+        if self._doc is not None and window != self._doc_window:
+            self.close()
+        if self._doc is None:
+            self._doc = fitz.open(self.pdf_path)
+            self._doc_window = window
+        page = self._doc[page_num - 1]
+        if not page.get_images():
+            return None
+        return page.get_pixmap(dpi=OCR_DPI).tobytes("png")
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+
+def _ocr_page(ocr, page_num, png):
+    """(text, seconds) for one rasterized page ('' if OCR fails)"""
+    started = time.perf_counter()
+    try:
+        text = ocr.extract_text_from_png(png)
+    except Exception as e:
+        print(f"⚠️  OCR failed on page {page_num}: {e}")
+        text = ''
+    return text, time.perf_counter() - started
+
+
+def _extract_pages(pdf_path, method, start, end, stats, ocr_threads=0, on_scan=None,
+                   window=None, max_rss_mb=0):
+    """
+    Yield (page_num, text) for pages [start, end) of a PDF, in page order
+    ('' for empty pages). With ocr_threads, scanned pages are OCR'd on that
+    many threads while the following pages are extracted; on_scan(page_num)
+    is called when a page is queued for OCR. window and max_rss_mb are
+    passed on to _iter_pages.
+    """
+    pending = collections.deque()   # (page_num, text, OCR future, seconds spent rasterizing)
+    scans = 0                       # pending pages that are scans
+    renderer = executor = None
+    try:
+        for page_num, text in _iter_pages(pdf_path, method, start, end, stats,
+                                          window, max_rss_mb):
+            text = text or ''
+            future, render_seconds = None, 0.0
+            if ocr_threads and not text.strip():
+                started = time.perf_counter()
+                renderer = renderer or _ScanRenderer(pdf_path, start, window)
+                png = renderer.render(page_num)
+                if png is not None:
+                    if executor is None:
+                        executor = ThreadPoolExecutor(ocr_threads)
+                        ocr = LocalOCRProcessor(cache=False)
+                    future = executor.submit(_ocr_page, ocr, page_num, png)
+                    render_seconds = time.perf_counter() - started
+                    if on_scan:
+                        on_scan(page_num)
+            pending.append((page_num, text, future, render_seconds))
+            scans += future is not None
+
+            # Pages behind a scan wait for its OCR, so the order is kept;
+            # at most MAX_QUEUED_SCANS page images are held at a time
+            while pending and (pending[0][2] is None or pending[0][2].done()
+                               or scans > MAX_QUEUED_SCANS):
+                entry = pending.popleft()
+                scans -= entry[2] is not None
+                yield _finish_page(entry, stats)
+
+        while pending:
+            yield _finish_page(pending.popleft(), stats)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if renderer is not None:
+            renderer.close()
+
+
+def _finish_page(entry, stats):
+    """(page_num, text) of a pending page, waiting for its OCR if it's a scan"""
+    page_num, text, future, render_seconds = entry
+    if future is not None:
+        text, ocr_seconds = future.result()
+        timing = stats['engines'].setdefault('ocr', {'pages': 0, 'seconds': 0.0})
+        timing['pages'] += 1
+        timing['seconds'] += render_seconds + ocr_seconds
+    return page_num, text
+
+
+def _extract_range(task):
+    """Worker: extract pages [start, end) of one PDF through its own file handle.
+    Returns (start, end, page texts, stats, error)."""
+    pdf_path, method, start, end, ocr_threads, max_rss_mb = task
+    stats = new_stats()
+    try:
+        texts = [text for _, text in _extract_pages(pdf_path, method, start, end, stats,
+                                                    ocr_threads, max_rss_mb=max_rss_mb)]
+    except MemoryError:
+        raise   # over the RSS ceiling: stops the whole build (see PDFProcessor._iter_pdf)
+    except Exception as e:
+        return start, end, [], stats, str(e)
+    return start, end, texts, stats, None
+
 
 class PDFProcessor:
     """
     Extract text from PDF files using multiple methods for best results
     """
     
-    def __init__(self):
+    def __init__(self, workers=None, method=DEFAULT_METHOD, cache=None, ocr_scanned=None,
+                 large_doc_pages=None, max_rss_mb=None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown extraction method: {method} (choose from {METHODS})")
         self.page_mapping = self._load_page_mapping()
+        self.method = method
+        # Text of files extracted before is served from the cache
+        # (shared with the other processors; cache=False turns it off)
+        if cache is None:
+            cache = ExtractionCache()
+        self.cache = cache if cache is not False else None
+        # Opt-in: with 2+ workers, pages are split across processes
+        self.workers = PDF_WORKERS if workers is None else workers
+        # Scanned pages are OCR'd instead of dropped as empty
+        self.ocr_scanned = OCR_SCANNED if ocr_scanned is None else ocr_scanned
+        # Big books are read in page windows, under an optional RSS ceiling
+        # (per process: each extraction worker has its own)
+        self.large_doc_pages = LARGE_DOC_PAGES if large_doc_pages is None else large_doc_pages
+        self.max_rss_mb = MAX_RSS_MB if max_rss_mb is None else max_rss_mb
+        # Time spent per engine, over every PDF this processor extracted
+        self.stats = new_stats()
     
     def _load_page_mapping(self):
         """Load page number mapping from JSON file if it exists"""
@@ -26,116 +418,272 @@ class PDFProcessor:
                 print(f"⚠️  Could not load page mapping: {e}")
         return {}
     
-    def extract_text_from_pdf(self, pdf_path, method='pdfplumber'):
+    def extract_text_from_pdf(self, pdf_path, method=None, progress=None):
         """
         Extract text from PDF using specified method
         
         Methods:
-        - 'pdfplumber': Best for complex layouts, tables, equations (default)
-        - 'pypdf2': Faster, good for simple text
+        - 'pymupdf': Fast; complex pages are handed to pdfplumber (default)
+        - 'pdfplumber': Best for complex layouts, tables, equations
+        - 'pypdf2': Good for simple text
+        
+        progress(message) receives the progress messages (default: print)
         """
+        method = method or self.method
+        say = progress or print
+        if self.workers > 1:
+            try:
+                parallel = (self._cached_texts(pdf_path, method) is None
+                            and _page_count(pdf_path, method) >= MIN_PARALLEL_PAGES)
+            except Exception as e:
+                say(f"❌ Error extracting from {pdf_path}: {e}")
+                return []
+            if parallel:
+                with self._worker_pool(say) as pool:
+                    return complete_records(next(self._extract_parallel([pdf_path], method,
+                                                                        pool, say)))
+        return complete_records(self._iter_pdf(pdf_path, method, say))
+    
+    def _iter_pdf(self, pdf_path, method, say):
+        """Yield a PDF's page records as they are extracted (or from the cache).
+        If it fails partway, a failure mark (see _failed_record) follows the
+        pages already yielded.
+        Going over the RSS ceiling (MemoryError) isn't one PDF's failure: it is
+        raised, so the index being built or updated is abandoned as a whole."""
+        yielded = False
         try:
-            if method == 'pdfplumber':
-                return self._extract_with_pdfplumber(pdf_path)
-            else:
-                return self._extract_with_pypdf2(pdf_path)
+            texts = self._cached_texts(pdf_path, method)
+            if texts is not None:
+                say(f"🗄️  {len(texts)} pages from the extraction cache")
+                yield from self._records(pdf_path, texts)
+                return
+            for record in self._iter_serial(pdf_path, method, say):
+                yielded = True
+                yield record
+        except MemoryError:
+            raise
         except Exception as e:
-            print(f"❌ Error extracting from {pdf_path}: {e}")
-            return []
+            say(f"❌ Error extracting from {pdf_path}: {e}")
+            if yielded:
+                yield _failed_record(pdf_path, e)
     
-    def _extract_with_pdfplumber(self, pdf_path):
-        """Extract using pdfplumber (better for complex layouts)"""
-        extracted_texts = []
+    def _cached_texts(self, pdf_path, method):
+        """Page texts of a PDF extracted before with the same engine settings, or None"""
+        if self.cache is None:
+            return None
+        return self.cache.get_document(self.cache.file_hash(pdf_path), method,
+                                       engine_config(method, self.ocr_scanned))
+
+    def _store_texts(self, pdf_path, method, texts):
+        if self.cache is not None:
+            self.cache.put_document(self.cache.file_hash(pdf_path), method,
+                                    engine_config(method, self.ocr_scanned), texts)
+
+    def _ocr_threads(self, workers=1):
+        """OCR threads per extracting process (0: scanned pages stay empty)"""
+        return max(1, OCR_THREADS // workers) if self.ocr_scanned else 0
+    
+    def _records(self, pdf_path, texts, first_page=1):
+        """Page records for a PDF's page texts (empty pages skipped)"""
+        records = [_page_record(pdf_path, page_num, text, self.page_mapping)
+                   for page_num, text in enumerate(texts, first_page)]
+        return [record for record in records if record]
+
+    def _iter_serial(self, pdf_path, method, say):
+        """Extract every page in this process, yielding records in page order
+        (scanned pages are OCR'd on threads meanwhile)"""
+        total_pages = _page_count(pdf_path, method)
+        say(f"📄 Processing {total_pages} pages from PDF...")
+        window = PAGE_WINDOW if total_pages >= self.large_doc_pages else None
+        if window:
+            ceiling = f", RSS ceiling {self.max_rss_mb} MB" if self.max_rss_mb else ""
+            say(f"🪟 Large document: reading {window}-page windows{ceiling}")
         
-        with pdfplumber.open(pdf_path) as pdf:
-            total_pages = len(pdf.pages)
-            print(f"📄 Processing {total_pages} pages from PDF...")
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                # Get custom page number from mapping, or use sequential
-                actual_page = self.page_mapping.get(f"page_{page_num}", page_num)
-                
-                print(f"  [{page_num}/{total_pages}] Page {actual_page}...", end=" ", flush=True)
-                
-                # Extract text
-                text = page.extract_text()
-                
-                if text and text.strip():
-                    extracted_texts.append({
-                        'filename': f"{os.path.basename(pdf_path)}_page_{page_num}",
-                        'text': text.strip(),
-                        'page_number': actual_page,
-                        'pdf_page': page_num
-                    })
-                    print("✅")
-                else:
-                    print("⚠️ (empty)")
+        def page_line(page_num, status):
+            actual_page = self.page_mapping.get(f"page_{page_num}", page_num)
+            say(f"  [{page_num}/{total_pages}] Page {actual_page}... {status}")
+        
+        stats = new_stats()
+        page_texts = []
+        try:
+            for page_num, text in _extract_pages(
+                    pdf_path, method, 0, total_pages, stats, self._ocr_threads(),
+                    on_scan=lambda page_num: page_line(page_num, "🖼️ (scanned, queued for OCR)"),
+                    window=window, max_rss_mb=self.max_rss_mb):
+                if self.cache is not None:
+                    page_texts.append(text)   # stored in the cache once the PDF is done
+                record = _page_record(pdf_path, page_num, text, self.page_mapping)
+                page_line(page_num, "✅" if record else "⚠️ (empty)")
+                if record:
+                    yield record
+        finally:
+            merge_stats(self.stats, stats)
+        
+        scanned = stats['engines'].get('ocr', {}).get('pages', 0)
+        if scanned:
+            say(f"🖼️  OCR'd {scanned} scanned pages")
+        self._store_texts(pdf_path, method, page_texts)
+    
+    @contextlib.contextmanager
+    def _worker_pool(self, say=print):
+        """Extraction worker processes ('spawn': parsers aren't fork-safe).
+        Stopped at once if extraction is abandoned."""
+        say(f"🧵 Starting {self.workers} extraction workers...")
+        pool = mp.get_context('spawn').Pool(self.workers)
+        try:
+            yield pool
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    
+    def _extract_parallel(self, pdf_paths, method, pool, say=print):
+        """
+        Yield, for each PDF in order, a generator of its page records, with
+        all page ranges queued on the pool up front (so small PDFs overlap
+        too). Workers open their own handles; ranges come back in page
+        order. Each generator must be used up before the next one.
+        """
+        tasks, plans = [], []
+        for pdf_path in pdf_paths:
+            try:
+                cached = self._cached_texts(pdf_path, method)
+                if cached is not None:
+                    plans.append((pdf_path, len(cached), 0, None, cached))
+                    continue
+                total_pages = _page_count(pdf_path, method)
+            except Exception as e:
+                plans.append((pdf_path, 0, 0, str(e), None))
+                continue
+            ocr_threads = self._ocr_threads(self.workers)
+            ranges = [(pdf_path, method, start, min(start + PAGES_PER_TASK, total_pages),
+                       ocr_threads, self.max_rss_mb)
+                      for start in range(0, total_pages, PAGES_PER_TASK)]
+            tasks.extend(ranges)
+            plans.append((pdf_path, total_pages, len(ranges), None, None))
         
-        return extracted_texts
+        results = pool.imap(_extract_range, tasks)
+        for plan in plans:
+            yield self._iter_ranges(plan, method, results, say)
     
-    def _extract_with_pypdf2(self, pdf_path):
-        """Extract using PyPDF2 (faster, simpler)"""
-        extracted_texts = []
+    def _iter_ranges(self, plan, method, results, say):
+        """Yield one PDF's records as its page ranges come back from the pool
+        (followed by a failure mark if a range failed after some were yielded)"""
+        pdf_path, total_pages, task_count, error, cached = plan
+        if cached is not None:
+            say(f"🗄️  {total_pages} pages from the extraction cache")
+            yield from self._records(pdf_path, cached)
+            return
         
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            total_pages = len(pdf_reader.pages)
-            print(f"📄 Processing {total_pages} pages from PDF...")
-            
-            for page_num in range(total_pages):
-                actual_page = self.page_mapping.get(f"page_{page_num + 1}", page_num + 1)
-                
-                print(f"  [{page_num + 1}/{total_pages}] Page {actual_page}...", end=" ", flush=True)
-                
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
-                
-                if text and text.strip():
-                    extracted_texts.append({
-                        'filename': f"{os.path.basename(pdf_path)}_page_{page_num + 1}",
-                        'text': text.strip(),
-                        'page_number': actual_page,
-                        'pdf_page': page_num + 1
-                    })
-                    print("✅")
-                else:
-                    print("⚠️ (empty)")
+        say(f"📄 Processing {total_pages} pages from PDF ({self.workers} workers)...")
+        page_texts = []
+        yielded = False
+        for _ in range(task_count):
+            start, end, texts, stats, range_error = next(results)
+            merge_stats(self.stats, stats)
+            error = error or range_error
+            if error:
+                continue   # the PDF's remaining ranges are still drained
+            page_texts.extend(texts)
+            say(f"  [{end}/{total_pages}] Pages {start + 1}-{end} ✅ "
+                f"({sum(bool(text.strip()) for text in texts)} with text)")
+            for record in self._records(pdf_path, texts, first_page=start + 1):
+                yielded = True
+                yield record
         
-        return extracted_texts
+        if error:
+            say(f"❌ Error extracting from {pdf_path}: {error}")
+            if yielded:
+                yield _failed_record(pdf_path, error)
+            return
+        self._store_texts(pdf_path, method, page_texts)
     
-    def process_book_folder(self, folder_path, delay=0, resume=True):
+    def timing_report(self):
+        """Pages, total seconds and ms/page per engine, plus why pages were
+        routed from PyMuPDF to pdfplumber"""
+        engines = {
+            engine: {
+                'pages': timing['pages'],
+                'seconds': round(timing['seconds'], 3),
+                'ms_per_page': round(1000 * timing['seconds'] / timing['pages'], 2)
+            }
+            for engine, timing in self.stats['engines'].items() if timing['pages']
+        }
+        return {'engines': engines, 'routed': dict(self.stats['routed'])}
+    
+    def print_timing_report(self, say=print):
+        report = self.timing_report()
+        say("\n⏱️  Extraction time per engine:")
+        for engine, timing in report['engines'].items():
+            say(f"   {engine:<10} {timing['pages']:>6} pages  {timing['seconds']:>8.2f}s  "
+                  f"{timing['ms_per_page']:>8.2f} ms/page")
+        if report['routed']:
+            reasons = ", ".join(f"{reason} {count}" for reason, count in report['routed'].items())
+            say(f"   Sent to pdfplumber: {reasons}")
+    
+    def iter_pages(self, folder_path, progress=None):
         """
-        Process all PDFs in the books folder
-        Compatible with existing OCR processor interface
+        Yield the page records of every PDF in a folder as they are extracted.
+        A PDF that fails partway is followed by a failure mark (its 'failed'
+        key holds the error): consumers must drop the pages it already yielded.
+        progress(message) receives the progress messages (default: print).
         """
-        all_extracted = []
+        say = progress or print
         
         # Get all PDF files
         pdf_files = [f for f in os.listdir(folder_path) 
                     if f.lower().endswith('.pdf')]
         
         if not pdf_files:
-            print("⚠️  No PDF files found in books/ folder")
-            return []
+            say("⚠️  No PDF files found in books/ folder")
+            return
         
         pdf_files.sort()
         
-        print(f"🚀 Found {len(pdf_files)} PDF file(s)")
-        print("⚡ Direct text extraction - Fast & accurate!\n")
+        say(f"🚀 Found {len(pdf_files)} PDF file(s)")
+        say("⚡ Direct text extraction - Fast & accurate!\n")
         
-        for idx, pdf_file in enumerate(pdf_files, 1):
-            pdf_path = os.path.join(folder_path, pdf_file)
-            print(f"\n📚 [{idx}/{len(pdf_files)}] Processing: {pdf_file}")
-            print("=" * 60)
+        total = 0
+        with contextlib.ExitStack() as stack:
+            parallel = None
+            if self.workers > 1:
+                pool = stack.enter_context(self._worker_pool(say))
+                pdf_paths = [os.path.join(folder_path, f) for f in pdf_files]
+                parallel = self._extract_parallel(pdf_paths, self.method, pool, say)
             
-            # Extract text from this PDF
-            texts = self.extract_text_from_pdf(pdf_path, method='pdfplumber')
-            all_extracted.extend(texts)
-            
-            print(f"✅ Extracted {len(texts)} pages from {pdf_file}")
+            for idx, pdf_file in enumerate(pdf_files, 1):
+                pdf_path = os.path.join(folder_path, pdf_file)
+                say(f"\n📚 [{idx}/{len(pdf_files)}] Processing: {pdf_file}")
+                say("=" * 60)
+                
+                # Extract text from this PDF
+                if parallel is not None:
+                    pages = next(parallel)
+                else:
+                    pages = self._iter_pdf(pdf_path, self.method, say)
+                count = 0
+                for record in pages:
+                    if record.get('failed'):
+                        count = 0
+                    else:
+                        count += 1
+                    yield record
+                total += count
+                
+                say(f"✅ Extracted {count} pages from {pdf_file}")
         
-        print(f"\n🎉 Total: Successfully processed {len(all_extracted)} pages!")
-        return all_extracted
+        say(f"\n🎉 Total: Successfully processed {total} pages!")
+        self.print_timing_report(say)
+    
+    def process_book_folder(self, folder_path, delay=0, resume=True, progress=None):
+        """
+        Process all PDFs in the books folder
+        Compatible with existing OCR processor interface
+        """
+        return complete_records(self.iter_pages(folder_path, progress))
 
 # Alias for drop-in replacement
 OCRProcessor = PDFProcessor
@@ -147,4 +695,4 @@ if __name__ == "__main__":
     if texts:
         print(f"\n--- Sample Output ---")
         print(f"First page preview:\n{texts[0]['text'][:500]}...")
-        print(f"\nTotal pages extracted: {len(texts)}")
\ No newline at end of file
+        print(f"\nTotal pages extracted: {len(texts)}")
@@ -7,6 +7,13 @@ import os
 import shutil
 import streamlit as st
 
+try:
+    from . import snapshots
+    from .extraction_cache import ExtractionCache
+except ImportError:
+    import snapshots
+    from extraction_cache import ExtractionCache
+
 # ============================================================
 #                   STORAGE UTILITIES
 # ============================================================
@@ -78,6 +85,15 @@ def clear_all_storage():
             st.error(f"Error clearing {dir_path}: {e}")
             success = False
     
+    # Text extracted from the deleted books
+    try:
+        cache = ExtractionCache()
+        cache.clear()
+        cache.close()
+    except Exception as e:
+        st.error(f"Error clearing the extraction cache: {e}")
+        success = False
+    
     return success
 
 
@@ -123,6 +139,7 @@ def render_record_manager():
         st.markdown("""
         - All uploaded books
         - Vector index
+        - Cached page text
         - Temporary files
         
         Chat history will be preserved.
@@ -135,9 +152,7 @@ def render_record_manager():
                 with st.spinner("Clearing storage..."):
                     if clear_all_storage():
                         # Reset tutor state
-                        st.session_state.tutor.vector_store.index = None
-                        st.session_state.tutor.vector_store.chunks = []
-                        st.session_state.tutor.vector_store.metadata = []
+                        st.session_state.tutor.vector_store.clear()
                         
                         st.session_state.confirm_clear = False
                         st.success("👷 All data cleared! Ready for new books.")
@@ -206,6 +221,10 @@ def get_detailed_storage_stats():
     # Check index
     index_dir = os.path.join(SCRIPT_DIR, "index")
     if os.path.exists(index_dir):
+        # The live index is in the snapshot CURRENT points at
+        current = snapshots.current_name(index_dir)
+        if current is not None:
+            index_dir = snapshots.snapshot_path(index_dir, current)
         index_file = os.path.join(index_dir, "faiss.index")
         if os.path.exists(index_file):
             stats['index']['exists'] = True
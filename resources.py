@@ -0,0 +1,55 @@
+"""
+Shared Resources for 3Ts Tutor
+Process-wide registry so every Streamlit session shares one embedding
+model and one loaded index instead of holding its own copies
+"""
+
+import threading
+
+try:
+    from .vector_store import VectorStore, DEFAULT_INDEX_DIR
+    from .embedders import EMBEDDING_MODEL, EMBEDDING_BACKEND, load_embedder
+    from .sharded_store import ShardedVectorStore, SHARDED_INDEX
+except ImportError:
+    from vector_store import VectorStore, DEFAULT_INDEX_DIR
+    from embedders import EMBEDDING_MODEL, EMBEDDING_BACKEND, load_embedder
+    from sharded_store import ShardedVectorStore, SHARDED_INDEX
+
+_lock = threading.RLock()
+_embedders = {}      # (model name, backend) -> embedding model
+_vector_stores = {}  # (index dir, sharded) -> VectorStore / ShardedVectorStore
+
+
+def get_embedder(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """The process-wide embedding model, loaded on first use"""
+    with _lock:
+        if (model_name, backend) not in _embedders:
+            print(f"Loading shared embedding model {model_name} ({backend})...")
+            _embedders[(model_name, backend)] = load_embedder(model_name, backend)
+        return _embedders[(model_name, backend)]
+
+
+def get_vector_store(index_dir=None, sharded=None):
+    """
+    The process-wide VectorStore for index_dir (a ShardedVectorStore with one
+    shard per book if sharded, by default if SHARDED_INDEX is set). The first
+    call loads the index; later calls hot-reload it if it was rebuilt on disk since.
+    """
+    index_dir = index_dir or DEFAULT_INDEX_DIR
+    sharded = SHARDED_INDEX if sharded is None else sharded
+    with _lock:
+        store = _vector_stores.get((index_dir, sharded))
+        if store is None:
+            store_class = ShardedVectorStore if sharded else VectorStore
+            store = store_class(index_dir, embedder_loader=get_embedder)
+            store.load_index()
+            _vector_stores[(index_dir, sharded)] = store
+            return store
+
+    store.reload_if_changed()
+    return store
+
+
+def reload_vector_store(index_dir=None, sharded=None):
+    """Force every session to pick up a freshly rebuilt index"""
+    return get_vector_store(index_dir, sharded).load_index()
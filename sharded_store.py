@@ -0,0 +1,457 @@
+"""
+Sharded Vector Store for 3Ts Tutor
+One VectorStore per book under index_dir/shards. A query fans out to the
+loaded shards on a thread pool (FAISS releases the GIL while it searches)
+and the per-shard top-k lists are merged with a heap. Hybrid search merges
+the dense and BM25 lists separately (BM25 scored with collection-wide
+statistics) and fuses them once. Books are built, dropped, loaded and
+unloaded one shard at a time.
+"""
+
+import os
+import re
+import json
+import heapq
+import shutil
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from .vector_store import (VectorStore, DEFAULT_INDEX_DIR, EMBEDDING_MODEL, SEARCH_MODES,
+                               LRUCache, normalize_query, source_name, load_embedder,
+                               fuse_rankings)
+except ImportError:
+    from vector_store import (VectorStore, DEFAULT_INDEX_DIR, EMBEDDING_MODEL, SEARCH_MODES,
+                              LRUCache, normalize_query, source_name, load_embedder,
+                              fuse_rankings)
+
+# SHARDED_INDEX=1 makes the app keep one index shard per book (see resources.py)
+SHARDED_INDEX = os.getenv("SHARDED_INDEX", "0") == "1"
+
+SHARDS_DIR = "shards"
+MANIFEST_FILE = "shards.json"   # book -> shard folder
+SEARCH_THREADS = min(8, os.cpu_count() or 1)
+
+
+def shard_folder_name(book, taken=()):
+    """Filesystem-safe, unused folder name for a book's shard"""
+    base = re.sub(r"[^\w.-]+", "_", book).strip("._") or "book"
+    name = base
+    for n in itertools.count(2):
+        if name not in taken:
+            return name
+        name = f"{base}_{n}"
+
+
+class ShardedVectorStore:
+    """
+    Drop-in for VectorStore (build_index / add_documents / remove_documents /
+    search / search_many) that keeps every book in its own shard.
+    Extra keyword arguments are passed on to each shard's VectorStore.
+    """
+
+    def __init__(self, index_dir=None, embedder=None, embedder_loader=None,
+                 search_threads=SEARCH_THREADS, **store_kwargs):
+        if index_dir is None:
+            index_dir = DEFAULT_INDEX_DIR
+
+        self.index_dir = index_dir
+        self.shards_dir = os.path.join(index_dir, SHARDS_DIR)
+        os.makedirs(self.shards_dir, exist_ok=True)
+
+        # One embedding model and query cache for all shards
+        self._embedder = embedder
+        self._embedder_loader = embedder_loader
+        self._embedder_lock = threading.Lock()
+        self.query_cache = LRUCache(max_size=1024)
+        self.store_kwargs = store_kwargs
+
+        self.shards = {}          # book -> loaded VectorStore
+        self.search_threads = search_threads
+        self._executor = None     # started on the first fan-out
+
+        # _write_lock serializes builds; _lock guards the shard table
+        self._write_lock = threading.RLock()
+        self._lock = threading.RLock()
+        self._manifest = self._read_manifest()
+
+    @property
+    def embedder(self):
+        """The embedding model shared by every shard, loaded on first use"""
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    if self._embedder_loader is not None:
+                        self._embedder = self._embedder_loader()
+                    else:
+                        backend = self.store_kwargs.get('backend')
+                        print("Loading embedding model...")
+                        self._embedder = load_embedder(EMBEDDING_MODEL, backend)
+        return self._embedder
+
+    @property
+    def index(self):
+        """Loaded shards, or None if none is (mirrors VectorStore.index)"""
+        return dict(self.shards) or None
+
+    @property
+    def chunks(self):
+        """List-like view of the chunk texts of all loaded shards"""
+        return _ShardedView([shard.chunks for shard in self._loaded()])
+
+    @property
+    def metadata(self):
+        """List-like view of the chunk metadata of all loaded shards"""
+        return _ShardedView([shard.metadata for shard in self._loaded()])
+
+    # ------------------------- manifest -------------------------
+    def _read_manifest(self):
+        path = os.path.join(self.shards_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        path = os.path.join(self.shards_dir, MANIFEST_FILE)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def books(self):
+        """Every book that has a shard on disk (loaded or not)"""
+        with self._lock:
+            return sorted(self._manifest)
+
+    # -------------------------- shards --------------------------
+    def _new_shard(self, shard_dir):
+        return VectorStore(shard_dir, embedder=self._embedder,
+                           embedder_loader=lambda: self.embedder, **self.store_kwargs)
+
+    def _shard_dir(self, book):
+        return os.path.join(self.shards_dir, self._manifest[book])
+
+    def _loaded(self):
+        with self._lock:
+            return [self.shards[book] for book in sorted(self.shards)]
+
+    def _open_shard(self, shard_dir):
+        """A shard loaded from disk, or None if it has no index"""
+        shard = self._new_shard(shard_dir)
+        shard.query_cache = self.query_cache
+        return shard if shard.load_index() else None
+
+    def load_shard(self, book):
+        """Load one book's shard (no-op if it's loaded); False if it has none.
+        It is read without holding _lock, so searches carry on meanwhile."""
+        with self._lock:
+            if book in self.shards:
+                return True
+            if book not in self._manifest:
+                return False
+            shard_dir = self._shard_dir(book)
+        shard = self._open_shard(shard_dir)
+        if shard is None:
+            return False
+        with self._lock:
+            self.shards.setdefault(book, shard)
+        return True
+
+    def unload_shard(self, book):
+        """Drop a loaded shard from memory (its files stay on disk)"""
+        with self._lock:
+            shard = self.shards.pop(book, None)
+        if shard is not None:
+            shard.clear()
+        return shard is not None
+
+    def load_index(self):
+        """Load every shard on disk that isn't loaded yet and unload the books
+        that are gone; True if at least one shard is loaded. Shards are read
+        without holding _lock and swapped in together at the end."""
+        with self._write_lock:
+            manifest = self._read_manifest()
+            with self._lock:
+                shards = dict(self.shards)
+            loaded = {}
+            for book, folder in manifest.items():
+                shard_dir = os.path.join(self.shards_dir, folder)
+                shard = shards.get(book)
+                if shard is None or shard.index_dir != shard_dir:
+                    shard = self._open_shard(shard_dir)
+                else:
+                    shard.reload_if_changed()
+                if shard is not None:
+                    loaded[book] = shard
+            with self._lock:
+                self._manifest = manifest
+                self.shards = loaded
+        if not loaded:
+            print(f"⚠️  No index shards found in: {self.shards_dir}")
+            return False
+        print(f"✅ Loaded {len(loaded)} book shard(s) from {self.shards_dir}")
+        return True
+
+    def reload_if_changed(self):
+        """Hot-reload shards rebuilt on disk, and pick up added/removed books.
+        Searches aren't blocked: each shard swaps in its new state on its own."""
+        with self._lock:
+            manifest = self._manifest
+        if self._read_manifest() != manifest:
+            return self.load_index()
+        return any([shard.reload_if_changed() for shard in self._loaded()])
+
+    def clear(self):
+        """Unload every shard (files on disk are left alone)"""
+        with self._write_lock, self._lock:
+            for book in list(self.shards):
+                self.unload_shard(book)
+
+    def indexed_sources(self):
+        """Books (PDF names / image folders) that have a shard"""
+        with self._lock:
+            sources = set(self._manifest)
+            for shard in self._loaded():
+                sources |= shard.indexed_sources()
+            return sources
+
+    # --------------------------- build --------------------------
+    def _by_book(self, pages):
+        """(book, its pages) groups; each book's pages must arrive together"""
+        seen = set()
+        for book, group in itertools.groupby(pages, key=lambda t: source_name(t['filename'])):
+            if book in seen:
+                raise ValueError(f"Pages of {book} are not contiguous; "
+                                 f"a sharded build needs them together")
+            seen.add(book)
+            yield book, group
+
+    def _build_shard(self, book, pages, **kwargs):
+        """(Re)build one book's shard and load it; returns its chunk count"""
+        with self._lock:
+            if book not in self._manifest:
+                self._manifest[book] = shard_folder_name(book, set(self._manifest.values()))
+            shard = self.shards.get(book)
+            if shard is None:
+                shard = self._new_shard(self._shard_dir(book))
+                shard.query_cache = self.query_cache
+
+        print(f"\n📗 Shard: {book}")
+        total = shard.build_index(pages, **kwargs)
+        with self._lock:
+            # A book whose extraction failed partway is left with no live chunks
+            if total and book in shard.indexed_sources():
+                self.shards[book] = shard
+                self._write_manifest()
+            elif book not in self.shards:
+                self._drop_shard(book)
+        return total
+
+    def _drop_shard(self, book):
+        """Unload a book's shard and delete its files"""
+        with self._lock:
+            self.unload_shard(book)
+            folder = self._manifest.pop(book, None)
+            self._write_manifest()
+        if folder is not None:
+            shutil.rmtree(os.path.join(self.shards_dir, folder), ignore_errors=True)
+
+    def build_index(self, extracted_texts, **kwargs):
+        """Rebuild the shards from scratch, one book at a time.
+        Returns the number of chunks indexed."""
+        with self._write_lock:
+            total = 0
+            built = set()
+            for book, pages in self._by_book(extracted_texts):
+                total += self._build_shard(book, pages, **kwargs)
+                built.add(book)
+
+            for book in set(self.books()) - built:
+                self._drop_shard(book)
+            return total
+
+    def add_documents(self, extracted_texts, save=True, **kwargs):
+        """Add (or replace) books; only their shards are touched.
+        Returns the number of chunks added."""
+        with self._write_lock:
+            added = 0
+            for book, pages in self._by_book(extracted_texts):
+                with self._lock:
+                    shard = self.shards.get(book)
+                if shard is None and book in self.books() and self.load_shard(book):
+                    shard = self.shards[book]
+                if shard is not None:
+                    added += shard.add_documents(pages, save=save, **kwargs)
+                    if book not in shard.indexed_sources():
+                        self._drop_shard(book)   # its extraction failed partway
+                else:
+                    added += self._build_shard(book, pages, **kwargs)
+            return added
+
+    def remove_documents(self, filename, save=True):
+        """Drop a whole book's shard, or tombstone a single page file in it"""
+        book = source_name(filename)
+        with self._write_lock:
+            if book not in self.books():
+                return 0
+            if filename != book:
+                if not self.load_shard(book):
+                    return 0
+                return self.shards[book].remove_documents(filename, save=save)
+
+            removed = len(self.shards[book].store) if self.load_shard(book) else 0
+            self._drop_shard(book)
+            print(f"🗑️  Dropped shard of {book}")
+            return removed
+
+    def save_index(self):
+        for shard in self._loaded():
+            shard.save_index()
+
+    # -------------------------- search --------------------------
+    def _fan_out(self, shards, fn):
+        """fn(shard) for every shard, on the search thread pool"""
+        if len(shards) <= 1 or self.search_threads <= 1:
+            return [fn(shard) for shard in shards]
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.search_threads,
+                                                        thread_name_prefix="shard-search")
+        return list(self._executor.map(fn, shards))
+
+    def _target_shards(self, filename):
+        """Shards a query must visit (one, if it's filtered to a book)"""
+        if filename is None:
+            return self._loaded()
+        book = source_name(filename)
+        return [self.shards[book]] if self.load_shard(book) else []
+
+    def _warm_query_cache(self, queries, batch_size=64):
+        """Embed queries once, up front, so shards only read the shared cache"""
+        missing = list(dict.fromkeys(q for q in map(normalize_query, queries)
+                                     if self.query_cache.get(q) is None))
+        if missing:
+            fresh = self.embedder.encode(missing, batch_size=batch_size)
+            for text, vector in zip(missing, np.array(fresh).astype('float32')):
+                self.query_cache.put(text, vector)
+
+    @staticmethod
+    def _merge(result_lists, top_k, mode):
+        """Heap merge of per-shard top-k lists: nearest first for dense search,
+        highest BM25 score first for lexical (scored with _corpus_stats)"""
+        results = itertools.chain.from_iterable(result_lists)
+        if mode == 'dense':
+            return heapq.nsmallest(top_k, results, key=lambda r: r['distance'])
+        return heapq.nlargest(top_k, results, key=lambda r: r['score'])
+
+    def _corpus_stats(self, query):
+        """BM25 statistics of the query's terms over every loaded shard, so each
+        shard's scores are the ones one index of the whole collection would give"""
+        num_docs, total_len, doc_freqs = 0, 0, {}
+        for shard in self._loaded():
+            docs, length, freqs = shard.lexical_stats(query)
+            num_docs += docs
+            total_len += length
+            for term, freq in freqs.items():
+                doc_freqs[term] = doc_freqs.get(term, 0) + freq
+        return num_docs, total_len, doc_freqs
+
+    @staticmethod
+    def _fuse(dense, lexical, top_k):
+        """Reciprocal rank fusion of the merged dense and lexical lists"""
+        results = {}   # (page file, chunk ID) -> result; chunk IDs are per shard
+
+        def keyed(hits, value):
+            keys = []
+            for r in hits:
+                key = (r['metadata']['filename'], r['metadata']['vector_id'])
+                results.setdefault(key, r)
+                keys.append((key, r[value]))
+            return keys
+
+        fused = fuse_rankings(keyed(dense, 'distance'), keyed(lexical, 'score'), top_k)
+        return [dict(results[key], distance=dist, score=score) for key, score, dist in fused]
+
+    def search(self, query, top_k=5, nprobe=None, ef_search=None, mode='dense',
+               filename=None, pages=None):
+        """Search every loaded shard (or just filename's book) and merge the hits.
+        Same arguments and results as VectorStore.search."""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (choose from {SEARCH_MODES})")
+        shards = self._target_shards(filename)
+        if not shards:
+            if self.index is None:
+                raise ValueError("Index not loaded! Build or load an index first.")
+            return []
+
+        if mode != 'lexical':
+            self._warm_query_cache([query])
+        if mode == 'dense':
+            per_shard = self._fan_out(shards, lambda shard: shard.search(
+                query, top_k, nprobe, ef_search, mode, filename, pages))
+            return self._merge(per_shard, top_k, mode)
+
+        # Shard-local BM25 scores don't compare: score with the whole collection's
+        corpus = self._corpus_stats(query)
+        candidates = top_k if mode == 'lexical' else max(top_k * 4, 20)
+        per_shard = self._fan_out(shards, lambda shard: shard.ranked_lists(
+            query, candidates, nprobe, ef_search, mode, filename, pages, corpus))
+        lexical = self._merge([hits for _, hits in per_shard], candidates, 'lexical')
+        if mode == 'lexical':
+            return lexical
+        dense = self._merge([hits for hits, _ in per_shard], candidates, 'dense')
+        return self._fuse(dense, lexical, top_k)
+
+    def search_many(self, queries, top_k=5, nprobe=None, ef_search=None, batch_size=64,
+                    filename=None, pages=None):
+        """Batched dense search over the shards; one result list per query"""
+        if not queries:
+            return []
+        shards = self._target_shards(filename)
+        if not shards:
+            if self.index is None:
+                raise ValueError("Index not loaded! Build or load an index first.")
+            return [[] for _ in queries]
+
+        queries = list(queries)
+        self._warm_query_cache(queries, batch_size)
+        per_shard = self._fan_out(shards, lambda shard: shard.search_many(
+            queries, top_k, nprobe, ef_search, batch_size, filename, pages))
+        return [self._merge(lists, top_k, 'dense') for lists in zip(*per_shard)]
+
+    def cache_stats(self):
+        """Query embedding cache stats plus each loaded shard's own caches"""
+        with self._lock:
+            return {
+                'query_embeddings': self.query_cache.stats(),
+                'shards': {book: shard.cache_stats() for book, shard in self.shards.items()}
+            }
+
+
+class _ShardedView:
+    """Read-only sequence chaining the row views of several shards"""
+
+    def __init__(self, views):
+        self._views = views
+
+    def __len__(self):
+        return sum(len(view) for view in self._views)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[r] for r in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        for view in self._views:
+            if 0 <= row < len(view):
+                return view[row]
+            row -= len(view)
+        raise IndexError("chunk row out of range")
+
+    def __iter__(self):
+        for view in self._views:
+            yield from view
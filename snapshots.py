@@ -0,0 +1,227 @@
+"""
+Index Snapshots for 3Ts Tutor
+Every save writes a complete, immutable snapshot folder and then points
+CURRENT at it with one atomic rename, so a crash or a concurrent load never
+sees a half-written index.
+
+Layout of an index folder:
+    CURRENT                - name of the live snapshot (e.g. "v0007")
+    snapshots/v0007/       - faiss.index, chunk_store/, lexical/, dedup/,
+                             index_meta.json and MANIFEST.json
+    snapshots/v0008.tmp/   - a snapshot still being written (ignored)
+
+MANIFEST.json lists every file of the snapshot with its size and SHA-256.
+Files that didn't change since the previous snapshot are hard links to it
+(and keep its checksums), so a save only writes what changed.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "MANIFEST.json"
+KEEP_SNAPSHOTS = 2      # older snapshots are deleted (readers keep their open maps)
+SEGMENTS_DIR = "segments"   # delta segments of a part saved incrementally
+
+SNAPSHOT_RE = re.compile(r"^v(\d+)$")
+
+
+def _fsync_dir(path):
+    """Make a rename inside path durable (no-op where directories can't be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def snapshot_names(index_dir):
+    """Published snapshot names, oldest first"""
+    root = os.path.join(index_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(root):
+        return []
+    names = [name for name in os.listdir(root) if SNAPSHOT_RE.match(name)]
+    return sorted(names, key=lambda name: int(SNAPSHOT_RE.match(name).group(1)))
+
+
+def current_name(index_dir):
+    """Name of the live snapshot, or None if the index has none yet"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), 'r') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if SNAPSHOT_RE.match(name) else None
+
+
+def snapshot_path(index_dir, name):
+    return os.path.join(index_dir, SNAPSHOTS_DIR, name)
+
+
+def begin(index_dir):
+    """(name, temporary folder) for the next snapshot"""
+    names = snapshot_names(index_dir)
+    number = int(SNAPSHOT_RE.match(names[-1]).group(1)) + 1 if names else 1
+    name = f"v{number:04d}"
+    tmp_path = snapshot_path(index_dir, name) + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    return name, tmp_path
+
+
+def link_tree(src, dst):
+    """Hard-link (or, across filesystems, copy) every file of src into dst"""
+    for root, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            link_file(os.path.join(root, name), os.path.join(target, name))
+
+
+def link_file(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+# ============================================================
+#                  DELTA SEGMENTS
+# ============================================================
+# A part (chunk store, lexical index, ...) saved again after small changes keeps
+# its files and adds what changed as a delta segment in segments/NNNNNN/.
+
+def segment_dirs(path):
+    """Delta segment folders of a saved part, oldest first"""
+    root = os.path.join(path, SEGMENTS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return [os.path.join(root, name) for name in sorted(os.listdir(root)) if name.isdigit()]
+
+
+def segments_to_merge(sizes, new_size):
+    """How many of the newest saved segments (sizes oldest first, the base
+    first of all) to rewrite together with new_size new items. Each segment
+    stays bigger than everything saved after it, so there are O(log n) of them
+    and a save costs about the size of the change. len(sizes) = rewrite all."""
+    merged = new_size
+    count = 0
+    for size in reversed(sizes):
+        if size > merged:
+            break
+        merged += size
+        count += 1
+    return count
+
+
+def link_segments(src, dst, merge=0):
+    """Hard-link a saved part into dst, leaving out its newest `merge` delta
+    segments (the caller rewrites them); returns the folder for the new segment"""
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        if os.path.isfile(os.path.join(src, name)):
+            link_file(os.path.join(src, name), os.path.join(dst, name))
+
+    dirs = segment_dirs(src)
+    kept = dirs[:len(dirs) - merge]
+    for folder in kept:
+        link_tree(folder, os.path.join(dst, SEGMENTS_DIR, os.path.basename(folder)))
+    number = int(os.path.basename(dirs[-1])) + 1 if dirs else 1
+    return os.path.join(dst, SEGMENTS_DIR, f"{number:06d}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _files(path):
+    """Relative paths of every file in a snapshot folder except the manifest"""
+    out = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), path)
+            if rel != MANIFEST_FILE:
+                out.append(rel)
+    return sorted(out)
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), 'r') as f:
+        return json.load(f)
+
+
+def publish(index_dir, name, tmp_path, previous=None):
+    """Checksum a finished snapshot folder, move it into place and make it
+    CURRENT. Files hard-linked from the previous snapshot reuse its checksums.
+    Returns the snapshot's path."""
+    known = {}
+    if previous is not None and os.path.exists(os.path.join(previous, MANIFEST_FILE)):
+        known = read_manifest(previous)['files']
+
+    files = {}
+    for rel in _files(tmp_path):
+        path = os.path.join(tmp_path, rel)
+        old_path = os.path.join(previous, rel) if previous else None
+        if rel in known and os.path.exists(old_path) and os.path.samefile(path, old_path):
+            files[rel] = known[rel]
+        else:
+            files[rel] = {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump({'version': name, 'created': time.time(), 'files': files}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    final_path = snapshot_path(index_dir, name)
+    os.rename(tmp_path, final_path)
+    _fsync_dir(os.path.dirname(final_path))
+
+    # The switch itself: one atomic rename of the CURRENT pointer
+    current_tmp = os.path.join(index_dir, CURRENT_FILE + ".tmp")
+    with open(current_tmp, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(index_dir, CURRENT_FILE))
+    _fsync_dir(index_dir)
+    return final_path
+
+
+def verify(path, checksums=False):
+    """Problems found in a snapshot (empty if it's intact). Sizes are always
+    checked; SHA-256 only with checksums=True, as it reads every byte."""
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return [f"{MANIFEST_FILE} is missing"]
+    problems = []
+    for rel, entry in read_manifest(path)['files'].items():
+        file_path = os.path.join(path, rel)
+        if not os.path.exists(file_path):
+            problems.append(f"{rel} is missing")
+        elif os.path.getsize(file_path) != entry['size']:
+            problems.append(f"{rel} has the wrong size")
+        elif checksums and file_sha256(file_path) != entry['sha256']:
+            problems.append(f"{rel} fails its checksum")
+    return problems
+
+
+def prune(index_dir, keep=KEEP_SNAPSHOTS):
+    """Delete all but the newest `keep` snapshots (never CURRENT).
+    Leftovers of an interrupted save are cleared by the next begin()."""
+    current = current_name(index_dir)
+    for name in snapshot_names(index_dir)[:-keep]:
+        if name != current:
+            shutil.rmtree(snapshot_path(index_dir, name), ignore_errors=True)
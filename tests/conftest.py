@@ -0,0 +1,73 @@
+"""
+Shared fixtures: a word-hashing embedder (no model download) and a small
+multi-book corpus whose books use different vocabularies.
+"""
+
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class WordTokenizer:
+    """One token per word"""
+
+    def __call__(self, words, add_special_tokens=False, **kwargs):
+        if isinstance(words, str):
+            words = [words]
+        return {'input_ids': [[0] for _ in words]}
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words, with the SentenceTransformer methods VectorStore uses"""
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+        self.max_seq_length = 128
+        self.tokenizer = WordTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=64, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.strip(".,?!").encode('utf-8'))
+                out[row, h % self.dimension] += 1.0 if h & 1 << 31 else -1.0
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def make_pages(books=3, pages_per_book=200, words_per_page=60, seed=0):
+    """Pages of several books; each book mixes its own words with shared ones"""
+    rng = np.random.default_rng(seed)
+    shared = [f"common{i}" for i in range(300)]
+    pages = []
+    for book in range(books):
+        own = [f"b{book}w{i}" for i in range(400)]
+        for page in range(pages_per_book):
+            words = [rng.choice(own) if rng.random() < 0.5 else rng.choice(shared)
+                     for _ in range(words_per_page)]
+            pages.append({
+                'filename': f"book{book}.pdf_page_{page + 1}",
+                'text': " ".join(words) + ".",
+                'page_number': page + 1
+            })
+    return pages
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder()
+
+
+@pytest.fixture(scope='session')
+def pages():
+    return make_pages()
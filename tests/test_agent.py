@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+import extraction_cache
+from agent import Tutor, load_source_hashes
+from vector_store import VectorStore
+
+
+class _TextBooks:
+    """Stands in for the book processor (with caching off): every file is a
+    book whose lines are pages"""
+
+    def __init__(self):
+        self.cache = False
+        self.read = []
+
+    def iter_pages(self, folder):
+        for name in sorted(os.listdir(folder)):
+            self.read.append(name)
+            with open(os.path.join(folder, name)) as f:
+                for n, line in enumerate(f.read().splitlines(), 1):
+                    yield {'filename': f"{name}_page_{n}", 'text': line, 'page_number': n}
+
+
+def _write_book(folder, name, words):
+    with open(os.path.join(folder, name), 'w') as f:
+        f.write("\n".join(f"{words} page {n} " * 5 for n in range(1, 4)))
+
+
+def test_incremental_build_reindexes_a_replaced_book(tmp_path, embedder, monkeypatch):
+    books = str(tmp_path / "books")
+    os.makedirs(books)
+    _write_book(books, "a.pdf", "alpha beta")
+    _write_book(books, "b.pdf", "gamma delta")
+    store = VectorStore(str(tmp_path / "index"), index_type='flat', embedder=embedder,
+                        dedup=False)
+    tutor = Tutor(vector_store=store)
+    tutor._ocr_processor = _TextBooks()
+    # Hashing books must not open an extraction cache the processor turned off
+    monkeypatch.setattr(extraction_cache.ExtractionCache, '_connect', None)
+    tutor.build_knowledge_base(books)
+    assert set(load_source_hashes(store.index_dir)) == {'a.pdf', 'b.pdf'}
+
+    added = []
+    add_documents = store.add_documents
+    monkeypatch.setattr(store, 'add_documents',
+                        lambda pages, **kw: add_documents(added.extend(pages) or added, **kw))
+    tutor.build_knowledge_base(books, incremental=True)
+    assert added == []   # nothing changed
+
+    # Same name, new content: only that book is embedded again
+    _write_book(books, "b.pdf", "epsilon zeta")
+    os.utime(os.path.join(books, "b.pdf"), ns=(1, 1))
+    tutor.build_knowledge_base(books, incremental=True)
+    assert {p['filename'] for p in added} == {f"b.pdf_page_{n}" for n in range(1, 4)}
+    assert not store.search("gamma delta", top_k=10, mode='lexical')
+    assert store.search("epsilon zeta", top_k=1, mode='lexical')[0]['metadata']['filename'] \
+        .startswith("b.pdf")
+    assert store.indexed_sources() == {'a.pdf', 'b.pdf'}
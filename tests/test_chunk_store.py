@@ -0,0 +1,52 @@
+import os
+import shutil
+
+import numpy as np
+
+from chunk_store import ChunkStore, COLUMNS, COLUMNS_DIR
+
+
+def _chunks(start, count, rng):
+    """(text, meta, vector) rows; some pages have labels, later rows new books"""
+    rows = []
+    for i in range(start, start + count):
+        page = "xii" if i % 17 == 0 else i % 50 + 1
+        meta = {'filename': f"book{i // 60}.pdf_page_{i % 50 + 1}", 'page_number': page,
+                'chunk_id': i % 3, 'vector_id': 10 * i}
+        rows.append((f"chunk {i}", meta, rng.standard_normal(8).astype('float32')))
+    return rows
+
+
+def test_segments_open_with_mapped_columns(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = _chunks(0, 200, rng)
+    store = ChunkStore()
+    for text, meta, vector in rows:
+        store.append(text, meta, vector)
+    path = str(tmp_path / "store")
+    store = store.save(path)
+    for start, count in ((200, 80), (280, 30), (310, 5)):
+        added = _chunks(start, count, rng)
+        for text, meta, vector in added:
+            store.append(text, meta, vector)
+        rows += added
+        store = store.save(path)
+
+    assert len(os.listdir(os.path.join(path, 'segments'))) >= 2
+    opened = ChunkStore.open(path)
+    # Folded on save: no private copy of the columns is made on open
+    assert all(isinstance(opened.column(name), np.memmap) for name in COLUMNS)
+    shutil.rmtree(os.path.join(path, COLUMNS_DIR))
+    unfolded = ChunkStore.open(path)   # stores saved before columns were folded
+
+    picked = rng.permutation(len(rows))[:120]
+    for store in (opened, unfolded):
+        assert list(store.texts) == [text for text, _, _ in rows]
+        assert list(store.metadata) == [meta for _, meta, _ in rows]
+        assert np.array_equal(store.vectors(picked), np.stack([rows[i][2] for i in picked]))
+
+    extra = _chunks(315, 4, rng)
+    for text, meta, vector in extra:
+        opened.append(text, meta, vector)
+    picked = np.array([318, 3, 250, 316, 312])
+    assert np.array_equal(opened.vectors(picked), np.stack([(rows + extra)[i][2] for i in picked]))
@@ -0,0 +1,105 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import LexicalIndex, tokenize, K1, B
+
+
+def _reference_scores(texts, removed, query):
+    """Textbook BM25 over the live docs: {doc ID: score}"""
+    docs = {i: Counter(tokenize(t)) for i, t in enumerate(texts) if i not in removed}
+    avg_len = sum(sum(c.values()) for c in docs.values()) / len(docs)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in c for c in docs.values())
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, counts in docs.items():
+            tf = counts[term]
+            if tf:
+                norm = K1 * (1 - B + B * sum(counts.values()) / avg_len)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+    return scores
+
+
+@pytest.mark.parametrize('reload', [False, True])
+def test_search_matches_reference_bm25(tmp_path, pages, reload):
+    texts = [p['text'] for p in pages]
+    index = LexicalIndex()
+    index.add(range(len(texts)), texts)
+    index.finalize()
+    removed = set(range(0, len(texts), 7))
+    index.remove(removed)
+    index.finalize()
+    if reload:
+        index.save(str(tmp_path))
+        index = LexicalIndex.load(str(tmp_path))
+    allowed = np.arange(1, len(texts), 2)
+
+    for page in pages[3::101]:
+        query = " ".join(page['text'].split()[:8])
+        expected = _reference_scores(texts, removed, query)
+        for only in (None, allowed):
+            ids, scores = index.search(query, top_k=15, allowed=only)
+            candidates = {i: s for i, s in expected.items() if only is None or i in set(only)}
+            best = sorted(candidates.values(), reverse=True)[:15]
+            assert not removed & set(ids.tolist())
+            assert scores.tolist() == pytest.approx(best, rel=1e-5)
+            assert [candidates[i] for i in ids.tolist()] == pytest.approx(best, rel=1e-5)
+
+
+@pytest.mark.parametrize('reload', [False, True])
+def test_removed_book_leaves_shared_terms_scoring(tmp_path, pages, reload):
+    texts = [p['text'] for p in pages]
+    index = LexicalIndex()
+    index.add(range(len(texts)), texts)
+    index.finalize()
+    # Drop two of the three books: the words they share with the last one are
+    # now in far more removed docs than live ones
+    removed = {i for i, p in enumerate(pages) if not p['filename'].startswith("book2")}
+    index.remove(removed)
+    index.finalize()
+    if reload:
+        index.save(str(tmp_path))
+        index = LexicalIndex.load(str(tmp_path))
+
+    query = "common1 common2 common3"
+    expected = _reference_scores(texts, removed, query)
+    ids, scores = index.search(query, top_k=10)
+    assert len(ids) == 10 and (scores > 0).all()
+    assert not removed & set(ids.tolist())
+    assert scores.tolist() == pytest.approx(sorted(expected.values(), reverse=True)[:10], rel=1e-5)
+    num_docs, _, doc_freqs = index.term_stats(query)
+    assert num_docs == len(texts) - len(removed)
+    assert all(0 < df <= num_docs for df in doc_freqs.values())
+
+
+def test_adds_keep_doc_freqs_without_recounting(pages, monkeypatch):
+    texts = [p['text'] for p in pages]
+    index = LexicalIndex()
+    index.add(range(200), texts[:200])
+    index.finalize()
+    removed = set(range(0, 200, 3))
+    index.remove(removed)
+    index.finalize()
+
+    # Batches added after a removal update only the terms they contain
+    recounts = []
+    doc_freqs = index._doc_freqs
+    monkeypatch.setattr(index, '_doc_freqs', lambda terms: recounts.append(1) or doc_freqs(terms))
+    for start in range(200, len(texts), 100):
+        index.add(range(start, start + 100), texts[start:start + 100])
+        index.finalize()
+    assert not recounts
+
+    query = "common4 common7 b1w3 b2w9"
+    expected = _reference_scores(texts, removed, query)
+    ids, scores = index.search(query, top_k=10)
+    assert scores.tolist() == pytest.approx(sorted(expected.values(), reverse=True)[:10], rel=1e-5)
+    assert index.term_stats(query)[2] == {
+        term: sum(term in tokenize(t) for i, t in enumerate(texts) if i not in removed)
+        for term in tokenize(query)
+    }
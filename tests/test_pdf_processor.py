@@ -0,0 +1,207 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import pdf_processor
+from pdf_processor import PDFProcessor
+
+
+def make_pdf(path, num_pages):
+    """Text-only PDF whose page n reads 'page n of <name>'"""
+    doc = fitz.open()
+    for n in range(1, num_pages + 1):
+        doc.new_page().insert_text((72, 72), f"page {n} of {path.name}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _quiet(message):
+    pass
+
+
+def _processor(**kwargs):
+    return PDFProcessor(workers=0, method='pymupdf', cache=False, ocr_scanned=False, **kwargs)
+
+
+def _damage(monkeypatch, name, bad_page):
+    """Make one PDF raise when its bad_page is extracted"""
+    iter_window = pdf_processor._iter_window
+
+    def damaged(pdf_path, method, start, end, stats):
+        for page_num, text in iter_window(pdf_path, method, start, end, stats):
+            if pdf_path.endswith(name) and page_num == bad_page:
+                raise RuntimeError("damaged page")
+            yield page_num, text
+
+    monkeypatch.setattr(pdf_processor, '_iter_window', damaged)
+
+
+def test_pages_are_yielded_as_they_are_extracted(tmp_path, monkeypatch):
+    make_pdf(tmp_path / "a.pdf", 40)
+    extracted = []
+    iter_window = pdf_processor._iter_window
+
+    def spy(pdf_path, method, start, end, stats):
+        for page_num, text in iter_window(pdf_path, method, start, end, stats):
+            extracted.append(page_num)
+            yield page_num, text
+
+    monkeypatch.setattr(pdf_processor, '_iter_window', spy)
+    pages = _processor().iter_pages(str(tmp_path), progress=_quiet)
+    assert next(pages)['filename'] == "a.pdf_page_1"
+    assert len(extracted) < 40
+    assert len(list(pages)) == 39
+
+
+def test_pdf_failing_partway_is_marked_failed(tmp_path, monkeypatch):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        make_pdf(tmp_path / name, 6)
+    _damage(monkeypatch, "b.pdf", 4)
+
+    records = list(_processor().iter_pages(str(tmp_path), progress=_quiet))
+    assert [r['filename'] for r in records] == \
+        [f"a.pdf_page_{n}" for n in range(1, 7)] + \
+        [f"b.pdf_page_{n}" for n in range(1, 4)] + ["b.pdf"] + \
+        [f"c.pdf_page_{n}" for n in range(1, 7)]
+    assert records[9]['failed'] == "damaged page"
+
+    # List callers get only the PDFs extracted in full
+    records = _processor().process_book_folder(str(tmp_path), progress=_quiet)
+    assert [r['filename'] for r in records] == \
+        [f"{name}_page_{n}" for name in ("a.pdf", "c.pdf") for n in range(1, 7)]
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_pdf_failing_partway_leaves_no_chunks(tmp_path, monkeypatch, embedder, pages,
+                                              incremental):
+    from vector_store import VectorStore
+
+    books = tmp_path / "books"
+    books.mkdir()
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        make_pdf(books / name, 6)
+    store = VectorStore(str(tmp_path / "index"), index_type='flat', embedder=embedder,
+                        dedup=False)
+    if incremental:
+        store.build_index(pages[:50])
+        store.add_documents(_processor().iter_pages(str(books), progress=_quiet))
+    # A re-added book that fails loses its old chunks too, so it is extracted again
+    _damage(monkeypatch, "b.pdf", 4)
+    if incremental:
+        store.add_documents(_processor().iter_pages(str(books), progress=_quiet))
+    else:
+        store.build_index(_processor().iter_pages(str(books), progress=_quiet))
+
+    expected = {'a.pdf', 'c.pdf', 'book0.pdf'} if incremental else {'a.pdf', 'c.pdf'}
+    assert store.indexed_sources() == expected
+    results = store.search("page 2 of b.pdf", top_k=20)
+    assert not any(r['metadata']['filename'].startswith("b.pdf") for r in results)
+
+
+def _spy_windows(monkeypatch):
+    """Record the (start, end) page windows read"""
+    windows = []
+    iter_window = pdf_processor._iter_window
+
+    def spy(pdf_path, method, start, end, stats):
+        windows.append((start, end))
+        yield from iter_window(pdf_path, method, start, end, stats)
+
+    monkeypatch.setattr(pdf_processor, '_iter_window', spy)
+    return windows
+
+
+def test_large_pdf_is_read_in_windows(tmp_path, monkeypatch):
+    pdf = make_pdf(tmp_path / "big.pdf", 12)
+    monkeypatch.setattr(pdf_processor, 'PAGE_WINDOW', 5)
+    windows = _spy_windows(monkeypatch)
+
+    records = list(_processor(large_doc_pages=10)._iter_pdf(pdf, 'pymupdf', _quiet))
+    assert windows == [(0, 5), (5, 10), (10, 12)]
+    assert [r['pdf_page'] for r in records] == list(range(1, 13))
+    assert records[6]['text'] == "page 7 of big.pdf"
+
+    windows.clear()
+    list(_processor(large_doc_pages=13)._iter_pdf(pdf, 'pymupdf', _quiet))
+    assert windows == [(0, 12)]
+
+
+def test_rss_ceiling_stops_extraction(tmp_path, monkeypatch):
+    make_pdf(tmp_path / "big.pdf", 12)
+    monkeypatch.setattr(pdf_processor, 'PAGE_WINDOW', 2)
+    windows = _spy_windows(monkeypatch)
+    # Memory grows by 100 MB per window read
+    monkeypatch.setattr(pdf_processor, 'current_rss_mb', lambda: 100 * len(windows))
+
+    processor = _processor(large_doc_pages=1, max_rss_mb=250)
+    with pytest.raises(MemoryError, match="250 MB ceiling"):
+        list(processor.iter_pages(str(tmp_path), progress=_quiet))
+    assert windows == [(0, 2), (2, 4), (4, 6)]
+
+
+def test_rss_ceiling_leaves_index_unchanged(tmp_path, monkeypatch, embedder, pages):
+    from vector_store import VectorStore
+
+    books = tmp_path / "books"
+    books.mkdir()
+    make_pdf(books / "big.pdf", 6)
+    store = VectorStore(str(tmp_path / "index"), index_type='flat', embedder=embedder,
+                        dedup=False)
+    store.build_index(pages[:50])
+
+    monkeypatch.setattr(pdf_processor, 'current_rss_mb', lambda: 10_000)
+    processor = _processor(large_doc_pages=1, max_rss_mb=100)
+    with pytest.raises(MemoryError):
+        store.add_documents(processor.iter_pages(str(books), progress=_quiet))
+    assert store.indexed_sources() == {'book0.pdf'}
+    assert len(store.store) == 50
+
+
+def test_scan_renderer_reopens_the_pdf_per_window(tmp_path, monkeypatch):
+    pdf = make_pdf(tmp_path / "scan.pdf", 12)
+    opened = []
+
+    class CountingFitz:
+        @staticmethod
+        def open(path):
+            opened.append(path)
+            return fitz.open(path)
+
+    monkeypatch.setattr(pdf_processor, 'fitz', CountingFitz)
+    for window, opens in ((5, 3), (None, 1)):
+        opened.clear()
+        renderer = pdf_processor._ScanRenderer(pdf, 0, window)
+        try:
+            assert all(renderer.render(n) is None for n in range(1, 13))   # no images
+        finally:
+            renderer.close()
+        assert len(opened) == opens
+
+
+@pytest.mark.slow
+def test_peak_memory_stays_flat_as_books_grow(tmp_path, monkeypatch):
+    import importlib.util
+    import os
+    spec = importlib.util.spec_from_file_location("bench_large_pdf", os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks",
+        "bench_large_pdf.py"))
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    # Dense pages, so holding a book's records back would show up clearly
+    monkeypatch.setattr(bench, 'WORDS_PER_PAGE', 600)
+
+    runs = []
+    for size in (200, 2000):
+        (tmp_path / str(size)).mkdir()
+        pdf = str(tmp_path / str(size) / "book.pdf")
+        bench.make_pdf(pdf, size)
+        # A fresh interpreter per book, reading it through iter_pages
+        result = bench.run_in_subprocess({'pdf': pdf, 'size': size, 'method': 'pymupdf',
+                                          'bounded': True, 'max_rss_mb': 0})
+        assert not result.get('error'), result['error']
+        assert result['pages'] == size
+        runs.append(result)
+
+    extra_text_mb = (runs[1]['chars'] - runs[0]['chars']) / 2**20
+    assert runs[1]['peak_rss_mb'] - runs[0]['peak_rss_mb'] < extra_text_mb / 4
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from vector_store import VectorStore
+from sharded_store import ShardedVectorStore
+
+# Short queries score many chunks the same: ties must break the same way too
+SHORT_QUERIES = ["common3 common17 b0w5", "b1w12 b1w40 common250", "b0w1 b1w1 b2w1"]
+
+
+def _ranking(results):
+    return [(r['metadata']['filename'], r['chunk']) for r in results]
+
+
+@pytest.mark.parametrize('mode', ['hybrid', 'lexical', 'dense'])
+def test_sharded_search_ranks_like_one_store(tmp_path, embedder, pages, mode):
+    single = VectorStore(str(tmp_path / 'single'), index_type='flat', embedder=embedder,
+                         dedup=False)
+    single.build_index(pages)
+    sharded = ShardedVectorStore(str(tmp_path / 'sharded'), embedder=embedder,
+                                 index_type='flat', dedup=False)
+    sharded.build_index(pages)
+    assert len(sharded.shards) == 3
+
+    queries = SHORT_QUERIES + [" ".join(page['text'].split()[:20]) for page in pages[7::97]]
+    for query in queries:
+        expected = single.search(query, top_k=10, mode=mode)
+        got = sharded.search(query, top_k=10, mode=mode)
+        assert _ranking(got) == _ranking(expected), query
+        if mode != 'dense':
+            assert [r['score'] for r in got] == pytest.approx([r['score'] for r in expected])
+
+
+def test_reload_does_not_block_searches(tmp_path, embedder, pages):
+    writer = ShardedVectorStore(str(tmp_path), embedder=embedder, index_type='flat', dedup=False)
+    writer.build_index(pages[:400])
+    reader = ShardedVectorStore(str(tmp_path), embedder=embedder, index_type='flat', dedup=False)
+    assert reader.load_index() and len(reader.shards) == 2
+    writer.add_documents(pages[400:])
+
+    # Hold the new shard's load until a search has run
+    loading, release = threading.Event(), threading.Event()
+    open_shard = reader._open_shard
+
+    def slow_open_shard(shard_dir):
+        loading.set()
+        assert release.wait(timeout=10)
+        return open_shard(shard_dir)
+
+    reader._open_shard = slow_open_shard
+    reloader = threading.Thread(target=reader.reload_if_changed)
+    reloader.start()
+    assert loading.wait(timeout=10)
+
+    results = []
+    searcher = threading.Thread(target=lambda: results.append(reader.search(pages[5]['text'])))
+    searcher.start()
+    searcher.join(timeout=10)
+    release.set()
+    reloader.join(timeout=10)
+    assert not searcher.is_alive() and not reloader.is_alive()
+    assert results[0][0]['metadata']['filename'] == pages[5]['filename']
+
+    assert len(reader.shards) == 3
+    assert reader.search(pages[450]['text'], top_k=1)[0]['metadata']['filename'] == \
+        pages[450]['filename']
+
+
+def test_setting_selects_sharded_store(tmp_path, embedder, monkeypatch):
+    import resources
+    monkeypatch.setattr(resources, 'get_embedder', lambda: embedder)
+    monkeypatch.setattr(resources, '_vector_stores', {})
+
+    monkeypatch.setattr(resources, 'SHARDED_INDEX', True)
+    assert isinstance(resources.get_vector_store(str(tmp_path / 'a')), ShardedVectorStore)
+    monkeypatch.setattr(resources, 'SHARDED_INDEX', False)
+    assert type(resources.get_vector_store(str(tmp_path / 'b'))) is VectorStore
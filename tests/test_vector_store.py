@@ -0,0 +1,558 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import make_pages
+from dedup import band_keys
+from vector_store import VectorStore, source_name
+
+
+def _store(path, embedder, index_type):
+    return VectorStore(str(path), index_type=index_type, embedder=embedder, dedup=False)
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf', 'hnsw'])
+def test_filtered_search_after_removal(tmp_path, embedder, pages, index_type):
+    store = _store(tmp_path, embedder, index_type)
+    store.build_index(pages)
+    query = pages[5]['text']
+
+    assert store.search(query, filename='book0.pdf')[0]['metadata']['filename'] == \
+        pages[5]['filename']
+    store.remove_documents('book2.pdf')
+    results = store.search(query, filename='book0.pdf')
+    assert results[0]['metadata']['filename'] == pages[5]['filename']
+    assert all(r['metadata']['filename'].startswith('book0.pdf') for r in results)
+
+    store.remove_documents('book1.pdf')
+    store.compact()
+    assert store.search(query, filename='book0.pdf')[0]['metadata']['filename'] == \
+        pages[5]['filename']
+    assert {r['metadata']['filename'].split('_page_')[0] for r in store.search(query, top_k=20)} \
+        == {'book0.pdf'}
+
+
+def test_ivf_removal_survives_reload(tmp_path, embedder, pages):
+    store = _store(tmp_path, embedder, 'ivf')
+    store.build_index(pages)
+    query = pages[5]['text']
+    store.search(query, filename='book0.pdf')
+    store.remove_documents('book2.pdf')
+
+    reloaded = _store(tmp_path, embedder, 'ivf')
+    assert reloaded.load_index()
+    assert reloaded.search(query, filename='book0.pdf')[0]['metadata']['filename'] == \
+        pages[5]['filename']
+    reloaded.remove_documents('book1.pdf')
+    assert reloaded.search(query, filename='book0.pdf')[0]['metadata']['filename'] == \
+        pages[5]['filename']
+    assert reloaded.indexed_sources() == {'book0.pdf'}
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf', 'hnsw'])
+def test_small_removal_is_not_compacted(tmp_path, embedder, pages, index_type):
+    store = _store(tmp_path, embedder, index_type)
+    store.build_index(pages)
+    page = pages[210]   # book1.pdf_page_11
+    rows = len(store.store)
+
+    store.remove_documents(page['filename'])
+    assert len(store.store) == rows                  # store rows wait for compaction
+    assert store.num_vectors == rows                 # so do vectors (skipped by searches)
+    assert page['filename'] not in {r['metadata']['filename']
+                                    for r in store.search(page['text'], top_k=10)}
+
+    reloaded = _store(tmp_path, embedder, index_type)
+    reloaded.load_index()
+    assert reloaded.tombstones == store.tombstones
+    assert page['filename'] not in {r['metadata']['filename']
+                                    for r in reloaded.search(page['text'], top_k=10)}
+    assert reloaded.compact() == len(store.tombstones)
+    assert len(reloaded.store) == reloaded.num_vectors == rows - len(store.tombstones)
+
+
+def test_searches_are_not_blocked_by_writers(tmp_path, embedder, pages):
+    store = _store(tmp_path, embedder, 'hnsw')
+    store.build_index([p for p in pages if not p['filename'].startswith('book2.pdf')])
+    new_book = [p for p in pages if p['filename'].startswith('book2.pdf')]
+    query = new_book[0]['text']
+    release = threading.Event()
+
+    def slow_pages():
+        yield from new_book[:100]
+        release.wait(10)
+        yield from new_book[100:]
+
+    writer = threading.Thread(target=store.add_documents, args=(slow_pages(),))
+    writer.start()
+    try:
+        time.sleep(0.2)   # the writer is now stuck halfway through the book
+        start = time.perf_counter()
+        books = {r['metadata']['filename'].split('_page_')[0]
+                 for r in store.search(query, top_k=10, mode='hybrid')}
+        assert time.perf_counter() - start < 1
+        assert 'book2.pdf' not in books   # nothing of the book until it is all in
+    finally:
+        release.set()
+        writer.join()
+    assert store.search(query, top_k=1)[0]['metadata']['filename'] == new_book[0]['filename']
+
+    # A compaction rebuilds the HNSW graph off to the side
+    refill = store._refilled_index
+    building = threading.Event()
+
+    def slow_refill(live_store):
+        building.set()
+        release.clear()
+        release.wait(10)
+        return refill(live_store)
+
+    store._refilled_index = slow_refill
+    store.remove_documents('book1.pdf', save=False)
+    compactor = threading.Thread(target=store.compact)
+    compactor.start()
+    try:
+        assert building.wait(10)
+        start = time.perf_counter()
+        assert store.search(query, top_k=1)[0]['metadata']['filename'] == new_book[0]['filename']
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+        compactor.join()
+    assert not store.tombstones
+    assert store.num_vectors == len(store.store)
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf', 'hnsw'])
+def test_concurrent_searches_while_writing(tmp_path, embedder, pages, index_type):
+    store = _store(tmp_path, embedder, index_type)
+    store.build_index(pages)
+    queries = [p['text'] for p in pages[::37]]
+    stop = threading.Event()
+    errors = []
+
+    def reader(mode, filename):
+        try:
+            while not stop.is_set():
+                for query in queries:
+                    store.search(query, top_k=5, mode=mode, filename=filename)
+                store.result_cache.clear()
+        except Exception as e:   # pragma: no cover - reported below
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader, args=args)
+               for args in (('dense', None), ('hybrid', None), ('dense', 'book0.pdf'),
+                            ('lexical', 'book1.pdf'))]
+    for thread in readers:
+        thread.start()
+    try:
+        for book in ('book2.pdf', 'book1.pdf'):
+            book_pages = [p for p in pages if p['filename'].startswith(book)]
+            store.remove_documents(book)
+            store.add_documents(book_pages)
+            store.remove_documents(book_pages[3]['filename'])
+            store.compact()
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+    assert not errors, errors
+    assert store.indexed_sources() == {'book0.pdf', 'book1.pdf', 'book2.pdf'}
+
+
+def test_failed_rebuild_keeps_chunk_ids(tmp_path, embedder, pages):
+    store = _store(tmp_path, embedder, 'flat')
+    store.build_index(pages[:100])
+
+    def failing_pages():
+        yield from pages[200:240]
+        raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError):
+        store.build_index(failing_pages())
+    assert len(store.store) == 100
+
+    store.add_documents(pages[400:450])
+    vector_ids = store.store.column('vector_ids')
+    assert len(vector_ids) == len(set(vector_ids.tolist())) == 150
+    assert (np.diff(vector_ids) > 0).all()
+    assert store.search(pages[420]['text'], top_k=1)[0]['metadata']['filename'] == \
+        pages[420]['filename']
+
+
+def test_saves_write_only_what_changed(tmp_path, embedder):
+    books = make_pages(books=7, pages_per_book=40)
+    store = VectorStore(str(tmp_path / "index"), index_type='flat', embedder=embedder)
+    store.build_index(books[:160])
+    # Hard links of the first save's files, to check later saves keep them
+    for part, name in (('chunk_store', 'text.bin'), ('lexical', 'docs.npy'), ('dedup', 'keys.npy')):
+        os.link(os.path.join(store._state.path, part, name), tmp_path / f"{part}_{name}")
+
+    store.add_documents(books[160:200])
+    store.remove_documents('book0.pdf_page_3')
+    store.add_documents(books[200:240])
+    store.add_documents(books[240:280])
+
+    path = store._state.path
+    for part, name in (('chunk_store', 'text.bin'), ('lexical', 'docs.npy'), ('dedup', 'keys.npy')):
+        assert os.path.samefile(os.path.join(path, part, name), tmp_path / f"{part}_{name}")
+        assert 1 <= len(os.listdir(os.path.join(path, part, 'segments'))) <= 2
+
+    reloaded = VectorStore(str(tmp_path / "index"), index_type='flat', embedder=embedder)
+    assert reloaded.load_index()
+    assert list(reloaded.store.texts) == list(store.store.texts)
+    assert list(reloaded.store.metadata) == list(store.store.metadata)
+    for page in (books[5], books[170], books[275]):
+        assert reloaded.search(page['text'], mode='lexical') == \
+            store.search(page['text'], mode='lexical')
+        keys = band_keys(page['text'])
+        assert reloaded.deduplicator.near_duplicates.find(keys) == \
+            store.deduplicator.near_duplicates.find(keys)
+    assert 'book0.pdf_page_3' not in {r['metadata']['filename']
+                                      for r in reloaded.search(books[2]['text'], mode='lexical')}
+
+
+@pytest.mark.parametrize('index_type', ['flat', 'ivf', 'hnsw'])
+def test_small_writes_leave_the_index_alone(tmp_path, embedder, pages, index_type):
+    _store(tmp_path, embedder, index_type).build_index(pages[:400])
+    store = _store(tmp_path, embedder, index_type)
+    store.load_index()   # memory-mapped
+    index = store.index
+    removed = pages[6]
+
+    store.add_documents(pages[400:420])
+    store.remove_documents(removed['filename'])
+    assert store.index is index   # new vectors went to the delta, removals are tombstones
+    assert store.delta
+
+    reloaded = _store(tmp_path, embedder, index_type)
+    reloaded.load_index()
+    for vs in (store, reloaded):
+        for page in (pages[5], pages[410]):
+            assert vs.search(page['text'], top_k=1)[0]['metadata']['filename'] == page['filename']
+        assert removed['filename'] not in {r['metadata']['filename']
+                                           for r in vs.search(removed['text'], top_k=10)}
+
+    # Once the delta outgrows DELTA_RATIO of the index, a copy takes it in
+    store.add_documents(pages[420:480])
+    assert store.index is not index and not store.delta
+    assert store.search(pages[470]['text'], top_k=1)[0]['metadata']['filename'] == \
+        pages[470]['filename']
+    assert removed['filename'] not in {r['metadata']['filename']
+                                       for r in store.search(removed['text'], top_k=10)}
+
+
+def test_compacted_chunk_ids_are_not_handed_out_again(tmp_path, embedder):
+    books = make_pages(books=3, pages_per_book=40)
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    store.build_index(books)
+    store.remove_documents('book2.pdf')
+    store.compact()
+    store.save_index()
+
+    reloaded = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    reloaded.load_index()
+    assert reloaded.next_id == 120
+    reloaded.add_documents(books[80:])
+    assert len(reloaded.store) == 120
+
+    # The re-added book's band keys survive a reload: an exact copy collapses
+    reloaded = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    reloaded.load_index()
+    copy = [dict(page, filename=page['filename'].replace('book2', 'copy2')) for page in books[80:]]
+    reloaded.add_documents(copy)
+    assert len(reloaded.store) == 120
+    result = reloaded.search(books[85]['text'], top_k=1)[0]
+    assert result['metadata']['filename'] == books[85]['filename']
+    assert [ref['filename'] for ref in result['also_in']] == ["copy2.pdf_page_6"]
+
+
+def test_rebuilding_an_unchanged_corpus_embeds_nothing(tmp_path, embedder, pages):
+    _store(tmp_path, embedder, 'flat').build_index(pages)
+
+    store = _store(tmp_path, embedder, 'flat')   # a fresh process: nothing in memory
+    calls = []
+    encode = embedder.encode
+    embedder.encode = lambda texts, **kw: calls.append(len(texts)) or encode(texts, **kw)
+    assert store.build_index(pages) == len(pages)
+    assert store.embedding_cache.misses == 0
+    assert store.embedding_cache.hits == len(pages)
+    assert not calls
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), "model", max_entries=3)
+    for i in range(3):
+        cache.put(f"text {i}", np.full(4, i, dtype='float32'))
+        cache.save()
+        time.sleep(0.01)
+    assert cache.get("text 0") is not None   # now the most recently used
+    cache.save()
+    cache.put("text 3", np.full(4, 3, dtype='float32'))
+    cache.close()
+
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), "model", max_entries=3)
+    assert len(cache) == 3
+    assert cache.get("text 1") is None
+    assert cache.get("text 0").tolist() == [0, 0, 0, 0]
+    assert cache.get("text 3").tolist() == [3, 3, 3, 3]
+    assert EmbeddingCache(str(tmp_path / "cache.sqlite3"), "other").get("text 0") is None
+
+
+def test_index_from_another_backend_is_refused(tmp_path, embedder, pages):
+    _store(tmp_path, embedder, 'flat').build_index(pages[:50])
+
+    store = VectorStore(str(tmp_path), embedder=embedder, backend='onnx-int8')
+    assert not store.load_index()
+    assert store.index is None
+    store = VectorStore(str(tmp_path), embedder=embedder, backend='onnx-int8',
+                        allow_backend_mismatch=True)
+    assert store.load_index()
+    assert len(store.store) == 50
+
+
+def _renamed(pages, old, new):
+    return [dict(page, filename=page['filename'].replace(old, new)) for page in pages]
+
+
+def test_near_copy_of_a_book_collapses_into_also_in(tmp_path, embedder, pages):
+    # One word changed per page: a near copy, not an exact one
+    copy = [dict(page, text=page['text'].rsplit(" ", 1)[0] + " changed.")
+            for page in _renamed(pages[200:400], 'book1', 'copy1')]
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    store.build_index(pages + copy)
+
+    assert len(store.store) == len(pages)
+    assert 'copy1.pdf' not in {source for source in map(source_name, store.store.filenames)}
+    result = store.search(pages[210]['text'], top_k=1)[0]
+    assert result['metadata']['filename'] == pages[210]['filename']
+    assert result['also_in'] == [{'filename': "copy1.pdf_page_11", 'page_number': 11}]
+
+
+def test_running_header_and_footer_are_stripped(tmp_path, embedder, pages):
+    book = [dict(page, text=f"Physics for Schools  Chapter {page['page_number'] // 10 + 1}\n"
+                            f"{page['text']}\n{page['page_number']} | Sunrise Publishers")
+            for page in pages[:40]]
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    store.build_index(book)
+
+    texts = list(store.store.texts)
+    assert len(texts) == 40
+    assert not any("Physics for Schools" in t or "Sunrise Publishers" in t for t in texts)
+    assert texts[0].strip() == pages[0]['text']
+    assert not store.search("Sunrise Publishers", mode='lexical')
+
+
+def test_band_keys_survive_save_and_load(tmp_path, embedder, pages):
+    VectorStore(str(tmp_path), index_type='flat', embedder=embedder).build_index(pages)
+
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    store.load_index()
+    assert store.add_documents(_renamed(pages[:200], 'book0', 'copy0')) == 0
+    store.add_documents(pages[400:] + _renamed(pages[400:], 'book2', 'moved2'))
+    assert len(store.store) == len(pages)
+
+    # The references and keys written by that add load back too
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder)
+    store.load_index()
+    assert store.add_documents(_renamed(pages[400:], 'book2', 'copy2')) == 0
+    assert len(store.store) == len(pages)
+    refs = [ref['filename'] for ref in store.search(pages[405]['text'], top_k=1)[0]['also_in']]
+    assert sorted(refs) == ["copy2.pdf_page_6", "moved2.pdf_page_6"]
+
+
+@pytest.fixture(scope='module')
+def flat_results(tmp_path_factory, pages):
+    """Exact top 10 chunk IDs for every 20th page"""
+    from conftest import HashingEmbedder
+    store = _store(tmp_path_factory.mktemp("flat"), HashingEmbedder(), 'flat')
+    store.build_index(pages)
+    return {i: {r['metadata']['vector_id'] for r in store.search(pages[i]['text'], top_k=10)}
+            for i in range(0, len(pages), 20)}
+
+
+@pytest.mark.parametrize('storage, bytes_per_dim', [('sq8', 1), ('fp16', 2)])
+@pytest.mark.parametrize('rerank', [True, False])
+def test_compressed_storage_recall_and_size(tmp_path, embedder, pages, flat_results,
+                                            storage, bytes_per_dim, rerank):
+    import faiss
+    store = VectorStore(str(tmp_path), index_type='flat', storage=storage, rerank=rerank,
+                        embedder=embedder, dedup=False)
+    store.build_index(pages)
+    recall = np.mean([len(expected & {r['metadata']['vector_id']
+                                      for r in store.search(pages[i]['text'], top_k=10)}) / 10
+                      for i, expected in flat_results.items()])
+    assert recall >= 0.95
+    flat_bytes = len(pages) * store.dimension * 4
+    assert faiss.serialize_index(store.index).nbytes < flat_bytes * (bytes_per_dim / 4 + 0.1)
+
+    assert store.store.has_vectors == rerank
+    if not rerank:
+        assert store.storage_report() is None   # nothing exact to measure against
+        return
+    report = store.storage_report()
+    assert report['recall'] >= 0.95 and report['recall_reranked'] >= 0.95
+    # The float32 copies kept for re-ranking outweigh what the codes save
+    assert report['kept_vector_bytes'] == flat_bytes
+    assert report['saved'] == pytest.approx(
+        1 - (report['index_bytes'] + flat_bytes) / flat_bytes)
+    assert report['saved'] < 0
+
+
+def _distinct_books(books, pages_per_book=250):
+    """Pages of books that share no words, so each is a cluster of its own"""
+    rng = np.random.default_rng(0)
+    return [{'filename': f"book{book}.pdf_page_{page + 1}", 'page_number': page + 1,
+             'text': " ".join(f"b{book}w{i}" for i in rng.integers(0, 400, 60)) + "."}
+            for book in range(books) for page in range(pages_per_book)]
+
+
+def _recall_by_book(store, exact, pages, nprobe):
+    """Mean share of the exact top 10 an IVF store finds, per book"""
+    recall = {}
+    for page in pages[::25]:
+        expected = {r['metadata']['filename'] for r in exact.search(page['text'], top_k=10)}
+        found = {r['metadata']['filename']
+                 for r in store.search(page['text'], top_k=10, nprobe=nprobe)}
+        recall.setdefault(page['filename'].split('_page_')[0], []).append(
+            len(expected & found) / 10)
+    return {book: np.mean(shares) for book, shares in recall.items()}
+
+
+def test_ivf_is_trained_on_every_book(tmp_path, embedder, monkeypatch):
+    import vector_store
+    # Far fewer training vectors than chunks: the sample has to span the books
+    monkeypatch.setattr(vector_store, 'TRAIN_SAMPLE', 600)
+    pages = _distinct_books(6)
+    exact = _store(tmp_path / "flat", embedder, 'flat')
+    exact.build_index(pages)
+    store = _store(tmp_path / "ivf", embedder, 'ivf')
+    store.build_index(pages)
+
+    assert not os.path.exists(store._staging_dir("vectors.build"))
+    recall = _recall_by_book(store, exact, pages, nprobe=4)
+    assert len(recall) == 6 and min(recall.values()) >= 0.9, recall
+
+
+def test_ivf_is_retrained_as_the_corpus_grows(tmp_path, embedder):
+    import faiss
+    # Trained on two books, then doubled twice: the last doubling retrains it
+    pages = _distinct_books(8)
+    exact = _store(tmp_path / "flat", embedder, 'flat')
+    exact.build_index(pages)
+    store = _store(tmp_path / "ivf", embedder, 'ivf')
+    store.build_index(pages[:500])
+    nlist = faiss.extract_index_ivf(store.index).nlist
+
+    for start in range(500, len(pages), 250):
+        store.add_documents(pages[start:start + 250])
+    retrained = faiss.extract_index_ivf(store.index).nlist
+    assert retrained >= 2 * nlist
+    assert store.index.ntotal == len(pages) and not store.delta
+
+    reloaded = _store(tmp_path / "ivf", embedder, 'ivf')
+    reloaded.load_index()
+    for vs in (store, reloaded):
+        recall = _recall_by_book(vs, exact, pages, nprobe=retrained // 4)
+        assert len(recall) == 8 and min(recall.values()) >= 0.9, recall
+
+
+class _RecordingPool:
+    """Stands in for EmbeddingPool: records the shards it is asked to encode"""
+    instances = []
+
+    def __init__(self, model_name, dimension, workers, shard_size, backend):
+        self.workers = workers
+        self.shard_size = shard_size
+        self.batches = []
+        _RecordingPool.instances.append(self)
+
+    def encode_batches(self, batches):
+        self.batches.extend(len(texts) for texts in batches)
+        return [_RecordingPool.embedder.encode(texts) for texts in batches]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_pool_batches_do_not_depend_on_worker_count(tmp_path, embedder, pages, monkeypatch):
+    import vector_store
+    monkeypatch.setattr(vector_store, 'EmbeddingPool', _RecordingPool)
+    monkeypatch.setattr(vector_store, 'MIN_POOL_CHUNKS', 300)
+    _RecordingPool.embedder = embedder
+
+    results = []
+    for workers in (0, 2, 8):
+        _RecordingPool.instances = []
+        store = VectorStore(str(tmp_path / str(workers)), index_type='flat', embedder=embedder,
+                            dedup=False, encode_workers=workers)
+        store.build_index(pages)
+        pools = _RecordingPool.instances
+        if workers:
+            assert [pool.shard_size for pool in pools] == [vector_store.POOL_SHARD_SIZE]
+            # Batches starting before MIN_POOL_CHUNKS are embedded without workers
+            first = -(-300 // vector_store.BUILD_BATCH_SIZE) * vector_store.BUILD_BATCH_SIZE
+            assert sum(pools[0].batches) == len(store.store) - first > 0
+            results.append(pools[0].batches)
+        assert store.search(pages[10]['text'], top_k=1)[0]['metadata']['filename'] == \
+            pages[10]['filename']
+    assert results[0] == results[1]
+
+
+def test_pool_rounds_give_every_worker_a_task(tmp_path, embedder, pages, monkeypatch):
+    import embedding_pool
+    import vector_store
+    from multiprocessing.pool import ThreadPool
+    monkeypatch.setattr(vector_store, 'MIN_POOL_CHUNKS', 0)
+    # Threads stand in for the worker processes, sharing the test's embedder
+    monkeypatch.setattr(embedding_pool, '_worker_model', embedder)
+
+    def thread_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        return self._pool
+
+    monkeypatch.setattr(embedding_pool.EmbeddingPool, '_get_pool', thread_pool)
+
+    workers = 6
+    rounds = []
+    encode_shard = embedding_pool._encode_shard
+    encode_batches = embedding_pool.EmbeddingPool.encode_batches
+
+    def recording_encode_batches(self, batches):
+        tasks = sum(-(-len(texts) // self.shard_size) for texts in batches)
+        # The round's first tasks each hold a worker until all of them have one
+        rounds.append({'tasks': tasks, 'threads': set(), 'started': 0,
+                       'barrier': threading.Barrier(min(tasks, workers)), 'lock': threading.Lock()})
+        return encode_batches(self, batches)
+
+    def waiting_encode_shard(task):
+        current = rounds[-1]
+        with current['lock']:
+            current['started'] += 1
+            first = current['started'] <= workers
+        current['threads'].add(threading.current_thread().name)
+        if first:
+            current['barrier'].wait(timeout=10)
+        return encode_shard(task)
+
+    monkeypatch.setattr(embedding_pool.EmbeddingPool, 'encode_batches', recording_encode_batches)
+    monkeypatch.setattr(embedding_pool, '_encode_shard', waiting_encode_shard)
+
+    store = VectorStore(str(tmp_path), index_type='flat', embedder=embedder, dedup=False,
+                        encode_workers=workers)
+    store.build_index(pages)
+
+    assert len(rounds) > 1
+    # Every round but the stream's last has a task for each worker, and each one gets one
+    assert all(r['tasks'] >= workers and len(r['threads']) == workers for r in rounds[:-1])
+    assert store.search(pages[10]['text'], top_k=1)[0]['metadata']['filename'] == \
+        pages[10]['filename']
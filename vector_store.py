@@ -1,8 +1,40 @@
 import os
+import re
+import json
+import math
+import copy
+import queue
 import pickle
-import faiss
+import shutil
+import itertools
+import threading
+import contextlib
+from collections import OrderedDict
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+try:
+    from .lazy_imports import lazy_import
+    from .embedding_cache import EmbeddingCache
+    from .embedding_pool import EmbeddingPool
+    from .dedup import Deduplicator
+    from .embedders import (EMBEDDING_MODEL, EMBEDDING_BACKEND, ALLOW_BACKEND_MISMATCH, BACKENDS,
+                            embedder_id, load_embedder)
+    from . import snapshots
+    from .chunk_store import ChunkStore, ChunkStoreWriter, NO_PAGE
+    from .lexical_index import LexicalIndex
+except ImportError:
+    from lazy_imports import lazy_import
+    from embedding_cache import EmbeddingCache
+    from embedding_pool import EmbeddingPool
+    from dedup import Deduplicator
+    from embedders import (EMBEDDING_MODEL, EMBEDDING_BACKEND, ALLOW_BACKEND_MISMATCH, BACKENDS,
+                           embedder_id, load_embedder)
+    import snapshots
+    from chunk_store import ChunkStore, ChunkStoreWriter, NO_PAGE
+    from lexical_index import LexicalIndex
+
+# Imported on first use
+faiss = lazy_import("faiss")
 
 # ============================================================
 #                  PATH CONFIGURATION
@@ -11,9 +43,338 @@ from sentence_transformers import SentenceTransformer
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_INDEX_DIR = os.path.join(SCRIPT_DIR, "index")
 
+INDEX_FILE = "faiss.index"
+TOMBSTONES_FILE = "tombstones.npy"
+CHUNK_STORE_DIR = "chunk_store"
+LEXICAL_DIR = "lexical"
+DEDUP_DIR = "dedup"
+DELTA_DIR = "delta"         # vectors added since the index was last merged (see _add_vectors)
+STAGING_DIR = "staging"     # chunk stores being built/compacted, before they join a snapshot
+
+# ============================================================
+#                  INDEX TYPES
+# ============================================================
+# 'auto' picks flat or ivf from the number of chunks (see choose_index_type)
+INDEX_TYPES = ('auto', 'flat', 'ivf', 'ivfpq', 'hnsw')
+
+DEFAULT_NPROBE = 16      # IVF lists scanned per query
+DEFAULT_EF_SEARCH = 64   # HNSW candidate list size per query
+
+# ============================================================
+#                  VECTOR STORAGE
+# ============================================================
+# How the index stores each 384-d vector:
+# float32 = 1536 bytes, fp16 = 768, sq8 = 384, pq = 48 (48 one-byte PQ codes)
+STORAGE_MODES = ('float32', 'fp16', 'sq8', 'pq')
+STORAGE_CODES = {'float32': None, 'fp16': 'SQfp16', 'sq8': 'SQ8', 'pq': 'PQ48'}
+MIN_PQ_TRAINING = 10_000  # PQ codebooks need ~39 points per centroid
+RERANK_FACTOR = 4         # compressed shortlist size = top_k * RERANK_FACTOR
+
+# ============================================================
+#                  SEARCH MODES
+# ============================================================
+# dense = embeddings only, lexical = BM25 only, hybrid = both fused with RRF
+SEARCH_MODES = ('dense', 'lexical', 'hybrid')
+RRF_K = 60               # reciprocal rank fusion damping constant
+
+# Filtered searches over at most this many chunks skip FAISS and score
+# the chunks directly; bigger subsets are filtered inside the FAISS scan
+EXACT_FILTER_MAX = 4096
+
+# ============================================================
+#                  CHUNKING
+# ============================================================
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# The word-window chunker used before chunks were sized in tokens;
+# only kept to report how much text it would have lost to truncation
+LEGACY_CHUNK_WORDS = 500
+LEGACY_OVERLAP_WORDS = 100
+
+# ============================================================
+#                  EMBEDDING POOL
+# ============================================================
+# Below this many chunks, starting worker processes costs more than it saves
+MIN_POOL_CHUNKS = 2_000
+POOL_SHARD_SIZE = 64     # chunks per embedding worker task; pools get workers * 64 chunks per round
+
+# ============================================================
+#                  BUILD PIPELINE
+# ============================================================
+BUILD_BATCH_SIZE = 256   # chunks embedded and added to FAISS per step
+PAGE_QUEUE_SIZE = 64     # extracted pages waiting to be chunked
+BATCH_QUEUE_SIZE = 4     # chunk batches waiting to be embedded
+AUTO_FLAT_MAX = 20_000   # 'auto' indexes corpora smaller than this exactly
+TRAIN_SAMPLE = 65_536    # vectors sampled from the whole corpus to train IVF/PQ/SQ indexes
+RETRAIN_FACTOR = 2       # IVF is trained again once the corpus is this many times what it was trained for
+REFILL_BATCH = 65_536    # vectors copied at a time when compaction refills an index
+COMPACT_RATIO = 0.2      # saves compact once this share of the stored chunks is tombstoned
+DELTA_RATIO = 0.1        # new vectors wait in flat delta blocks until they're this share of the index
+
+
+def choose_index_type(num_vectors):
+    """Pick the index type that suits a corpus of this size: bigger corpora
+    get IVF, and 'hnsw'/'ivfpq' have to be asked for."""
+    if num_vectors < AUTO_FLAT_MAX:
+        return 'flat'        # exact search is still fast
+    return 'ivf'
+
+
+def index_factory_string(index_type, num_vectors, storage='float32', train_size=None):
+    """FAISS factory string for an index type, corpus size, storage mode and
+    training set size (the corpus itself by default)"""
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode: {storage} (choose from {STORAGE_MODES})")
+    code = STORAGE_CODES[storage]
+    
+    # ~4*sqrt(n) lists, but keep >= 39 training points per list
+    train_size = num_vectors if train_size is None else train_size
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), train_size // 39))
+    
+    if index_type == 'flat':
+        return code or "Flat"
+    if index_type == 'ivf':
+        return f"IVF{nlist},{code or 'Flat'}"
+    if index_type == 'ivfpq':
+        return f"IVF{nlist},PQ48"
+    if index_type == 'hnsw':
+        return f"HNSW32,{code}" if code else "HNSW32"
+    raise ValueError(f"Unknown index type: {index_type} (choose from {INDEX_TYPES})")
+
+
+def _block_vectors(block):
+    """(vectors, chunk IDs) of a delta block (an IDMap2 over a flat index)"""
+    return block.index.reconstruct_n(0, block.ntotal), faiss.vector_to_array(block.id_map)
+
+
+def _block_name(block):
+    """File name of a delta block: the range of chunk IDs it holds. Blocks
+    never change, so a snapshot can hard-link the previous one's."""
+    return f"{block.id_map.at(0):012d}-{block.id_map.at(block.ntotal - 1):012d}.index"
+
+
+def _base_index(index):
+    """The index that does the searching, under any IDMap2 wrapper"""
+    return faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+
+
+def source_name(filename):
+    """Book a chunk came from, e.g. 'physics.pdf_page_12' -> 'physics.pdf'"""
+    return re.sub(r"_page_\d+$", "", filename)
+
+
+def background_iter(iterable, max_queued):
+    """
+    Run an iterator on a worker thread and yield its items through a bounded
+    queue, so producing the next items overlaps with consuming this one.
+    Errors are re-raised in the consumer; closing the generator stops the worker.
+    """
+    items = queue.Queue(max_queued)
+    stop = threading.Event()
+    done = object()
+    errors = []
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def run():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # Unwind a generator stopped early here, not on whichever thread collects it
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+            put(done)
+    
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+
+
+def normalize_query(query):
+    """Cache key for a query: the embedder is uncased, so case and spacing don't matter"""
+    return " ".join(query.lower().split())
+
+
+def fuse_rankings(dense_hits, lexical_hits, top_k):
+    """Reciprocal rank fusion of (key, distance) nearest first and (key, score)
+    best first: (key, fused score, dense distance or None), best first"""
+    scores = {}
+    distances = dict(dense_hits)
+    for hits in (dense_hits, lexical_hits):
+        for rank, (key, _) in enumerate(hits):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+    
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [(key, score, distances.get(key)) for key, score in best]
+
+
+class VectorSpill:
+    """
+    Vectors of a build parked on disk until the index is trained, plus a
+    uniform sample of all of them (reservoir sampling) to train it on: the
+    training set covers every book, not just the first ones extracted.
+    """
+
+    def __init__(self, path, dimension, sample_size=None, seed=0):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self.count = 0
+        self._sample = np.zeros((sample_size or TRAIN_SAMPLE, dimension), dtype='float32')
+        self._rng = np.random.default_rng(seed)
+        self._vectors = open(os.path.join(path, "vectors.f32"), 'wb')
+        self._ids = open(os.path.join(path, "ids.i64"), 'wb')
+
+    def add(self, vectors, ids):
+        """Park a batch of vectors under their chunk IDs"""
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        self._vectors.write(vectors.tobytes())
+        self._ids.write(np.asarray(ids, dtype='int64').tobytes())
+
+        # Vector number n replaces a random slot with probability size/(n+1)
+        seen = self.count + np.arange(len(vectors))
+        slots = np.where(seen < len(self._sample), seen, self._rng.integers(0, seen + 1))
+        kept = slots < len(self._sample)
+        self._sample[slots[kept]] = vectors[kept]
+        self.count += len(vectors)
+
+    @property
+    def sample(self):
+        """Training sample: every vector while there are few, else a uniform draw"""
+        return self._sample[:min(self.count, len(self._sample))]
+
+    def batches(self, size):
+        """(vectors, chunk IDs) in the order they were added, size at a time"""
+        self._vectors.flush()
+        self._ids.flush()
+        if not self.count:
+            return
+        vectors = np.memmap(self._vectors.name, dtype='float32', mode='r',
+                            shape=(self.count, self.dimension))
+        ids = np.memmap(self._ids.name, dtype='int64', mode='r', shape=(self.count,))
+        for start in range(0, self.count, size):
+            yield np.array(vectors[start:start + size]), np.array(ids[start:start + size])
+
+    def close(self):
+        """Delete the parked vectors"""
+        self._vectors.close()
+        self._ids.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class LRUCache:
+    """Small thread-safe LRU map that counts hits and misses"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class IndexState:
+    """
+    Everything a search reads, published as one object. Every change (load,
+    rebuild, add, remove, compact) is made on a state no search can see yet
+    and swapped in with a single reference assignment; searches already
+    running finish on the state they started with.
+    """
+
+    def __init__(self, index=None, store=None, lexical=None, deduplicator=None,
+                 index_type=None, storage=None, mmapped=False, path=None, version=0,
+                 trained_size=0):
+        self.index = index
+        self.store = store                  # chunk text + metadata
+        self.lexical = lexical              # BM25 over the same chunk IDs
+        self.deduplicator = deduplicator    # near-duplicate chunks kept as references
+        self.index_type = index_type        # type of the index actually built/loaded
+        self.storage = storage              # storage mode of the built/loaded index
+        self.trained_size = trained_size    # chunks the index was sized and trained for
+        self.mmapped = mmapped              # memory-mapped from path (read-only)
+        self.path = path                    # snapshot (or old flat index folder) it came from
+        self.tombstones = set()             # IDs removed but not yet compacted away
+        self.next_id = 0                    # ID the next new chunk gets
+        self.version = version              # changes whenever the index does
+        self.delta = ()                     # flat blocks of vectors added since the index
+                                            # was last merged (searched alongside it)
+        self.index_saved = False            # the index (delta aside) is the one saved at path
+
+
+def _state_attr(name):
+    """VectorStore attribute kept on its IndexState. Reads and writes go to the
+    state the calling thread is pinned to (see _pinned / _writing), else the
+    live state."""
+    return property(lambda self: getattr(self._read_state(), name),
+                    lambda self, value: setattr(self._read_state(), name, value))
+
 
 class VectorStore:
-    def __init__(self, index_dir=None):
+    index = _state_attr('index')
+    store = _state_attr('store')
+    lexical = _state_attr('lexical')
+    deduplicator = _state_attr('deduplicator')
+    tombstones = _state_attr('tombstones')
+    next_id = _state_attr('next_id')
+    active_index_type = _state_attr('index_type')
+    active_storage = _state_attr('storage')
+    trained_size = _state_attr('trained_size')
+    delta = _state_attr('delta')
+    _index_saved = _state_attr('index_saved')
+
+    def __init__(self, index_dir=None, index_type='auto', compress_chunks=False,
+                 embedder=None, embedder_loader=None, storage='float32', rerank=True,
+                 encode_workers=0, dedup=True, backend=None, allow_backend_mismatch=None):
         # Use script-relative path if none provided
         if index_dir is None:
             index_dir = DEFAULT_INDEX_DIR
@@ -21,123 +382,1594 @@ class VectorStore:
         self.index_dir = index_dir
         os.makedirs(index_dir, exist_ok=True)
         
-        # Use a good free embedding model
-        print("Loading embedding model...")
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        # Use a good free embedding model (or one shared by the caller).
+        # It is loaded the first time something needs embeddings or tokens.
+        # The backend picks the runtime it runs on (see embedders.py).
+        self.model_name = EMBEDDING_MODEL
+        self.backend = backend or EMBEDDING_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend} (choose from {BACKENDS})")
+        # Indexes embedded on another backend are refused at load unless this is set
+        self.allow_backend_mismatch = (ALLOW_BACKEND_MISMATCH if allow_backend_mismatch is None
+                                       else allow_backend_mismatch)
+        self._embedder = embedder
+        self._embedder_loader = embedder_loader
+        self._embedder_lock = threading.Lock()
         self.dimension = 384  # Dimension of all-MiniLM-L6-v2
         
-        self.index = None
-        self.chunks = []
-        self.metadata = []
+        # Chunk embeddings keyed by text hash, so unchanged chunks are never re-embedded
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(index_dir, "embedding_cache.sqlite3"),
+            embedder_id(self.model_name, self.backend)
+        )
+        
+        # Opt-in: with 2+ workers, big batches are embedded by a process pool
+        self.encode_workers = encode_workers
+        
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type} (choose from {INDEX_TYPES})")
+        self.index_type = index_type          # requested type
+        
+        # Compressed storage shrinks the index; with rerank the original
+        # float32 vectors are kept on disk (memory-mapped, next to the chunk
+        # text) and the compressed shortlist is re-ordered by exact distance
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode: {storage} (choose from {STORAGE_MODES})")
+        self.storage = storage                # requested storage mode
+        self.rerank = rerank
+        
+        # Chunk text + metadata live in a columnar store (memory-mapped once saved)
+        self.compress_chunks = compress_chunks
+        
+        # Repeated headers/footers are stripped and near-duplicate chunks are
+        # kept only as references ('also_in') to the chunk they duplicate
+        self.dedup = dedup
+        
+        # The index, chunk store, lexical index etc. live on one IndexState.
+        # Saves write a new snapshot folder (see snapshots.py) and loads swap
+        # in a whole new state, so readers never see a half-updated index.
+        self._versions = itertools.count(1)
+        self._state = self._new_state()
+        self._pins = threading.local()
+        self._loaded_snapshot = None
+        
+        # Every chunk gets a stable ID that is also its FAISS ID, so books
+        # can be added and removed without renumbering the rest. The next one
+        # (next_id) is kept on the state, so a failed write hands none out.
+        
+        # Repeated questions skip the embedder and FAISS. Cached results are
+        # keyed by index_version, which changes whenever the index does.
+        self.query_cache = LRUCache(max_size=1024)    # normalized query -> embedding
+        self.result_cache = LRUCache(max_size=1024)   # (version, query, params) -> results
+        self.filter_cache = LRUCache(max_size=64)     # (version, book, pages) -> chunk IDs
+        self.subset_cache = LRUCache(max_size=16)     # (version, chunk IDs) -> their vectors
+        
+        # One store may serve many sessions: searches take no lock. Writers
+        # are serialized by _write_lock and change a private copy of the state
+        # (see _writing), which _swap_lock guards only while it is swapped in.
+        # _draft_lock serializes the build pipeline's threads on that copy, and
+        # _direct_map_lock lets one search at a time give a shared IVF index
+        # its ID map.
+        self._write_lock = threading.RLock()
+        self._swap_lock = threading.Lock()
+        self._draft_lock = threading.Lock()
+        self._direct_map_lock = threading.Lock()
+
+    @property
+    def embedder(self):
+        """The embedding model, loaded on first use"""
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    if self._embedder_loader is not None:
+                        self._embedder = self._embedder_loader()
+                    else:
+                        print(f"Loading embedding model ({self.backend})...")
+                        self._embedder = load_embedder(self.model_name, self.backend)
+        return self._embedder
+
+    @property
+    def chunks(self):
+        """List-like view of all chunk texts"""
+        return self.store.texts
+
+    @property
+    def metadata(self):
+        """List-like view of all chunk metadata dicts"""
+        return self.store.metadata
+
+    @property
+    def index_version(self):
+        return self._read_state().version
+
+    def _new_state(self, **kwargs):
+        """IndexState with a fresh version (empty parts if not given)"""
+        kwargs.setdefault('store', ChunkStore(compress=self.compress_chunks))
+        kwargs.setdefault('lexical', LexicalIndex())
+        kwargs.setdefault('deduplicator', Deduplicator(source_name))
+        return IndexState(version=next(self._versions), **kwargs)
+
+    def _read_state(self):
+        """The state this thread is pinned to, else the live one"""
+        return getattr(self._pins, 'state', None) or self._state
+
+    @contextlib.contextmanager
+    def _pinned(self, state=None):
+        """Make every read in the block see the same state (the live one, unless
+        given), even if another thread swaps in a new one meanwhile"""
+        if getattr(self._pins, 'state', None) is not None:
+            yield
+            return
+        self._pins.state = state or self._state
+        try:
+            yield
+        finally:
+            self._pins.state = None
+
+    def _iter_pinned(self, iterable, state):
+        """Iterate (on whichever thread consumes this) pinned to state"""
+        with self._pinned(state):
+            yield from iterable
+
+    def _publish(self, state):
+        """Make state the live one: a single reference swap"""
+        with self._swap_lock:
+            self._state = state
+
+    def _fork_state(self):
+        """Copy of the live state that a writer can change without searches
+        seeing it. The FAISS index and delta blocks are shared: writers never
+        change them in place (see _add_vectors)"""
+        live = self._state
+        state = copy.copy(live)
+        state.store = live.store.copy()
+        state.lexical = live.lexical.copy()
+        state.deduplicator = live.deduplicator.copy()
+        return state
+
+    @contextlib.contextmanager
+    def _drafting(self, draft):
+        """Point the block's reads and writes at a state that isn't live (yet)"""
+        pinned = getattr(self._pins, 'state', None)
+        self._pins.state = draft
+        try:
+            yield draft
+        finally:
+            self._pins.state = pinned
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Make the block's changes on a private copy of the live state and swap
+        it in when the block is done (callers hold _write_lock). Searches carry
+        on meanwhile, on the state they pinned; if the block raises, nothing
+        changes."""
+        with self._drafting(self._fork_state()) as draft:
+            yield draft
+        self._publish(draft)
+
+    def _staging_dir(self, name):
+        return os.path.join(self.index_dir, STAGING_DIR, name)
+
+    def clear(self):
+        """Forget the in-memory index (files on disk are left alone)"""
+        with self._write_lock:
+            self._publish(self._new_state())
+            self._loaded_snapshot = None
+            # Reopened on next use, in case its folder was deleted
+            self.embedding_cache.close()
+
+    def _bump_version(self):
+        """Mark the state being written as changed so cached search results go stale"""
+        self._read_state().version = next(self._versions)
+
+    def cache_stats(self):
+        """Hit-rate statistics of the query embedding and search result caches"""
+        return {
+            'index_version': self.index_version,
+            'query_embeddings': self.query_cache.stats(),
+            'search_results': self.result_cache.stats(),
+            'filters': self.filter_cache.stats()
+        }
     
-    def chunk_text(self, text, chunk_size=500, overlap=100):
+    @property
+    def max_chunk_tokens(self):
+        """Word-pieces per chunk the embedder sees in full ([CLS]/[SEP] excluded)"""
+        return self.embedder.max_seq_length - 2
+
+    def _count_tokens(self, words, tokenizer=None):
+        """Word-piece count of each word, from the embedder's own tokenizer"""
+        tokenizer = tokenizer or self.embedder.tokenizer
+        encoded = tokenizer(words, add_special_tokens=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def chunk_text(self, text, max_tokens=None, overlap_tokens=32):
         """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+        return list(self.iter_chunks(text, max_tokens, overlap_tokens))
+
+    def iter_chunks(self, text, max_tokens=None, overlap_tokens=32, stats=None, tokenizer=None):
+        """
+        Yield chunks that fit within the embedder's max sequence length.
+        Chunks end on sentence boundaries (and preferably paragraph ends);
+        trailing sentences of up to overlap_tokens carry over to the next chunk.
+        Pass a stats dict to collect a truncation report.
+        """
+        max_tokens = max_tokens or self.max_chunk_tokens
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk:
-                chunks.append(chunk)
+        # (words, ends_paragraph) per sentence
+        sentences = []
+        for paragraph in PARAGRAPH_RE.split(text):
+            parts = [p.split() for p in SENTENCE_RE.split(paragraph.strip())]
+            parts = [p for p in parts if p]
+            sentences.extend((words, i == len(parts) - 1) for i, words in enumerate(parts))
         
-        return chunks
-    
-    def build_index(self, extracted_texts):
-        """Build FAISS index from extracted texts"""
-        print(f"\n🔨 Building vector index in: {self.index_dir}")
+        all_words = [w for words, _ in sentences for w in words]
+        if not all_words:
+            return
         
-        all_chunks = []
-        all_metadata = []
+        # One tokenizer call per page; sentence sizes are sums of word sizes
+        word_tokens = self._count_tokens(all_words, tokenizer)
+        if stats is not None:
+            self._record_chunk_stats(stats, word_tokens, max_tokens)
+        
+        # Split sentences that alone exceed the limit at word boundaries
+        units = []  # (words, tokens, ends_paragraph)
+        pos = 0
+        for words, ends_paragraph in sentences:
+            counts = word_tokens[pos:pos + len(words)]
+            pos += len(words)
+            
+            piece, piece_tokens = [], 0
+            for word, n in zip(words, counts):
+                if piece and piece_tokens + n > max_tokens:
+                    units.append((piece, piece_tokens, False))
+                    piece, piece_tokens = [], 0
+                piece.append(word)
+                piece_tokens += n
+            units.append((piece, piece_tokens, ends_paragraph))
         
-        for item in extracted_texts:
-            chunks = self.chunk_text(item['text'])
+        # Pack sentences into chunks
+        current, current_tokens = [], 0
+        for words, n, ends_paragraph in units:
+            if current and current_tokens + n > max_tokens:
+                yield self._join_chunk(current, stats)
+                
+                # Carry trailing sentences over as overlap
+                tail, tail_tokens = [], 0
+                for unit in reversed(current):
+                    if tail_tokens + unit[1] > overlap_tokens:
+                        break
+                    tail.insert(0, unit)
+                    tail_tokens += unit[1]
+                current, current_tokens = (tail, tail_tokens) \
+                    if tail_tokens + n <= max_tokens else ([], 0)
             
-            for chunk_idx, chunk in enumerate(chunks):
-                all_chunks.append(chunk)
-                all_metadata.append({
+            current.append((words, n))
+            current_tokens += n
+            
+            # Prefer to end chunks where paragraphs end
+            if ends_paragraph and current_tokens >= max_tokens // 2:
+                yield self._join_chunk(current, stats)
+                current, current_tokens = [], 0
+        
+        if current:
+            yield self._join_chunk(current, stats)
+
+    def _join_chunk(self, units, stats):
+        """Chunk text from (words, tokens) units"""
+        tokens = sum(n for _, n in units)
+        if stats is not None:
+            stats['chunks'] += 1
+            stats['dropped_tokens'] += max(0, tokens - self.max_chunk_tokens)
+        return ' '.join(w for words, _ in units for w in words)
+
+    def _record_chunk_stats(self, stats, word_tokens, max_tokens):
+        """Tally what the old 500-word windows would have lost to truncation"""
+        counts = np.concatenate([[0], np.cumsum(word_tokens)])
+        step = LEGACY_CHUNK_WORDS - LEGACY_OVERLAP_WORDS
+        for start in range(0, len(word_tokens), step):
+            end = min(start + LEGACY_CHUNK_WORDS, len(word_tokens))
+            dropped = int(counts[end] - counts[start]) - max_tokens
+            stats['legacy_chunks'] += 1
+            if dropped > 0:
+                stats['legacy_truncated_chunks'] += 1
+                stats['legacy_dropped_tokens'] += dropped
+        stats['tokens'] += int(counts[-1])
+
+    @staticmethod
+    def _new_chunk_stats():
+        return {'chunks': 0, 'tokens': 0, 'dropped_tokens': 0,
+                'legacy_chunks': 0, 'legacy_truncated_chunks': 0, 'legacy_dropped_tokens': 0}
+
+    def _print_chunk_report(self, stats):
+        """Build-time report of truncation avoided by token-aware chunking"""
+        total = max(stats['tokens'], 1)
+        print(f"✂️  Chunking report (limit {self.max_chunk_tokens} tokens/chunk):")
+        print(f"   Word windows: {stats['legacy_truncated_chunks']}/{stats['legacy_chunks']} chunks "
+              f"truncated, {stats['legacy_dropped_tokens']} tokens "
+              f"({100 * stats['legacy_dropped_tokens'] / total:.1f}%) never embedded")
+        print(f"   Token-aware:  {stats['chunks']} chunks, {stats['dropped_tokens']} tokens "
+              f"({100 * stats['dropped_tokens'] / total:.1f}%) never embedded")
+
+    def _new_index(self, embeddings, index_type=None, storage=None, num_vectors=None):
+        """Empty FAISS index that stores vectors under our chunk IDs, with the
+        index type and storage mode actually used, as (index, type, storage).
+        IVF/PQ/SQ indexes are trained on the given embeddings, a sample of the
+        num_vectors the index is sized for (by default, all of them)."""
+        index_type = index_type or self.index_type
+        storage = storage or self.storage
+        num_vectors = num_vectors or len(embeddings)
+        if index_type == 'auto':
+            index_type = choose_index_type(num_vectors)
+        if index_type == 'ivfpq' and len(embeddings) < MIN_PQ_TRAINING:
+            index_type = 'ivf'   # too few points to train the PQ codebooks
+        if storage == 'pq' and len(embeddings) < MIN_PQ_TRAINING:
+            storage = 'sq8'
+        if index_type == 'ivfpq':
+            storage = 'pq'
+        
+        factory = index_factory_string(index_type, num_vectors, storage,
+                                       train_size=len(embeddings))
+        if factory.startswith("IVF"):
+            # IVF stores and removes our IDs itself; an IDMap2 over it
+            # couldn't follow its internal IDs through remove_ids
+            index = faiss.index_factory(self.dimension, factory)
+        else:
+            index = faiss.index_factory(self.dimension, f"IDMap2,{factory}")
+        
+        if not index.is_trained:
+            print(f"🎯 Training {factory} index on {len(embeddings)} vectors...")
+            index.train(embeddings)
+        
+        self._set_default_search_params(index)
+        print(f"🧭 Using {index_type} index ({factory}, {storage} storage)")
+        return index, index_type, storage
+
+    def _set_default_search_params(self, index):
+        """Sensible per-query defaults for approximate indexes"""
+        inner = _base_index(index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = DEFAULT_NPROBE
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = DEFAULT_EF_SEARCH
+
+    def _search_params(self, nprobe=None, ef_search=None, selector=None):
+        """Per-query FAISS search parameters, or None for index defaults.
+        A selector restricts the scan to the chunk IDs it accepts."""
+        if self.active_index_type in ('ivf', 'ivfpq') and (nprobe or selector):
+            nprobe = nprobe or _base_index(self.index).nprobe
+            return faiss.SearchParametersIVF(nprobe=nprobe, sel=selector)
+        if self.active_index_type == 'hnsw' and (ef_search or selector):
+            ef_search = ef_search or _base_index(self.index).hnsw.efSearch
+            return faiss.SearchParametersHNSW(efSearch=ef_search, sel=selector)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    def _chunk_stream(self, pages, batch_size, stats, dedup=None, replace_sources=False,
+                      failed=None):
+        """
+        Pipeline front end: pages are pulled (extracted) on one thread and
+        chunked on another, with bounded queues in between, so extraction and
+        chunking overlap with the caller embedding the previous batch.
+        Yields (chunks, metadata) batches of about batch_size chunks.
+        Books whose extraction failed after some pages were chunked are added
+        to the failed set: once the stream is done, the caller removes them.
+        """
+        # The chunker gets its own tokenizer: fast tokenizers can't be shared
+        # with the encode() running at the same time on the caller's thread
+        tokenizer = copy.deepcopy(self.embedder.tokenizer)
+        pages = background_iter(pages, PAGE_QUEUE_SIZE)
+        batches = self._chunk_batches(pages, batch_size, stats, tokenizer, dedup, replace_sources,
+                                      failed)
+        # The chunker thread reads and writes the state the caller is writing
+        return background_iter(self._iter_pinned(batches, self._read_state()), BATCH_QUEUE_SIZE)
+
+    def _chunk_batches(self, pages, batch_size, stats, tokenizer=None, dedup=None,
+                       replace_sources=False, failed=None):
+        """Chunk pages, handing out a fresh ID per chunk, in batches.
+        With dedup, boilerplate is stripped first and near-duplicate chunks are
+        recorded as references instead of being yielded.
+        With replace_sources, a book's old chunks are removed when its first page arrives.
+        Books with pages that are then marked failed (see
+        pdf_processor._failed_record) are added to failed."""
+        chunks = []
+        metadata = []
+        started = set()   # books that have had a page
+        
+        if dedup is not None:
+            pages = dedup.strip_boilerplate(pages)
+        
+        for item in pages:
+            source = source_name(item['filename'])
+            if item.get('failed'):
+                if source in started and failed is not None:
+                    failed.add(source)
+                continue
+            if replace_sources and source not in started:
+                # Re-adding a book replaces its old chunks; the ones other
+                # books still reference come back under one of those references
+                for text, meta, refs in self._tombstone(source)[1]:
+                    meta['vector_id'] = self.next_id
+                    self.deduplicator.adopt(self.next_id, text, refs)
+                    self.next_id += 1
+                    chunks.append(text)
+                    metadata.append(meta)
+            started.add(source)
+            
+            chunk_iter = self.iter_chunks(item['text'], stats=stats, tokenizer=tokenizer)
+            for chunk_idx, chunk in enumerate(chunk_iter):
+                meta = {
                     'filename': item['filename'],
                     'page_number': item['page_number'],
                     'chunk_id': chunk_idx
-                })
+                }
+                if dedup is not None and dedup.collapse(chunk, meta, self.next_id):
+                    continue   # kept only as a reference to the chunk it duplicates
+                meta['vector_id'] = self.next_id
+                self.next_id += 1
+                chunks.append(chunk)
+                metadata.append(meta)
+            
+            if len(chunks) >= batch_size:
+                yield chunks, metadata
+                chunks, metadata = [], []
         
-        print(f"Created {len(all_chunks)} text chunks")
+        if chunks:
+            yield chunks, metadata
+
+    def _encode_pool(self):
+        """Embedding worker pool kept for a whole build (or a no-op context).
+        Its workers start on first use: pass it to _embed only once the build
+        has MIN_POOL_CHUNKS chunks (see _pool_for)."""
+        if self.encode_workers > 1:
+            return EmbeddingPool(self.model_name, self.dimension, self.encode_workers,
+                                 shard_size=POOL_SHARD_SIZE, backend=self.backend)
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _pool_for(pool, chunks_so_far):
+        """The build's pool once it has embedded enough chunks to be worth
+        starting worker processes for, else None (embed in this process)"""
+        return pool if chunks_so_far >= MIN_POOL_CHUNKS else None
+
+    def _embed_stream(self, batches, pool=None):
+        """Embed a build's (chunks, metadata) batches, yielding (chunks, metadata,
+        embeddings). Once the pool is in use, batches are gathered until there
+        are enough chunks to give each of its workers a shard, and embedded in
+        one round (batch and shard boundaries stay the same)."""
+        embedded = 0
+        group = []
+        for batch in batches:
+            group.append(batch)
+            active = self._pool_for(pool, embedded)
+            size = sum(len(chunks) for chunks, _ in group)
+            if active is not None and size < active.workers * active.shard_size:
+                continue
+            all_embeddings = self._embed_many([chunks for chunks, _ in group], pool=active,
+                                              save_cache=False)
+            for (chunks, metadata), embeddings in zip(group, all_embeddings):
+                yield chunks, metadata, embeddings
+            embedded += size
+            group = []
         
-        # Generate embeddings
-        print("Generating embeddings...")
-        embeddings = self.embedder.encode(all_chunks, show_progress_bar=True)
+        if group:
+            all_embeddings = self._embed_many([chunks for chunks, _ in group],
+                                              pool=self._pool_for(pool, embedded), save_cache=False)
+            for (chunks, metadata), embeddings in zip(group, all_embeddings):
+                yield chunks, metadata, embeddings
+
+    def _embed(self, chunks, pool=None, save_cache=True):
+        """Embed chunks as a float32 matrix, encoding only cache misses
+        (on the given worker pool, if any)"""
+        return self._embed_many([chunks], pool=pool, save_cache=save_cache)[0]
+
+    def _embed_many(self, chunk_lists, pool=None, save_cache=True):
+        """Embed several lists of chunks (see _embed), returning one matrix per list.
+        On a pool, the lists' cache misses are encoded in one round of tasks."""
+        all_embeddings = []
+        all_missing = []  # per list: chunk text -> rows that need it
         
-        # Create FAISS index
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.index.add(np.array(embeddings).astype('float32'))
+        for chunks in chunk_lists:
+            embeddings = np.zeros((len(chunks), self.dimension), dtype='float32')
+            missing = {}
+            for row, chunk in enumerate(chunks):
+                cached = self.embedding_cache.get(chunk)
+                if cached is None:
+                    missing.setdefault(chunk, []).append(row)
+                else:
+                    embeddings[row] = cached
+            all_embeddings.append(embeddings)
+            all_missing.append(missing)
         
-        self.chunks = all_chunks
-        self.metadata = all_metadata
+        if save_cache:
+            total = sum(len(chunks) for chunks in chunk_lists)
+            misses = sum(len(rows) for missing in all_missing for rows in missing.values())
+            print(f"🗄️  Embedding cache: {total - misses} hits, {misses} misses")
         
-        print(f"✅ Index built with {len(all_chunks)} chunks!")
+        if any(all_missing):
+            text_lists = [list(missing) for missing in all_missing]
+            if pool is not None:
+                fresh = pool.encode_batches(text_lists)
+            elif self.encode_workers > 1 and sum(map(len, text_lists)) >= MIN_POOL_CHUNKS:
+                with EmbeddingPool(self.model_name, self.dimension, self.encode_workers,
+                                   backend=self.backend) as pool:
+                    fresh = pool.encode_batches(text_lists)
+            else:
+                fresh = [self.embedder.encode(texts, show_progress_bar=True) if texts else []
+                         for texts in text_lists]
+            for embeddings, missing, texts, vectors in zip(all_embeddings, all_missing,
+                                                           text_lists, fresh):
+                for text, vector in zip(texts, np.array(vectors).astype('float32')):
+                    embeddings[missing[text]] = vector
+                    self.embedding_cache.put(text, vector)
+            if save_cache:
+                self.embedding_cache.save()
         
-        # Save index
-        self.save_index()
+        return all_embeddings
+
+    def _keeps_vectors(self, storage=None):
+        """Whether original vectors go into the chunk store for exact re-ranking
+        (for the given storage mode, else the live index's)"""
+        storage = storage or self.active_storage
+        return self.rerank and storage not in (None, 'float32')
+
+    def _rows_of(self, ids):
+        """Store rows for FAISS IDs (vector_ids are kept in ascending order)"""
+        return np.searchsorted(self.store.column('vector_ids'), ids)
+
+    def _reconstruct(self, ids):
+        """Vectors of chunk IDs as decoded from the FAISS index (or its delta)"""
+        ids = np.asarray(ids, dtype='int64')
+        vectors = np.zeros((len(ids), self.dimension), dtype='float32')
+        in_index = np.ones(len(ids), dtype=bool)
+        for block in self.delta:
+            # Each block holds a range of IDs, all newer than the index's
+            in_block = (ids >= block.id_map.at(0)) & (ids <= block.id_map.at(block.ntotal - 1))
+            if in_block.any():
+                vectors[in_block] = block.reconstruct_batch(ids[in_block])
+                in_index &= ~in_block
+        if not in_index.any():
+            return vectors
+        
+        if self.active_index_type in ('ivf', 'ivfpq'):
+            # IVF needs an ID -> list map first (a hashtable, so remove_ids still
+            # works); searches share the index, so only one of them builds it
+            with self._direct_map_lock:
+                ivf = faiss.extract_index_ivf(self.index)
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        vectors[in_index] = self.index.reconstruct_batch(ids[in_index])
+        return vectors
+
+    def _removes_ids(self):
+        """Whether the live index can drop tombstoned vectors when it is merged
+        (see _merged_index). HNSW can't delete, and IVF indexes saved inside an
+        IDMap2 (before IVF held our IDs itself) can't follow IVF's internal IDs
+        through remove_ids; theirs wait for compact() to refill the index."""
+        if self.active_index_type == 'hnsw':
+            return False
+        return self.active_index_type == 'flat' or not hasattr(self.index, 'id_map')
+
+    def _live_mask(self):
+        """Per-row mask of chunks that aren't tombstoned"""
+        vector_ids = self.store.column('vector_ids')
+        if not self.tombstones:
+            return np.ones(len(vector_ids), dtype=bool)
+        return ~np.isin(vector_ids, np.fromiter(self.tombstones, dtype='int64'))
+
+    def _index_copy(self):
+        """Writable copy of the index: a memory-mapped (read-only) one is read
+        back from disk, an in-memory one is cloned"""
+        state = self._read_state()
+        if state.mmapped:
+            return faiss.read_index(os.path.join(state.path, INDEX_FILE))
+        with self._direct_map_lock:
+            return faiss.clone_index(state.index)
+
+    def _add_vectors(self, embeddings, ids):
+        """Add vectors to the state being written without touching its index,
+        which searches may be using: they go into a new flat delta block (the
+        newest blocks are merged with it so there are O(log n) of them, see
+        snapshots.segments_to_merge). Once the delta outgrows DELTA_RATIO of
+        the index, a copy of the index takes it in: a full copy, but rarely.
+        An IVF index the corpus has outgrown is trained again instead."""
+        state = self._read_state()
+        blocks = list(state.delta)
+        merge = snapshots.segments_to_merge([b.ntotal for b in blocks], len(ids))
+        block = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+        for old in blocks[len(blocks) - merge:]:
+            block.add_with_ids(*_block_vectors(old))
+        block.add_with_ids(embeddings, ids)
+        state.delta = tuple(blocks[:len(blocks) - merge]) + (block,)
+        
+        if sum(b.ntotal for b in state.delta) > DELTA_RATIO * state.index.ntotal:
+            live = self._live_mask()
+            if self._needs_retraining(int(live.sum())):
+                state.index = self._retrained_index(np.flatnonzero(live))
+                state.trained_size = int(live.sum())
+            else:
+                state.index = self._merged_index()
+            state.delta = ()
+            state.mmapped = state.index_saved = False
+
+    def _merged_index(self):
+        """Copy of the index with the delta's vectors added and tombstoned
+        vectors dropped (if the index can drop them, see _removes_ids)"""
+        index = self._index_copy()
+        doomed = np.fromiter(self.tombstones, dtype='int64')
+        if len(doomed) and self._removes_ids():
+            index.remove_ids(doomed)
+        for block in self.delta:
+            vectors, ids = _block_vectors(block)
+            live = ~np.isin(ids, doomed)
+            index.add_with_ids(vectors[live], ids[live])
+        return index
+
+    def _needs_retraining(self, num_live):
+        """Whether an IVF index was trained on a much smaller corpus than the
+        num_live chunks it now holds (books added since have no lists of their
+        own), and its vectors can be recovered exactly to train a new one"""
+        if self.active_index_type not in ('ivf', 'ivfpq'):
+            return False
+        if self.active_storage != 'float32' and not self.store.has_vectors:
+            return False   # quantized twice over, vectors would drift
+        return num_live >= RETRAIN_FACTOR * (self.trained_size or self.index.ntotal)
+
+    def _retrained_index(self, rows):
+        """New IVF index, sized for and trained on the chunks in the given
+        store rows, holding all of them"""
+        store = self.store
+        live_ids = store.column('vector_ids')[rows].astype('int64')
+        
+        def vectors(picked):
+            if store.has_vectors:
+                return store.vectors(rows[picked])
+            return self._reconstruct(live_ids[picked])
+        
+        # A uniform sample across the whole corpus, like a build's
+        sample = np.random.default_rng(0).choice(len(rows), min(len(rows), TRAIN_SAMPLE),
+                                                 replace=False)
+        index, _, _ = self._new_index(vectors(np.sort(sample)), self.active_index_type,
+                                      self.active_storage, num_vectors=len(rows))
+        for start in range(0, len(rows), REFILL_BATCH):
+            picked = np.arange(start, min(start + REFILL_BATCH, len(rows)))
+            index.add_with_ids(vectors(picked), live_ids[picked])
+        return index
+
+    @property
+    def num_vectors(self):
+        """Vectors searched: the index's plus its delta's (tombstoned ones
+        count until a merge or compact() drops them)"""
+        with self._pinned():
+            if self.index is None:
+                return 0
+            return self.index.ntotal + sum(block.ntotal for block in self.delta)
     
-    def save_index(self):
-        """Save FAISS index and metadata"""
-        index_path = os.path.join(self.index_dir, "faiss.index")
-        chunks_path = os.path.join(self.index_dir, "chunks.pkl")
-        metadata_path = os.path.join(self.index_dir, "metadata.pkl")
+    def build_index(self, extracted_texts, batch_size=BUILD_BATCH_SIZE):
+        """Build FAISS index from extracted texts (a list or any page iterator).
+        Pages are extracted, chunked and embedded in a pipeline: chunk text and
+        vectors are streamed to disk batch by batch, and the index is trained on
+        a sample of all the vectors, so memory depends on batch_size and
+        TRAIN_SAMPLE rather than on the size of the library.
+        Searches keep using the previous index until the new one is swapped in.
+        Returns the number of chunks indexed."""
+        with self._write_lock:
+            print(f"\n🔨 Building vector index in: {self.index_dir}")
+            
+            # New chunk IDs are counted on a state of their own, which only
+            # goes live with the new index: a failed build leaves next_id alone
+            building = self._new_state()
+            build_dir = self._staging_dir(CHUNK_STORE_DIR + ".build")
+            shutil.rmtree(build_dir, ignore_errors=True)
+            writer = ChunkStoreWriter(build_dir, self.compress_chunks)
+            lexical = LexicalIndex()   # inverted index for exact term matches
+            dedup = Deduplicator(source_name) if self.dedup else None
+            stats = self._new_chunk_stats()
+            
+            # Vectors wait on disk until the whole corpus has been seen: IVF/PQ/SQ
+            # indexes are trained on a sample from all of it, and sized for it
+            spill = VectorSpill(self._staging_dir("vectors.build"), self.dimension)
+            keep_vectors = self._keeps_vectors('pq' if self.index_type == 'ivfpq' else self.storage)
+            total = 0
+            failed = set()
+            hits, misses = self.embedding_cache.hits, self.embedding_cache.misses
+            
+            try:
+                with self._drafting(building), self._encode_pool() as pool:
+                    batches = self._chunk_stream(extracted_texts, batch_size, stats, dedup,
+                                                 failed=failed)
+                    for chunks, metadata, embeddings in self._embed_stream(batches, pool):
+                        self._write_batch(writer, lexical, spill, chunks, metadata, embeddings,
+                                          keep_vectors)
+                        total += len(chunks)
+                        print(f"   Processed {total} chunks...")
+                self.embedding_cache.save()
+                print(f"🗄️  Embedding cache: {self.embedding_cache.hits - hits} hits, "
+                      f"{self.embedding_cache.misses - misses} misses")
+                
+                if not total:
+                    writer.close()
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                    print("⚠️  No text chunks to index")
+                    return 0
+                index, index_type, storage = self._new_index(spill.sample, num_vectors=total)
+                for vectors, ids in spill.batches(REFILL_BATCH):
+                    index.add_with_ids(vectors, ids)
+            except BaseException:
+                writer.close()
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise
+            finally:
+                spill.close()
+            
+            writer.close()
+            store = ChunkStore.open(build_dir)
+            lexical.finalize()
+            
+            self._print_chunk_report(stats)
+            if dedup is not None:
+                dedup.print_report()
+            print(f"Created {total} text chunks")
+            
+            # One reference swap: searches in flight finish on the old index
+            state = self._new_state(index=index, store=store, lexical=lexical,
+                                    deduplicator=dedup or Deduplicator(source_name),
+                                    index_type=index_type, storage=storage, trained_size=total)
+            state.next_id = building.next_id
+            if failed:
+                with self._drafting(state):
+                    self._drop_failed(failed)
+            self._publish(state)
+            print(f"✅ Index built with {total} chunks!")
+            
+            # Save index
+            self.save_index()
+            return total
+
+    def _write_batch(self, writer, lexical, spill, chunks, metadata, embeddings, keep_vectors):
+        """Write one batch of a build to the chunk store writer and lexical
+        index, and park its vectors until the index is trained"""
+        ids = np.array([m['vector_id'] for m in metadata], dtype='int64')
+        for chunk, meta, vector in zip(chunks, metadata, embeddings):
+            writer.add(chunk, meta, vector if keep_vectors else None)
+        lexical.add(ids.tolist(), chunks)
+        spill.add(embeddings, ids)
+
+    def indexed_sources(self):
+        """Names of the books currently in the index"""
+        with self._pinned():
+            filename_ids = np.unique(self.store.column('filename_ids')[self._live_mask()])
+            sources = {source_name(self.store.filenames[int(i)]) for i in filename_ids}
+            # Books whose chunks all duplicate another book's exist only as references
+            sources |= {source_name(meta['filename'])
+                        for metas in list(self.deduplicator.refs.values()) for meta in metas}
+            return sources
+
+    def add_documents(self, extracted_texts, save=True, batch_size=BUILD_BATCH_SIZE):
+        """Embed and add only the given pages (a list or any page iterator) to the
+        existing index, batch by batch. Books that are already indexed are
+        replaced by the new pages. Returns the number of chunks added."""
+        with self._write_lock:
+            if self.index is None and not self.load_index():
+                return self.build_index(extracted_texts, batch_size)
+            
+            added = 0
+            stats = self._new_chunk_stats()
+            hits, misses = self.embedding_cache.hits, self.embedding_cache.misses
+            
+            # Searches keep seeing the index without these books until they're all in
+            with self._writing(), self._encode_pool() as pool:
+                dedup = self.deduplicator if self.dedup else None
+                self.deduplicator.reset_stats()
+                failed = set()
+                batches = self._chunk_stream(extracted_texts, batch_size, stats, dedup,
+                                             replace_sources=True, failed=failed)
+                for new_chunks, new_metadata, embeddings in self._embed_stream(batches, pool):
+                    self._add_batch(new_chunks, new_metadata, embeddings)
+                    added += len(new_chunks)
+                    print(f"➕ Added {added} chunks...")
+                self._drop_failed(failed)
+                if self.deduplicator.collapsed:
+                    self._bump_version()   # new 'also_in' references
+            self.embedding_cache.save()
+            print(f"🗄️  Embedding cache: {self.embedding_cache.hits - hits} hits, "
+                  f"{self.embedding_cache.misses - misses} misses")
+            
+            if not added:
+                if self.deduplicator.collapsed:
+                    self.deduplicator.print_report()
+                    if save:
+                        self.save_index()
+                print("⚠️  No new text chunks to add")
+                return 0
+            
+            self._print_chunk_report(stats)
+            if dedup is not None:
+                dedup.print_report()
+            print(f"✅ Added {added} chunks ({self.num_vectors} in index)")
+            
+            if save:
+                self.save_index()
+            return added
+
+    def _add_batch(self, chunks, metadata, embeddings):
+        """Add embedded chunks to the index, chunk store and lexical index of
+        the state being written (see _writing)"""
+        ids = np.array([m['vector_id'] for m in metadata], dtype='int64')
+        with self._draft_lock:
+            keep_vectors = self._keeps_vectors()
+            for chunk, meta, vector in zip(chunks, metadata, embeddings):
+                self.store.append(chunk, meta, vector if keep_vectors else None)
+            self.lexical.add(ids.tolist(), chunks)
+            # After the store, which a retrained index is refilled from
+            self._add_vectors(embeddings, ids)
+            self.lexical.finalize()
+            self._bump_version()
+
+    def _filename_ids(self, filename):
+        """Store filename IDs of a book (or of a single page file)"""
+        return [i for i, name in enumerate(self.store.filenames)
+                if filename in (name, source_name(name))]
+
+    def _filter_ids(self, filename=None, pages=None):
+        """Ascending IDs of the live chunks from a book and/or page range
+        (inclusive; either end may be None), or None when there's no filter"""
+        if filename is None and pages is None:
+            return None
+        
+        pages = tuple(pages) if pages is not None else None
+        key = (self.index_version, filename, pages)
+        cached = self.filter_cache.get(key)
+        if cached is not None:
+            return cached
         
-        faiss.write_index(self.index, index_path)
+        mask = self._live_mask()
+        if filename is not None:
+            mask &= np.isin(self.store.column('filename_ids'), self._filename_ids(filename))
+        if pages is not None:
+            first, last = pages
+            page_numbers = self.store.column('page_numbers')
+            mask &= page_numbers != NO_PAGE
+            if first is not None:
+                mask &= page_numbers >= first
+            if last is not None:
+                mask &= page_numbers <= last
         
-        with open(chunks_path, 'wb') as f:
-            pickle.dump(self.chunks, f)
+        ids = self.store.column('vector_ids')[mask].astype('int64')
         
-        with open(metadata_path, 'wb') as f:
-            pickle.dump(self.metadata, f)
+        # Chunks collapsed as duplicates count for every location they came from
+        if self.deduplicator.refs:
+            def in_filter(meta):
+                if filename is not None and filename not in (meta['filename'],
+                                                             source_name(meta['filename'])):
+                    return False
+                if pages is None:
+                    return True
+                page = meta['page_number']
+                if isinstance(page, str) and page.isdigit():
+                    page = int(page)
+                if not isinstance(page, int):
+                    return False
+                return ((pages[0] is None or page >= pages[0]) and
+                        (pages[1] is None or page <= pages[1]))
+            
+            referenced = set(self.deduplicator.ids_referenced_by(in_filter)) - self.tombstones
+            if referenced:
+                ids = np.union1d(ids, np.fromiter(referenced, dtype='int64'))
         
-        print(f"💾 Index saved to {self.index_dir}/")
+        self.filter_cache.put(key, ids)
+        return ids
+
+    def remove_documents(self, filename, save=True):
+        """Tombstone every chunk of a book (or of a single page file).
+        Searches skip tombstoned chunks; their vectors stay until the delta is
+        next merged into the index (flat and IVF) or compact() (HNSW), and
+        their chunk store rows until enough are tombstoned to compact()."""
+        with self._write_lock:
+            with self._writing():
+                removed = self._remove(filename)
+            
+            if removed and save:
+                self.save_index()
+            return removed
+
+    def _remove(self, filename):
+        """Tombstone a book in the state being written (see _tombstone) and
+        index again, under one of their references, its removed chunks that
+        other books still reference. Returns how many were removed."""
+        removed, revived = self._tombstone(filename)
+        if revived:
+            chunks, metadata = [], []
+            for text, meta, refs in revived:
+                meta['vector_id'] = self.next_id
+                self.deduplicator.adopt(self.next_id, text, refs)
+                self.next_id += 1
+                chunks.append(text)
+                metadata.append(meta)
+            self._add_batch(chunks, metadata, self._embed(chunks))
+        return removed
+
+    def _drop_failed(self, failed):
+        """Remove the chunks of books whose extraction failed partway from the
+        state being written, so the next build extracts them again"""
+        for source in sorted(failed):
+            print(f"⚠️  Dropping {source}: its extraction failed partway")
+            self._remove(source)
+
+    def _tombstone(self, filename):
+        """Tombstone every chunk and duplicate reference of a book in the state
+        being written (see _writing). Returns how many were removed, and (text,
+        meta, other references) of removed chunks that other books still
+        reference, which the caller must index again under meta."""
+        def located_in_book(meta):
+            return filename in (meta['filename'], source_name(meta['filename']))
+        
+        with self._draft_lock:
+            hit = np.isin(self.store.column('filename_ids'), self._filename_ids(filename))
+            doomed = set(self.store.column('vector_ids')[hit].tolist()) - self.tombstones
+            dropped_refs = self.deduplicator.drop_refs(located_in_book)
+            orphans = self.deduplicator.remove(doomed)
+            
+            revived = [(self.store.text(int(self._rows_of(canonical))), dict(refs[0]), refs[1:])
+                       for canonical, refs in orphans.items()]
+            if doomed:
+                self.tombstones = self.tombstones | doomed
+                self.lexical.remove(doomed)
+                self.lexical.finalize()
+            if doomed or dropped_refs:
+                self._bump_version()
+        
+        if doomed or dropped_refs:
+            print(f"🗑️  Removed {len(doomed)} chunks and {dropped_refs} duplicate "
+                  f"references of {filename}")
+        return len(doomed) + dropped_refs, revived
+
+    def _needs_compaction(self):
+        """Whether enough of the store is tombstoned to be worth rewriting"""
+        return len(self.tombstones) > COMPACT_RATIO * max(len(self.store), 1)
+
+    def compact(self):
+        """Physically drop tombstoned chunks from the chunk store, lexical index
+        and FAISS index (which takes in the delta). Costs a pass over the whole
+        corpus, so saves only compact past COMPACT_RATIO."""
+        with self._write_lock:
+            if not self.tombstones:
+                return 0
+            
+            removed = len(self.tombstones)
+            keep = self._live_mask()
+            
+            # Everything is rebuilt on a private copy of the state and swapped
+            # in at the end: searches carry on, unblocked, on the old one
+            with self._writing() as draft:
+                store = self.store.save(self._staging_dir(CHUNK_STORE_DIR), keep=keep)
+                if self._removes_ids():
+                    draft.index = self._merged_index()
+                else:
+                    # HNSW can't drop vectors: the graph is built again without them
+                    draft.index = self._refilled_index(store)
+                draft.delta = ()
+                draft.mmapped = draft.index_saved = False
+                
+                self.store = store
+                self.lexical.compact()
+                self.tombstones = set()
+                self._bump_version()
+            
+            print(f"🧹 Compacted index: dropped {removed} chunks")
+            return removed
+    
+    def _refilled_index(self, store):
+        """Empty copy of the (already trained) index holding only the chunks in store.
+        IVF copies drop any IDMap2 wrapper and hold the chunk IDs themselves."""
+        live_ids = store.column('vector_ids').astype('int64')
+        index = self._index_copy()
+        if hasattr(index, 'id_map') and self.active_index_type in ('ivf', 'ivfpq'):
+            index = faiss.clone_index(faiss.extract_index_ivf(index))
+        if isinstance(index, faiss.IndexIVF):
+            # A cloned ID -> list map would still point at the old lists
+            index.set_direct_map_type(faiss.DirectMap.NoMap)
+        index.reset()
+        for start in range(0, len(live_ids), REFILL_BATCH):
+            ids = live_ids[start:start + REFILL_BATCH]
+            if store.has_vectors:
+                vectors = store.vectors(np.arange(start, start + len(ids)))
+            else:
+                vectors = self._reconstruct(ids)
+            index.add_with_ids(vectors, ids)
+        self._set_default_search_params(index)
+        return index
+
+    def save_index(self):
+        """Save FAISS index and chunk store as a new snapshot and make it current.
+        Parts that didn't change are hard-linked from the previous snapshot."""
+        with self._write_lock:
+            if self._needs_compaction():
+                self.compact()
+            
+            name, tmp_path = snapshots.begin(self.index_dir)
+            previous = self._state.path
+            try:
+                store_path = os.path.join(tmp_path, CHUNK_STORE_DIR)
+                if self.store.dirty or self.store.path is None:
+                    self.store.save(store_path)
+                else:
+                    snapshots.link_tree(self.store.path, store_path)
+                
+                index_path = os.path.join(tmp_path, INDEX_FILE)
+                if self._index_saved:
+                    snapshots.link_file(os.path.join(previous, INDEX_FILE), index_path)
+                else:
+                    faiss.write_index(self.index, index_path)
+                self._save_delta(tmp_path, previous)
+                
+                self.lexical.save(os.path.join(tmp_path, LEXICAL_DIR))
+                self.deduplicator.save(os.path.join(tmp_path, DEDUP_DIR))
+                if self.tombstones:
+                    np.save(os.path.join(tmp_path, TOMBSTONES_FILE),
+                            np.array(sorted(self.tombstones), dtype='int64'))
+                
+                with open(os.path.join(tmp_path, "index_meta.json"), 'w') as f:
+                    json.dump({
+                        'index_type': self.active_index_type,
+                        'storage': self.active_storage,
+                        'trained_size': self.trained_size,
+                        'next_id': self.next_id,
+                        'model_name': self.model_name,
+                        'backend': self.backend,
+                        'dimension': self.dimension
+                    }, f, indent=2)
+                
+                path = snapshots.publish(self.index_dir, name, tmp_path, previous)
+            except BaseException:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            
+            # Same rows, now read from the snapshot, so staging can go;
+            # the next save only writes what changes after this one
+            state = copy.copy(self._state)
+            state.store = ChunkStore.open(os.path.join(path, CHUNK_STORE_DIR))
+            state.index_saved = True
+            state.lexical.mark_saved(os.path.join(path, LEXICAL_DIR))
+            state.deduplicator.mark_saved(os.path.join(path, DEDUP_DIR))
+            state.path = path
+            self._publish(state)
+            self._loaded_snapshot = name
+            
+            shutil.rmtree(os.path.join(self.index_dir, STAGING_DIR), ignore_errors=True)
+            if previous == self.index_dir:
+                self._remove_flat_layout()
+            snapshots.prune(self.index_dir)
+            
+            print(f"💾 Index saved to {self.index_dir}/ (snapshot {name})")
+
+    def _save_delta(self, path, previous):
+        """Write the delta blocks into a snapshot folder (hard-linking those
+        the previous snapshot already has)"""
+        if not self.delta:
+            return
+        delta_dir = os.path.join(path, DELTA_DIR)
+        os.makedirs(delta_dir)
+        for block in self.delta:
+            name = _block_name(block)
+            old_path = os.path.join(previous, DELTA_DIR, name) if previous else None
+            if old_path and os.path.exists(old_path):
+                snapshots.link_file(old_path, os.path.join(delta_dir, name))
+            else:
+                faiss.write_index(block, os.path.join(delta_dir, name))
+
+    def _remove_flat_layout(self):
+        """Delete the files of an index saved before snapshots existed"""
+        for name in (INDEX_FILE, "index_meta.json"):
+            path = os.path.join(self.index_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        for name in (CHUNK_STORE_DIR, LEXICAL_DIR, DEDUP_DIR):
+            shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def reload_if_changed(self):
+        """Hot-reload the index if another process (or store) saved a newer snapshot"""
+        name = snapshots.current_name(self.index_dir)
+        if name is None or name == self._loaded_snapshot:
+            return False
+        print("🔄 Index changed on disk, reloading...")
+        return self.load_index()
     
-    def load_index(self):
-        """Load existing FAISS index"""
-        index_path = os.path.join(self.index_dir, "faiss.index")
+    def load_index(self, mmap=True, verify=False):
+        """Load the current snapshot.
+        With mmap=True the index and chunk store are memory-mapped, so loading
+        is near-instant and several processes share the same pages.
+        The snapshot's files are checked against its manifest (sizes; with
+        verify=True also SHA-256 checksums) before anything is swapped in."""
+        with self._write_lock:
+            name = snapshots.current_name(self.index_dir)
+            base = snapshots.snapshot_path(self.index_dir, name) if name else self.index_dir
+            index_path = os.path.join(base, INDEX_FILE)
+            
+            if not os.path.exists(index_path):
+                print(f"⚠️  Index not found in: {self.index_dir}")
+                return False
+            
+            if name is not None:
+                problems = snapshots.verify(base, checksums=verify)
+                if problems:
+                    print(f"❌ Snapshot {name} is damaged: {'; '.join(problems)}")
+                    return False
+            elif not ChunkStore.exists(os.path.join(base, CHUNK_STORE_DIR)):
+                return self._load_legacy_index()
+            
+            index_meta = self._read_index_meta(base)
+            if not self._embeddings_match(index_meta):
+                return False
+            if mmap:
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                if index_meta['index_type'] not in ('ivf', 'ivfpq'):
+                    # IVF lists are mapped by their own reader, which can't take MMAP_IFC
+                    flags |= getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+                index = faiss.read_index(index_path, flags)
+            else:
+                index = faiss.read_index(index_path)
+            
+            store = ChunkStore.open(os.path.join(base, CHUNK_STORE_DIR))
+            state = self._new_state(index=index, store=store,
+                                    lexical=self._load_lexical(base, store),
+                                    deduplicator=self._load_dedup(base, store),
+                                    index_type=index_meta['index_type'],
+                                    storage=index_meta['storage'], mmapped=mmap, path=base,
+                                    trained_size=index_meta['trained_size'])
+            state.index_saved = True
+            delta_dir = os.path.join(base, DELTA_DIR)
+            if os.path.isdir(delta_dir):
+                state.delta = tuple(faiss.read_index(os.path.join(delta_dir, name))
+                                    for name in sorted(os.listdir(delta_dir)))
+            tombstones_path = os.path.join(base, TOMBSTONES_FILE)
+            if os.path.exists(tombstones_path):
+                state.tombstones = set(np.load(tombstones_path).tolist())
+            vector_ids = store.column('vector_ids')
+            # IDs of compacted-away chunks stay spent: the saved dedup index
+            # still drops them, so handing them out again would lose band keys
+            last_id = int(vector_ids[-1]) if len(vector_ids) else -1
+            state.next_id = max(index_meta['next_id'], last_id + 1)
+            
+            # One reference swap: searches in flight finish on the old index
+            self._publish(state)
+            self._loaded_snapshot = name
+            
+            print(f"✅ Loaded {state.index_type} index from {self.index_dir} "
+                  f"({name or 'unversioned'}) with {len(store)} chunks")
+            return True
+
+    def _load_lexical(self, base, store):
+        """Load the BM25 index, rebuilding it from chunk text if it's missing"""
+        lexical_dir = os.path.join(base, LEXICAL_DIR)
+        if LexicalIndex.exists(lexical_dir):
+            return LexicalIndex.load(lexical_dir)
+        
+        print("🔤 Building lexical index from stored chunks...")
+        lexical = LexicalIndex()
+        lexical.add(store.column('vector_ids').tolist(), store.texts)
+        lexical.finalize()
+        lexical.save(lexical_dir)
+        return lexical
+
+    def _load_dedup(self, base, store):
+        """Load the near-duplicate index; indexes saved without one get it
+        rebuilt from chunk text (when dedup is on)"""
+        dedup_dir = os.path.join(base, DEDUP_DIR)
+        if Deduplicator.exists(dedup_dir):
+            return Deduplicator.load(dedup_dir, source_name)
+        
+        deduplicator = Deduplicator(source_name)
+        if self.dedup and len(store):
+            print("🧬 Building near-duplicate index from stored chunks...")
+            for chunk_id, text in zip(store.column('vector_ids').tolist(), store.texts):
+                deduplicator.register(chunk_id, text)
+            deduplicator.save(dedup_dir)
+        return deduplicator
+
+    def _read_index_meta(self, base):
+        """Index type, storage mode, training size, next chunk ID and embedder
+        recorded at save time (flat float32 torch MiniLM for old indexes; 0 if
+        the training size or next ID is unknown)"""
+        index_meta = {'index_type': 'flat', 'storage': 'float32', 'trained_size': 0,
+                      'next_id': 0, 'model_name': EMBEDDING_MODEL, 'backend': 'torch',
+                      'dimension': 384}
+        meta_path = os.path.join(base, "index_meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                saved = json.load(f)
+            index_meta.update({k: saved[k] for k in index_meta if saved.get(k)})
+        return index_meta
+
+    def _embeddings_match(self, index_meta):
+        """Whether queries embedded here can search an index saved with index_meta.
+        Another model can't. Another backend of the same model only agrees
+        with the reference on sample sentences, which doesn't show retrieval
+        holds up, so it can only if allow_backend_mismatch is set."""
+        if (index_meta['model_name'], index_meta['dimension']) != (self.model_name, self.dimension):
+            print(f"❌ Index was built with {index_meta['model_name']} "
+                  f"({index_meta['dimension']}-d) embeddings, not {self.model_name} "
+                  f"({self.dimension}-d): rebuild it")
+            return False
+        if index_meta['backend'] != self.backend:
+            if not self.allow_backend_mismatch:
+                print(f"❌ Index was embedded with the {index_meta['backend']} backend, not "
+                      f"{self.backend}: rebuild it, or set ALLOW_BACKEND_MISMATCH=1 to search it")
+                return False
+            print(f"ℹ️  Index was embedded with the {index_meta['backend']} backend, "
+                  f"queries use {self.backend}")
+        return True
+
+    def _load_legacy_index(self):
+        """Load an index saved as chunks.pkl / metadata.pkl and migrate it
+        to the chunk store format"""
         chunks_path = os.path.join(self.index_dir, "chunks.pkl")
         metadata_path = os.path.join(self.index_dir, "metadata.pkl")
         
-        if not all(os.path.exists(p) for p in [index_path, chunks_path, metadata_path]):
+        if not all(os.path.exists(p) for p in [chunks_path, metadata_path]):
             print(f"⚠️  Index not found in: {self.index_dir}")
             return False
         
-        self.index = faiss.read_index(index_path)
+        print("📦 Migrating pickled chunks to the chunk store format...")
+        index = faiss.read_index(os.path.join(self.index_dir, INDEX_FILE))
         
         with open(chunks_path, 'rb') as f:
-            self.chunks = pickle.load(f)
+            chunks = pickle.load(f)
         
         with open(metadata_path, 'rb') as f:
-            self.metadata = pickle.load(f)
+            metadata = pickle.load(f)
+        
+        # Indexes saved before chunk IDs existed used row positions as IDs
+        index_meta = self._read_index_meta(self.index_dir)
+        index_type, storage = index_meta['index_type'], index_meta['storage']
+        if not hasattr(index, 'id_map'):
+            vectors = index.reconstruct_n(0, index.ntotal)
+            index, index_type, storage = self._new_index(vectors, 'flat', 'float32')
+            index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+            for row, meta in enumerate(metadata):
+                meta['vector_id'] = row
         
-        print(f"✅ Loaded index from {self.index_dir} with {len(self.chunks)} chunks")
+        store = ChunkStore(compress=self.compress_chunks)
+        for chunk, meta in zip(chunks, metadata):
+            store.append(chunk, meta)
+        lexical = LexicalIndex()
+        lexical.add([m['vector_id'] for m in metadata], chunks)
+        lexical.finalize()
+        
+        state = self._new_state(index=index, store=store, lexical=lexical,
+                                deduplicator=self._load_dedup(self.index_dir, store),
+                                index_type=index_type, storage=storage, path=self.index_dir)
+        state.next_id = max((m['vector_id'] for m in metadata), default=-1) + 1
+        self._publish(state)
+        self.save_index()
+        
+        print(f"✅ Loaded {self.active_index_type} index from {self.index_dir} "
+              f"with {len(self.store)} chunks")
         return True
     
-    def search(self, query, top_k=5):
-        """Search for relevant chunks"""
+    def search(self, query, top_k=5, nprobe=None, ef_search=None, mode='dense',
+               filename=None, pages=None):
+        """Search for relevant chunks.
+        mode: 'dense' (embeddings), 'lexical' (BM25) or 'hybrid' (both, fused with RRF).
+        nprobe (IVF) / ef_search (HNSW) trade speed for recall on this query only.
+        filename / pages=(first, last) only search one book and/or page range."""
         if self.index is None:
             raise ValueError("Index not loaded! Build or load an index first.")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (choose from {SEARCH_MODES})")
+        
+        pages = tuple(pages) if pages is not None else None
+        key = (self.index_version, normalize_query(query), top_k, nprobe, ef_search, mode,
+               filename, pages)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return [dict(r) for r in cached]
         
-        # Embed query
-        query_embedding = self.embedder.encode([query])
+        # Embed query (outside the lock; the embedder is thread-safe)
+        query_embedding = self._encode_queries([query]) if mode != 'lexical' else None
+        
+        with self._pinned():
+            allowed_ids = self._filter_ids(filename, pages)
+            if mode == 'lexical':
+                results = [self._result(idx, score=score)
+                           for idx, score in self._lexical_hits(query, top_k, allowed_ids)]
+            elif mode == 'dense':
+                results = self._search_embeddings(query_embedding, top_k, nprobe, ef_search,
+                                                  allowed_ids)[0]
+            else:
+                # Fuse deeper candidate lists from both retrievers
+                candidates = max(top_k * 4, 20)
+                dense = self._dense_hits(query_embedding, candidates, nprobe, ef_search,
+                                         allowed_ids=allowed_ids)[0]
+                lexical = self._lexical_hits(query, candidates, allowed_ids)
+                results = [self._result(idx, distance=dist, score=score)
+                           for idx, score, dist in fuse_rankings(dense, lexical, top_k)]
+        
+        self.result_cache.put(key, results)
+        return [dict(r) for r in results]
+
+    def lexical_stats(self, query):
+        """BM25 statistics of the query's terms here (see LexicalIndex.term_stats)"""
+        with self._pinned():
+            return self.lexical.term_stats(query)
+    
+    def ranked_lists(self, query, top_k=20, nprobe=None, ef_search=None, mode='hybrid',
+                     filename=None, pages=None, corpus=None):
+        """What search would fuse, unfused: (dense results nearest first, lexical
+        results best first), top_k of each; the list mode doesn't use is empty.
+        corpus: lexical_stats summed over several stores, so BM25 scores can be
+        compared across them (see ShardedVectorStore.search)."""
+        if self.index is None:
+            raise ValueError("Index not loaded! Build or load an index first.")
+        query_embedding = self._encode_queries([query]) if mode != 'lexical' else None
+        
+        with self._pinned():
+            allowed_ids = self._filter_ids(filename, pages)
+            dense = lexical = []
+            if mode != 'lexical':
+                dense = self._search_embeddings(query_embedding, top_k, nprobe, ef_search,
+                                                allowed_ids)[0]
+            if mode != 'dense':
+                lexical = [self._result(idx, score=score) for idx, score
+                           in self._lexical_hits(query, top_k, allowed_ids, corpus)]
+            return dense, lexical
+    
+    def search_many(self, queries, top_k=5, nprobe=None, ef_search=None, batch_size=64,
+                    filename=None, pages=None):
+        """Search many queries at once: one batched encode and one FAISS call.
+        Returns one result list per query, in the same order."""
+        if self.index is None:
+            raise ValueError("Index not loaded! Build or load an index first.")
+        if not queries:
+            return []
+        
+        query_embeddings = self._encode_queries(list(queries), batch_size=batch_size)
+        
+        with self._pinned():
+            allowed_ids = self._filter_ids(filename, pages)
+            return self._search_embeddings(query_embeddings, top_k, nprobe, ef_search,
+                                           allowed_ids)
+
+    def _encode_queries(self, queries, batch_size=64):
+        """Embed queries, reusing cached embeddings of queries seen before"""
+        embeddings = np.zeros((len(queries), self.dimension), dtype='float32')
+        missing = {}  # normalized query -> rows that need it
+        
+        for row, query in enumerate(queries):
+            key = normalize_query(query)
+            cached = self.query_cache.get(key)
+            if cached is None:
+                missing.setdefault(key, []).append(row)
+            else:
+                embeddings[row] = cached
+        
+        if missing:
+            texts = list(missing)
+            fresh = self.embedder.encode(texts, batch_size=batch_size)
+            for text, vector in zip(texts, np.array(fresh).astype('float32')):
+                embeddings[missing[text]] = vector
+                self.query_cache.put(text, vector)
+        
+        return embeddings
+
+    def _search_embeddings(self, query_embeddings, top_k, nprobe=None, ef_search=None,
+                           allowed_ids=None):
+        """Run one FAISS search over a matrix of query embeddings"""
+        return [
+            [self._result(idx, distance=dist) for idx, dist in hits]
+            for hits in self._dense_hits(query_embeddings, top_k, nprobe, ef_search,
+                                         allowed_ids=allowed_ids)
+        ]
+
+    def _dense_hits(self, query_embeddings, top_k, nprobe=None, ef_search=None, rerank=None,
+                    allowed_ids=None):
+        """FAISS top_k per query as lists of (chunk ID, distance).
+        For compressed indexes a longer shortlist is re-ranked by exact
+        distance to the original vectors (if they were kept).
+        allowed_ids restricts the search to those chunks (see _filter_ids)."""
+        query_embeddings = np.array(query_embeddings).astype('float32')
+        
+        # Small subsets are cheaper to score directly than to scan for
+        if allowed_ids is not None and len(allowed_ids) <= EXACT_FILTER_MAX:
+            return self._exact_hits(query_embeddings, top_k, allowed_ids)
+        
+        rerank = self.rerank if rerank is None else rerank
+        rerank = rerank and self.active_storage != 'float32' and self.store.has_vectors
+        shortlist = top_k * RERANK_FACTOR if rerank else top_k
+        
+        if allowed_ids is None:
+            # Tombstoned chunks still in the index are skipped while it scans
+            selector = self._tombstone_selector()
+            fetch_k = min(shortlist, self.num_vectors)
+        else:
+            # FAISS skips every chunk the selector rejects while it scans
+            selector = faiss.IDSelectorBatch(allowed_ids)
+            fetch_k = min(shortlist, len(allowed_ids))
+        if fetch_k == 0:
+            return [[] for _ in range(len(query_embeddings))]
         
         # Search FAISS
-        distances, indices = self.index.search(
-            np.array(query_embedding).astype('float32'), 
-            top_k
-        )
+        distances, indices = self._index_search(query_embeddings, fetch_k,
+                                                self._search_params(nprobe, ef_search, selector),
+                                                selector)
         
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            results.append({
-                'chunk': self.chunks[idx],
-                'metadata': self.metadata[idx],
-                'distance': float(dist)
-            })
+        all_hits = []
+        for query, dist_row, idx_row in zip(query_embeddings, distances, indices):
+            hits = [(int(idx), float(dist)) for dist, idx in zip(dist_row, idx_row)
+                    if idx != -1 and idx not in self.tombstones]
+            if rerank and hits:
+                hits = self._rerank(query, hits)
+            all_hits.append(hits[:top_k])
         
-        return results
+        # IVF lists / HNSW neighbours may hold too few allowed chunks:
+        # top such queries up by scoring the subset directly
+        if allowed_ids is not None:
+            wanted = min(top_k, len(allowed_ids))
+            short = [row for row, hits in enumerate(all_hits) if len(hits) < wanted]
+            if short:
+                exact = self._exact_hits(query_embeddings[short], top_k, allowed_ids)
+                for row, hits in zip(short, exact):
+                    all_hits[row] = hits
+        
+        return all_hits
+
+    def _index_search(self, query_embeddings, k, params, selector):
+        """Search the index and its delta blocks: (distances, IDs) of the k
+        nearest per query, merged (-1 IDs where there are fewer)"""
+        block_params = faiss.SearchParameters(sel=selector) if selector is not None else None
+        parts = [(self.index, params)] + [(block, block_params) for block in self.delta]
+        results = [index.search(query_embeddings, min(k, index.ntotal), params=index_params)
+                   for index, index_params in parts if index.ntotal]
+        if len(results) == 1:
+            return results[0]
+        if not results:
+            return (np.zeros((len(query_embeddings), 0), dtype='float32'),
+                    np.zeros((len(query_embeddings), 0), dtype='int64'))
+        distances = np.hstack([d for d, _ in results])
+        indices = np.hstack([i for _, i in results])
+        distances[indices == -1] = np.inf
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, 1), np.take_along_axis(indices, order, 1)
+
+    def _tombstone_selector(self):
+        """FAISS selector that skips tombstoned chunks, or None if there are none"""
+        if not self.tombstones:
+            return None
+        key = (self.index_version, 'tombstones')
+        selector = self.filter_cache.get(key)
+        if selector is None:
+            doomed = np.fromiter(self.tombstones, dtype='int64')
+            selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(doomed))
+            self.filter_cache.put(key, selector)
+        return selector
+
+    def _exact_hits(self, query_embeddings, top_k, allowed_ids):
+        """Exact top_k among the given chunks as lists of (chunk ID, squared L2)"""
+        if not len(allowed_ids) or top_k <= 0:
+            return [[] for _ in range(len(query_embeddings))]
+        
+        # The same book / page range tends to be queried again and again
+        key = (self.index_version, allowed_ids.tobytes())
+        vectors = self.subset_cache.get(key)
+        if vectors is None:
+            if self.store.has_vectors:
+                vectors = self.store.vectors(self._rows_of(allowed_ids))
+            else:
+                vectors = self._reconstruct(allowed_ids)
+            self.subset_cache.put(key, vectors)
+        
+        # |q - v|^2 = |q|^2 - 2 q.v + |v|^2
+        distances = ((query_embeddings ** 2).sum(axis=1)[:, None]
+                     - 2 * query_embeddings @ vectors.T
+                     + (vectors ** 2).sum(axis=1)[None, :])
+        top_k = min(top_k, len(allowed_ids))
+        
+        all_hits = []
+        for row in distances:
+            top = np.argpartition(row, top_k - 1)[:top_k]
+            top = top[np.argsort(row[top], kind='stable')]
+            all_hits.append([(int(allowed_ids[i]), float(max(row[i], 0.0))) for i in top])
+        return all_hits
+
+    def _rerank(self, query_embedding, hits):
+        """Re-order (chunk ID, distance) hits by exact squared L2 distance"""
+        ids = np.array([idx for idx, _ in hits], dtype='int64')
+        vectors = self.store.vectors(self._rows_of(ids))
+        distances = ((vectors - query_embedding) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind='stable')
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    def storage_report(self, num_queries=200, top_k=10, queries=None):
+        """
+        Memory saved and recall lost by the compressed storage mode, measured
+        against an exact flat index over the original vectors. The saving
+        counts the float32 copies kept in the chunk store for re-ranking.
+        Queries are the given texts, or stored chunk vectors sampled at random.
+        """
+        with self._pinned():
+            if self.index is None:
+                raise ValueError("Index not loaded! Build or load an index first.")
+            
+            rows = np.nonzero(self._live_mask())[0]
+            ids = self.store.column('vector_ids')[rows].astype('int64')
+            if not len(ids):
+                print("⚠️  Index is empty")
+                return None
+            if self.store.has_vectors:
+                vectors = self.store.vectors(rows)
+            elif self.active_storage == 'float32':
+                vectors = self._reconstruct(ids)
+            else:
+                print("⚠️  Original vectors weren't kept (rerank=False); "
+                      "rebuild with rerank=True to measure recall")
+                return None
+            
+            if queries:
+                query_embeddings = self._encode_queries(list(queries))
+            else:
+                rng = np.random.default_rng(0)
+                sample = rng.choice(len(ids), size=min(num_queries, len(ids)), replace=False)
+                query_embeddings = vectors[sample]
+            top_k = min(top_k, len(ids))
+            
+            exact = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+            exact.add_with_ids(vectors, ids)
+            _, truth = exact.search(query_embeddings, top_k)
+            
+            def recall(rerank):
+                hits = self._dense_hits(query_embeddings, top_k, rerank=rerank)
+                found = [len(set(t.tolist()) & {idx for idx, _ in h}) for t, h in zip(truth, hits)]
+                return sum(found) / (top_k * len(found))
+            
+            reranked = self.active_storage != 'float32' and self.store.has_vectors
+            report = {
+                'index_type': self.active_index_type,
+                'storage': self.active_storage,
+                'vectors': len(ids),
+                'index_bytes': int(faiss.serialize_index(self.index).nbytes),
+                'kept_vector_bytes': len(self.store) * self.dimension * 4 if self.store.has_vectors else 0,
+                'flat_bytes': int(self.index.ntotal) * self.dimension * 4,
+                'recall': recall(False),
+                'recall_reranked': recall(True) if reranked else None,
+                'top_k': top_k,
+                'queries': len(query_embeddings)
+            }
+        
+        total = report['index_bytes'] + report['kept_vector_bytes']
+        report['saved'] = 1 - total / max(report['flat_bytes'], 1)
+        print(f"📦 Storage report ({report['index_type']} index, {report['storage']} storage, "
+              f"{report['vectors']} vectors):")
+        print(f"   Index size: {report['index_bytes'] / 2**20:.1f} MB")
+        if report['kept_vector_bytes']:
+            print(f"   Float32 vectors kept for re-ranking: "
+                  f"{report['kept_vector_bytes'] / 2**20:.1f} MB")
+        print(f"   Total: {total / 2**20:.1f} MB vs {report['flat_bytes'] / 2**20:.1f} MB "
+              f"float32 flat ({100 * report['saved']:.0f}% saved)")
+        print(f"   Recall@{top_k} vs exact flat search: {report['recall']:.3f}")
+        if report['recall_reranked'] is not None:
+            print(f"   Recall@{top_k} with exact re-ranking: {report['recall_reranked']:.3f}")
+        return report
+
+    def _lexical_hits(self, query, top_k, allowed_ids=None, corpus=None):
+        """BM25 top_k as a list of (chunk ID, score)"""
+        ids, scores = self.lexical.search(query, top_k, allowed=allowed_ids, corpus=corpus)
+        return [(int(idx), float(score)) for idx, score in zip(ids, scores)]
+
+    def _result(self, vector_id, distance=None, score=None):
+        """Search result for one chunk; its text is only read from the store here"""
+        row = int(self._rows_of(vector_id))
+        result = {
+            'chunk': self.store.text(row),
+            'metadata': self.store.meta(row),
+            'distance': distance
+        }
+        if score is not None:
+            result['score'] = score
+        also_in = self.deduplicator.also_in(vector_id)
+        if also_in:
+            result['also_in'] = [{'filename': meta['filename'], 'page_number': meta['page_number']}
+                                 for meta in also_in]
+        return result
 
 if __name__ == "__main__":
     # Test vector store